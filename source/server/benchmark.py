@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Tracking benchmark on simulated drives
+
+Runs the reference passes of the [benchmark] configuration against the mount stack and stores the
+results as JSON. With --baseline the results are compared against an earlier run and the exit code
+is 1 when the tracking performance regressed.
+
+    python3 benchmark.py --config /opt/config/config.toml --baseline /opt/data/benchmark_baseline.json
+"""
+
+import argparse
+import logging
+import sys
+import time
+import toml
+
+from core.tracking_benchmark import TrackingBenchmark, compareResults
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Tracking benchmark on simulated drives")
+    parser.add_argument("--config", default="/opt/config/config.toml", help="server configuration file")
+    parser.add_argument("--output", default=None, help="results file, defaults to output_file of the configuration")
+    parser.add_argument("--baseline", default=None, help="results of an earlier run to compare against")
+    parser.add_argument("--scenario", action="append", default=None, help="run only this scenario, can be repeated")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s M:%(module)s T:%(threadName)-10s  Msg:%(message)s (L%(lineno)d)')
+    logging.Formatter.converter = time.gmtime
+
+    config = toml.load(args.config)
+    output = args.output if args.output != None else config["benchmark"]["output_file"]
+
+    benchmark = TrackingBenchmark(config)
+    benchmark.start()
+    try:
+        results = benchmark.run(args.scenario)
+    finally:
+        benchmark.stop()
+
+    regressions = []
+    if args.baseline != None:
+        regressions = compareResults(results, TrackingBenchmark.load(args.baseline), config["benchmark"]["regression_tolerance"])
+        results["baseline"] = args.baseline
+        results["regressions"] = regressions
+
+    TrackingBenchmark.save(results, output)
+    logging.info("Benchmark results written to {}".format(output))
+
+    for regression in regressions:
+        logging.error("Regression: {}".format(regression))
+
+    sys.exit(1 if regressions != [] else 0)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import collections
 import datetime
 import enum
 import logging
@@ -7,13 +8,16 @@ import math
 import sys
 import threading
 import time
-from core.timer import CustomTimer
+from concurrent.futures import Future
+from core.timer import CustomTimer, DeadlineLoop
 
 import PyTrinamic
 from PyTrinamic.connections.ConnectionManager import ConnectionManager
 from PyTrinamic.modules.TMCM1240.TMCM_1240 import TMCM_1240, _APs
 
-from core.PID import PID
+from core.latency import LoopProfiler
+from core.driveio import DriveIO, IOPriority
+from core.telemetry import TelemetryBuffer
 
 
 class AxisException(Exception):
@@ -28,14 +32,53 @@ class AxisState(enum.Enum):
     TRACK = 4
     OOL = 5
     PARK = 6
+    SLEW = 7
 
 class AxisType(enum.Enum):
     AZIMUTH = 0
     ELEVATION = 1
 
 
+# state of one control loop tick, published as a whole at the end of the tick
+AxisSnapshot = collections.namedtuple("AxisSnapshot", [
+                                            "state",
+                                            "looptime",
+                                            "looprate",
+                                            "pos_mount_microsteps",
+                                            "pos_mount_degrees",
+                                            "pos_celestial_degrees",
+                                            "pos_encoder_microsteps",
+                                            "pos_encoder_degrees",
+                                            "vel_internal_microsteps",
+                                            "vel_internal_degrees",
+                                            "trajectory_setpoint_degrees",
+                                            "trajectory_error_degrees",
+                                            "offaxis_setpoint_degrees",
+                                            "offaxis_error_degrees",
+                                            "out_of_limits",
+                                            "P_trajectory",
+                                            "I_trajectory",
+                                            "D_trajectory",
+                                            "saturated_trajectory",
+                                            "trajectory_on_target",
+                                            "trajectory_rate_degrees",
+                                            "FF_trajectory",
+                                            "velocity_command_degrees",
+                                            "slew_setpoint_degrees",
+                                            "trajectory_error_rms",
+                                            "trajectory_error_max",
+                                            "P_offaxis",
+                                            "I_offaxis",
+                                            "D_offaxis",
+                                            "offaxis_on_target"
+                                        ])
+
+
 class Axis(threading.Thread):
 
+    # drive ramp parameters scaled by a staged slew, with the power of the stretch they are divided by
+    RAMP_PARAMETERS = {"4" : 1, "5" : 2, "15" : 2, "16" : 1, "17" : 2, "18" : 2}
+
     def __init__(self, parent, drive, type, debug, config):
         super(Axis, self).__init__()
         logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)-8s M:%(module)s T:%(threadName)-10s  Msg:%(message)s (L%(lineno)d)')
@@ -77,7 +120,24 @@ class Axis(threading.Thread):
         self.offaxis_setpoint_degrees = 0.0
         self.offaxis_error_degrees = 0.0
 
-        self.previous_set_velocity = 0
+        # trajectory rate and acceleration from the ephemeris, used as velocity feedforward
+        self.trajectory_rate_degrees = 0.0
+        self.trajectory_acceleration_degrees = 0.0
+        self.feedforward_velocity_degrees = 0.0
+        self.velocity_command_degrees = 0.0
+
+        # tracking error statistics of the current track
+        self.trajectory_error_sum_squares = 0.0
+        self.trajectory_error_samples = 0
+        self.trajectory_error_rms = 0.0
+        self.trajectory_error_max = 0.0
+
+        # result of the pipelined status read of the current tick
+        self.drive_read_valid = False
+        self.position_reached_flag = 0
+
+        # per-stage latency histograms of the control loop
+        self.profiler = LoopProfiler(["drive_read", "pointing_model", "setpoint", "lock", "pid", "state_machine", "drive_command", "publish", "telemetry"])
 
         self.microsteps = 64.0 # usteps per pulse
         self.ppr = 200.0 # pulses per stepper revolution (full steps of the stepper motor)
@@ -85,23 +145,53 @@ class Axis(threading.Thread):
         self.degreesPerUstep = (360.0/(self.microsteps * self.ppr * self.axisRatio)) # degrees/ ustep
         self.degreesPerStep = (360.0/(self.ppr * self.axisRatio)) # degrees per step
 
-        # drive mutex
-        self.mutex = threading.Lock()
+        # the drive is only accessed by its I/O thread, the lock only guards the state transitions
+        self.io = DriveIO(self.name)
+        self.state_lock = threading.Lock()
+        self.state_changed = threading.Condition(self.state_lock) # notified when the state register or the next state changes
+
+        # state transitions of completed drive commands, applied by the control loop at its next state register
+        self.transitions = collections.deque()
+        self.commands = set() # responses of drive commands that are not completed yet
+        self.ool_abort = None
+        self.halting = False # an abort is queued, the loop does not move the drive anymore
 
-        self.prevLoopTime = datetime.datetime.utcnow()
-        self.currentLoopTime = datetime.datetime.utcnow()
+        # the control loop runs on absolute deadlines, the controllers get the timestamp of every tick
+        self.loop = DeadlineLoop(self.config["controller_parameters"]["looprate"], policy=self.config["controller_parameters"]["overrun_policy"])
 
         self.configureDrive(self.config)
 
-        # position loop PID controller (inner)
-        self.pid_position = PID(Kp=self.config["controller_parameters"]["kp_controller"], Ki=self.config["controller_parameters"]["ki_controller"], Kd=self.config["controller_parameters"]["kd_controller"])
-        self.pid_position.setSampleTime(self.config["controller_parameters"]["looprate"])
-        self.pid_position.setWindup(self.microstepsToDegrees(self.config["axis_parameters"]["4"]))
+        # the position (inner) and off-axis optical feedback (outer) loops of both axes share the controller bank of the mount
+        parameters = self.config["controller_parameters"]
+        self.controller = self.parent.controller
+        self.channel_position = self.type.value
+        self.channel_offaxis = len(AxisType) + self.type.value
+
+        # the position loop commands a velocity, limited like the drive ramp so the integrator sees the saturation
+        self.controller.configure(self.channel_position, kp=parameters["kp_controller"], ki=parameters["ki_controller"], kd=parameters["kd_controller"],
+                                  step=parameters["looprate"], derivative_filter=parameters["derivative_filter_controller"], antiwindup=parameters["antiwindup_controller"],
+                                  output_limit=self.microstepsToDegrees(self.config["axis_parameters"]["4"]), rate_limit=self.microstepsToDegrees(self.config["axis_parameters"]["5"]))
+
+        self.controller.configure(self.channel_offaxis, kp=parameters["kp_offaxis_controller"], ki=parameters["ki_offaxis_controller"], kd=parameters["kd_offaxis_controller"],
+                                  step=parameters["looprate_offaxis_controller"], derivative_filter=parameters["derivative_filter_offaxis_controller"], antiwindup=parameters["antiwindup_offaxis_controller"],
+                                  output_limit=parameters["windup_offaxis_controller"])
 
-        # off-axis optical feedback PID controller (outer)
-        self.pid_offaxis = PID(Kp=self.config["controller_parameters"]["kp_offaxis_controller"], Ki=self.config["controller_parameters"]["ki_offaxis_controller"], Kd=self.config["controller_parameters"]["kd_offaxis_controller"])
-        self.pid_offaxis.setSampleTime(self.config["controller_parameters"]["looprate_offaxis_controller"])
-        self.pid_offaxis.setWindup(self.config["controller_parameters"]["windup_offaxis_controller"])
+        # the off-axis loop runs every n-th tick of the position loop
+        self.offaxis_decimation = max(1, int(round(parameters["looprate_offaxis_controller"] / parameters["looprate"])))
+        self.offaxis_output_degrees = 0.0
+        self.ticks = 0
+
+        # coordinated slew streamed as velocities, planned by the mount
+        self.slew_profile = None
+        self.slew_start = 0.0
+        self.slew_setpoint_degrees = 0.0
+
+        # the drive ramp was scaled for a staged slew and has to be restored when it ends
+        self.ramp_scaled = False
+
+        # feedforward gains on the trajectory rate and acceleration
+        self.kv_feedforward = self.config["controller_parameters"]["kv_feedforward"]
+        self.ka_feedforward = self.config["controller_parameters"]["ka_feedforward"]
 
         # init flags
         self.running = True
@@ -113,6 +203,14 @@ class Axis(threading.Thread):
         self.state = AxisState.IDLE
         self.nextState = AxisState.IDLE
 
+        # readers get the state of the last complete tick
+        self.snapshot = None
+        self.__publishSnapshot()
+
+        # full rate record of the loop, bounded to the last telemetry_capacity ticks
+        self.telemetry = TelemetryBuffer(self.parent.config["telemetry_capacity"])
+        self.tick_timestamp = time.time()
+
         # init task timers
         self.poll_timer = CustomTimer(self.config["poll_interval"], self.__pollTask).start()
         self.publish_timer = CustomTimer(self.config["publish_interval"], self.__publishTask).start()
@@ -121,50 +219,99 @@ class Axis(threading.Thread):
 
     def getStatus(self):
         """Function to take a snapshot of the current class variables and put it in a Python dict.
+
+        The values of the control loop come from the snapshot published at the end of its last tick, so
+        they are consistent with each other and reading them never waits for the loop.
         """
+        snapshot = self.snapshot
 
         status = 	{
                         "name" : self.name,
-                        "state"  : AxisState(self.state).name,
                         "errors" : self.errors,
                         "success"  : self.success,
                         "last_error"  : self.last_error,
                         "last_command"  : self.last_command,
-                        "looptime" : self.looptime,
-                        "looprate" : self.looprate,
-                        "pos_mount_microsteps" : self.pos_mount_microsteps,
-                        "pos_mount_degrees" : self.pos_mount_degrees,
-                        "pos_celestial_degrees" : self.pos_celestial_degrees,
-                        "pos_encoder_microsteps" : self.pos_encoder_microsteps,
-                        "pos_encoder_degrees" : self.pos_encoder_degrees,
-                        "vel_internal_microsteps" : self.vel_internal_microsteps,
-                        "vel_internal_degrees"  : self.vel_internal_degrees,
                         "driver_error_flags"  : self.driver_error_flags,
                         "driver_status_flags"  : self.driver_status_flags,
                         "driver_temperature"  : self.driver_temperature,
                         "driver_voltage"  : self.driver_voltage,
-
-                        "trajectory_setpoint_degrees" : self.trajectory_setpoint_degrees,
-                        "trajectory_error_degrees" : self.trajectory_error_degrees,
-
-                        "offaxis_setpoint_degrees" : self.offaxis_setpoint_degrees,
-                        "offaxis_error_degrees" : self.offaxis_error_degrees,
-
-                        "out_of_limits" : 1 if self.out_of_limits else 0,
                         "correction_active" : 1 if self.parent.model_active else 0,
 
-                        "P_trajectory" : self.pid_position.PTerm,
-                        "I_trajectory" : self.pid_position.Ki * self.pid_position.ITerm,
-                        "D_trajectory" : self.pid_position.Kd * self.pid_position.DTerm,
-                        "trajectory_on_target" : 1 if self.trajectory_on_target else 0,
-                        
-                        "P_offaxis" : self.pid_offaxis.PTerm,
-                        "I_offaxis" : self.pid_offaxis.Ki * self.pid_offaxis.ITerm,
-                        "D_offaxis" : self.pid_offaxis.Kd * self.pid_offaxis.DTerm,
-                        "offaxis_on_target" : 1 if self.offaxis_on_target else 0
+                        **snapshot._asdict(),
+                        "state" : snapshot.state.name,
+
+                        **self.loop.getStatus(),
+                        **self.profiler.getStatus(),
+                        **self.drive.getStatus(),
+                        **self.io.getStatus(),
+                        **self.telemetry.getStatus()
                     }
         return status					
 
+    def __publishSnapshot(self):
+        controller = self.controller
+        position = self.channel_position
+        offaxis = self.channel_offaxis
+
+        self.snapshot = AxisSnapshot(
+                                        state=self.state,
+                                        looptime=self.looptime,
+                                        looprate=self.looprate,
+                                        pos_mount_microsteps=self.pos_mount_microsteps,
+                                        pos_mount_degrees=self.pos_mount_degrees,
+                                        pos_celestial_degrees=self.pos_celestial_degrees,
+                                        pos_encoder_microsteps=self.pos_encoder_microsteps,
+                                        pos_encoder_degrees=self.pos_encoder_degrees,
+                                        vel_internal_microsteps=self.vel_internal_microsteps,
+                                        vel_internal_degrees=self.vel_internal_degrees,
+                                        trajectory_setpoint_degrees=self.trajectory_setpoint_degrees,
+                                        trajectory_error_degrees=self.trajectory_error_degrees,
+                                        offaxis_setpoint_degrees=self.offaxis_setpoint_degrees,
+                                        offaxis_error_degrees=self.offaxis_error_degrees,
+                                        out_of_limits=1 if self.out_of_limits else 0,
+                                        P_trajectory=float(controller.proportional[position]),
+                                        I_trajectory=float(controller.integral[position]),
+                                        D_trajectory=float(controller.derivative[position]),
+                                        saturated_trajectory=1 if controller.saturated[position] else 0,
+                                        trajectory_on_target=1 if self.trajectory_on_target else 0,
+                                        trajectory_rate_degrees=self.trajectory_rate_degrees,
+                                        FF_trajectory=self.feedforward_velocity_degrees,
+                                        velocity_command_degrees=self.velocity_command_degrees,
+                                        slew_setpoint_degrees=self.slew_setpoint_degrees,
+                                        trajectory_error_rms=self.trajectory_error_rms,
+                                        trajectory_error_max=self.trajectory_error_max,
+                                        P_offaxis=float(controller.proportional[offaxis]),
+                                        I_offaxis=float(controller.integral[offaxis]),
+                                        D_offaxis=float(controller.derivative[offaxis]),
+                                        offaxis_on_target=1 if self.offaxis_on_target else 0
+                                    )
+
+
+    def __recordTelemetry(self):
+        snapshot = self.snapshot
+
+        self.telemetry.append((
+                                    self.tick_timestamp,
+                                    snapshot.state.value,
+                                    snapshot.looptime,
+                                    snapshot.pos_mount_degrees,
+                                    snapshot.pos_encoder_degrees,
+                                    snapshot.pos_celestial_degrees,
+                                    snapshot.vel_internal_degrees,
+                                    snapshot.trajectory_setpoint_degrees,
+                                    snapshot.trajectory_rate_degrees,
+                                    snapshot.trajectory_error_degrees,
+                                    snapshot.offaxis_setpoint_degrees,
+                                    snapshot.offaxis_error_degrees,
+                                    self.offaxis_output_degrees,
+                                    snapshot.slew_setpoint_degrees,
+                                    snapshot.P_trajectory,
+                                    snapshot.I_trajectory,
+                                    snapshot.D_trajectory,
+                                    snapshot.FF_trajectory,
+                                    snapshot.velocity_command_degrees
+                                ))
+
 
     def microstepsToDegrees(self, microsteps):
         d = microsteps * self.degreesPerUstep
@@ -178,35 +325,83 @@ class Axis(threading.Thread):
 
     def configureDrive(self, config):
         for key, value in config["axis_parameters"].items():
-            status = self.__executeAxisCommand(True, AxisState.IDLE, self.drive.setAxisParameter, int(key), value)
+            try:
+                self.io.call(self.drive.setAxisParameter, int(key), value, retries=self.config["command_retries"], backoff=self.config["command_backoff"])
+            except Exception as e:
+                logging.warning("{} Failed to set axis parameter {} to {}, exception {}".format(self.name, key, value, e))
 
     def setPidPositionLoop(self, P, I, D):
-        self.pid_position.setKp(P)
-        self.pid_position.setKi(I)
-        self.pid_position.setKd(D)
+        self.controller.setGains(self.channel_position, P, I, D)
 
     def setPidOffAxisLoop(self, P, I, D):
-        self.pid_offaxis.setKp(P)
-        self.pid_offaxis.setKi(I)
-        self.pid_offaxis.setKd(D)      
+        self.controller.setGains(self.channel_offaxis, P, I, D)
+
+    def setFeedforward(self, kv, ka):
+        self.kv_feedforward = kv
+        self.ka_feedforward = ka
+        logging.info("{} Feedforward gains set to kv {} ka {}".format(self.name, kv, ka))
+
+    def getLatency(self):
+        return {**self.profiler.getSummary(), "abort" : self.io.abort_latency.getSummary()}
+
+    def resetLatency(self):
+        self.profiler.reset()
 
     def setPosition(self, position_degrees):
+        """Set the actual, target and encoder position of the drive, returns the futures of the responses
+        """
         position_usteps = self.degreesToMicrosteps(position_degrees)
         condition = (self.state == self.nextState == AxisState.IDLE)
-        self.__executeAxisCommand(condition, AxisState.IDLE, self.drive.setActualPosition, position_usteps)
-        self.__executeAxisCommand(condition, AxisState.IDLE, self.drive.setTargetPosition, position_usteps)
+        responses = [
+                        self.__executeAxisCommand(condition, AxisState.IDLE, self.drive.setActualPosition, position_usteps),
+                        self.__executeAxisCommand(condition, AxisState.IDLE, self.drive.setTargetPosition, position_usteps)
+                    ]
         if self.type == AxisType.AZIMUTH:
-            self.__executeAxisCommand(condition, AxisState.IDLE, self.drive.setAxisParameter, _APs.EncoderPosition, -position_usteps)
+            responses.append(self.__executeAxisCommand(condition, AxisState.IDLE, self.drive.setAxisParameter, _APs.EncoderPosition, -position_usteps))
         else:
-            self.__executeAxisCommand(condition, AxisState.IDLE, self.drive.setAxisParameter, _APs.EncoderPosition, position_usteps)
+            responses.append(self.__executeAxisCommand(condition, AxisState.IDLE, self.drive.setAxisParameter, _APs.EncoderPosition, position_usteps))
+        return responses
 
 
-    def gotoPosition(self, position_degrees_mount):
+    def gotoPosition(self, position_degrees_mount, stretch=1.0):
         """Command the axis 
+
+        With a stretch above 1 the drive ramp is slowed down for this move so that it takes stretch times
+        longer (velocities divided by stretch, accelerations by its square), the ramp is restored when
+        the position is reached.
         """
         position_usteps = self.degreesToMicrosteps(position_degrees_mount)
         condition = (self.state == self.nextState == AxisState.IDLE)
-        return self.__executeAxisCommand(condition, AxisState.GOTO_POSITION, self.drive.moveTo, position_usteps)
+
+        if stretch <= 1.0:
+            return self.__executeAxisCommand(condition, AxisState.GOTO_POSITION, self.drive.moveTo, position_usteps)
+
+        def stagedMove(position_usteps):
+            for key, power in self.RAMP_PARAMETERS.items():
+                if key in self.config["axis_parameters"]:
+                    self.drive.setAxisParameter(int(key), max(1, int(self.config["axis_parameters"][key] / stretch**power)))
+            self.ramp_scaled = True
+            self.drive.moveTo(position_usteps)
+
+        return self.__executeAxisCommand(condition, AxisState.GOTO_POSITION, stagedMove, position_usteps)
+
+    def slew(self, profile, t_start):
+        """Follow a slew profile (mount degrees) starting at time.monotonic() t_start
+
+        The velocity of the profile is streamed to the drive with the position loop correcting the
+        deviation, when the profile ends the final position is commanded to the drive.
+        """
+        if self.state == self.nextState == AxisState.IDLE:
+            self.slew_profile = profile
+            self.slew_start = t_start
+            self.controller.reset(self.channel_position)
+            with self.state_lock:
+                self.nextState = AxisState.SLEW
+                self.state_changed.notify_all()
+            self.last_command = "slew"
+            return self.__response({"success": True})
+        else:
+            return self.__response({"success": False, "message": "not in correct state or transition in progress"})
 
 
     def gotoVelocity(self, velocity):
@@ -220,25 +415,57 @@ class Axis(threading.Thread):
 
     def startTracking(self):
         if self.state == AxisState.IDLE:
-            self.nextState = AxisState.TRACK
+            self.trajectory_error_sum_squares = 0.0
+            self.trajectory_error_samples = 0
+            self.trajectory_error_rms = 0.0
+            self.trajectory_error_max = 0.0
+            self.controller.reset([self.channel_position, self.channel_offaxis])
+            self.offaxis_output_degrees = 0.0
+            self.ticks = 0
+            with self.state_lock:
+                self.nextState = AxisState.TRACK
+                self.state_changed.notify_all()
         
 
     def abort(self):
         condition = (self.state == self.nextState == AxisState.GOTO_POSITION) or \
+                    (self.state == self.nextState == AxisState.SLEW) or \
                     (self.state == self.nextState == AxisState.GOTO_VELOCITY) or \
                     (self.state == self.nextState == AxisState.TRACK) or \
-                    (self.state == self.nextState == AxisState.PARK)
-        return self.__executeAxisCommand(condition, AxisState.ABORT, self.drive.stop)
+                    (self.state == self.nextState == AxisState.PARK) or \
+                    self.commands != set()
+        if condition:
+            self.halting = True
+        return self.__executeAxisCommand(condition, AxisState.ABORT, self.drive.stop, priority=IOPriority.ABORT)
 
     def park(self):
         position_usteps = self.degreesToMicrosteps(0)
         condition = (self.state == self.nextState == AxisState.IDLE) or (self.state == self.nextState == AxisState.OOL)
         return self.__executeAxisCommand(condition, AxisState.PARK, self.drive.moveTo, position_usteps)        
 
-    def __executeAxisCommand(self, stateCondition, nextStateOnSuccess, driveCommand, *driveCommandArgs):
+    def waitForState(self, states, timeout=None):
+        """Block until the state machine has settled in one of states, returns False after timeout seconds
 
-        """ Generic function to execute direct axis commands which are called by an external thread, hence this function
-        uses the mutex of this class.
+        Settled means that the state register and the next state agree. The control loop notifies the waiters
+        whenever either of them changes, so the caller wakes up on the tick of the transition.
+        """
+        with self.state_changed:
+            return self.state_changed.wait_for(lambda: self.state == self.nextState and self.state in states, timeout)
+
+    def __response(self, returnMessage):
+        response = Future()
+        response.set_result(returnMessage)
+        return response
+
+    def __executeAxisCommand(self, stateCondition, nextStateOnSuccess, driveCommand, *driveCommandArgs, priority=IOPriority.COMMAND):
+
+        """ Generic function to execute direct axis commands which are called by an external thread. The drive command
+        is queued to the I/O thread of the drive and the caller gets a future of the response right away.
+
+        Failed attempts are retried by the I/O thread with a backoff, without blocking the control loop or the caller.
+        On success the state transition is handed to the control loop, which applies it at its next state register and
+        then completes the response, so the new state is visible once the response is done. Aborts are queued with the
+        ABORT priority and preempt all pending commands, whose responses complete with a failure.
 
         Parameters
         ----------
@@ -250,180 +477,160 @@ class Axis(threading.Thread):
             function of the driver to execute
         *driveCommandargs : args
             variable length argument tuple to pass to the driveCommand
+        priority : IOPriority
+            priority of the command in the queue of the I/O thread
         
         Returns
         -------
-        returnMessage : dict
-            dict containing a success and message field
+        response : concurrent.futures.Future
+            future of a dict containing a success and message field
         """
 
-        if stateCondition:
-
-            # acquire the mutex
-            # -----------------
-            self.mutex.acquire()
-            logging.debug("{} Mutex acquired".format(self.name))
-            # -----------------
-
-            retries = 0
-            while retries < 5:
-                try:
-                    driveCommand(*driveCommandArgs)
-                    success = True
-                    self.nextState = nextStateOnSuccess
-                    break
-
-                except Exception as e:
-                    encountered_exception = str(e)
-                    
-                    retries += 1
-                    time.sleep(0.5)
-                    success = False
-            
-            # release the mutex
-            # -----------------
-            self.mutex.release()
-            logging.debug("{} Mutex released".format(self.name))
-            # -----------------
-
-            if success:
-                returnMessage = {"success": True}
-                logging.info("{} Succesfully executed command {} arguments {} ({} retries)".format(self.name, driveCommand.__name__, driveCommandArgs, retries))
-            else:
-                logging.warning("{} Failed to execute command {} arguments {}, {} attempts, exception {}".format(self.name, driveCommand.__name__, driveCommandArgs, retries, encountered_exception))
-                returnMessage = {"success": False, "message": encountered_exception}
+        self.last_command = driveCommand.__name__
 
-        else:
+        if not stateCondition:
             returnMessage = {"success": False, "message": "not in correct state or transition in progress"}
+            logging.debug(returnMessage)
+            return self.__response(returnMessage)
 
-        logging.debug(returnMessage)
-        self.last_command = driveCommand.__name__
+        if priority == IOPriority.ABORT:
+            retries, backoff = self.config["abort_retries"], self.config["abort_backoff"]
+        else:
+            retries, backoff = self.config["command_retries"], self.config["command_backoff"]
 
-        return returnMessage
+        response = Future()
+        self.commands.add(response)
+
+        def complete(request):
+            try:
+                request.result()
+            except Exception as e:
+                logging.warning("{} Failed to execute command {} arguments {}, {} attempts, exception {}".format(self.name, driveCommand.__name__, driveCommandArgs, request.attempts, e))
+                if priority == IOPriority.ABORT:
+                    self.halting = False
+                self.commands.discard(response)
+                response.set_result({"success": False, "message": str(e)})
+                return
 
+            logging.info("{} Succesfully executed command {} arguments {} ({} retries)".format(self.name, driveCommand.__name__, driveCommandArgs, request.attempts - 1))
+            self.transitions.append((nextStateOnSuccess, response))
 
-    def __getAxisStatus(self):
+        self.io.submit(driveCommand, *driveCommandArgs, priority=priority, retries=retries, backoff=backoff).add_done_callback(complete)
 
-        try:
-            self.pos_mount_microsteps = self.drive.getActualPosition()
-            self.pos_mount_degrees = self.microstepsToDegrees(self.pos_mount_microsteps)
+        return response
 
-            if self.parent.model_active:
-                self.pos_celestial_degrees = self.parent.mountToCelestial(self.type, self.pos_mount_degrees)
-            else:
-                self.pos_celestial_degrees = self.pos_mount_degrees
 
-            self.success += 1
+    def submitRead(self):
+        # all readings of the tick in one pipelined burst, queued to the I/O thread of the drive
+        return self.io.submit(self.drive.readAxisParameters, [(_APs.ActualPosition, True), (_APs.EncoderPosition, False), (_APs.ActualVelocity, True), (_APs.PositionReachedFlag, False)], priority=IOPriority.CONTROL)
+
+    def completeRead(self, request):
+        """Take over the readings of a burst from submitRead(), the celestial position is left to the caller
+        """
+        try:
+            self.pos_mount_microsteps, pos_encoder_microsteps, self.vel_internal_microsteps, self.position_reached_flag = request.result()
+            self.drive_read_valid = True
+            self.success += 4
 
         except Exception as e:
+            self.drive_read_valid = False
             self.last_error = str(e)
             self.errors += 1
+            self.profiler.mark("drive_read")
+            return
 
+        self.profiler.mark("drive_read")
 
-        try:
-            pos_encoder_microsteps = self.drive.getAxisParameter(_APs.EncoderPosition)
+        self.pos_mount_degrees = self.microstepsToDegrees(self.pos_mount_microsteps)
 
-            if pos_encoder_microsteps >= 2**31:
-                pos_encoder_microsteps -= 2**32
-                
-            if self.type == AxisType.AZIMUTH:
-                self.pos_encoder_microsteps = -pos_encoder_microsteps
-            else:
-                self.pos_encoder_microsteps = pos_encoder_microsteps            
+        if pos_encoder_microsteps >= 2**31:
+            pos_encoder_microsteps -= 2**32
+            
+        if self.type == AxisType.AZIMUTH:
+            self.pos_encoder_microsteps = -pos_encoder_microsteps
+        else:
+            self.pos_encoder_microsteps = pos_encoder_microsteps            
 
-            self.pos_encoder_degrees = self.microstepsToDegrees(self.pos_encoder_microsteps)
-            self.success += 1
+        self.pos_encoder_degrees = self.microstepsToDegrees(self.pos_encoder_microsteps)
+        self.vel_internal_degrees = self.microstepsToDegrees(self.vel_internal_microsteps)
 
-        # error in telemetry readout is not critical
-        except Exception as e:
-            self.last_error = str(e)
-            self.errors += 1			
 
+    def __positionReached(self): 
+        # read in the burst of this tick
+        return self.drive_read_valid, self.drive_read_valid and self.position_reached_flag == 1
 
-        try:
-            self.vel_internal_microsteps = self.drive.getActualVelocity()
-            self.vel_internal_degrees = self.microstepsToDegrees(self.vel_internal_microsteps)
-            self.success += 1
 
-        # error in telemetry readout is not critical
-        except Exception as e:
-            self.last_error = str(e)
-            self.errors += 1
+    def __isStopped(self):
+        # read in the burst of this tick
+        return self.drive_read_valid, self.drive_read_valid and self.vel_internal_microsteps == 0
 
 
-    def __positionReached(self): 
-        
+    def __setVelocity(self, velocity_degrees):
+        velocity_usteps = self.degreesToMicrosteps(velocity_degrees)
         try:
-            positionReached = self.drive.positionReached()
-            valid = True
+            if (velocity_usteps < -self.config["axis_parameters"]["4"]):
+                velocity_usteps = -self.config["axis_parameters"]["4"]
 
+            elif (velocity_usteps > self.config["axis_parameters"]["4"]):
+                velocity_usteps = self.config["axis_parameters"]["4"]
+
+            # unchanged velocities are not written again by the drive
+            self.io.call(self.__moveDrive, self.drive.rotate, velocity_usteps, priority=IOPriority.CONTROL)
         except Exception as e:
-            positionReached = False
-            valid = False
-            self.last_error = str(e)
-            self.errors += 1
-            
-        finally:
-            return valid, positionReached
+            pass
 
+    def __moveDrive(self, driveCommand, *driveCommandArgs):
+        # executed by the I/O thread, so a move of the loop queued before an abort is dropped when it runs after it
+        if not self.halting:
+            driveCommand(*driveCommandArgs)
 
-    def __isStopped(self):
+    def __finishSlew(self):
+        # the SLEW state only ends when the final move reached the drive, otherwise it is sent again on the next tick
         try:
-            isStopped = (self.drive.getActualVelocity() == 0)
-            valid = True
-
+            self.io.call(self.__moveDrive, self.drive.moveTo, self.degreesToMicrosteps(self.slew_profile.stop), priority=IOPriority.CONTROL)
         except Exception as e:
-            isStopped = False
-            valid = False
-
             self.last_error = str(e)
             self.errors += 1
-            
-        finally:
-            return valid, isStopped
-
-
-    def __setVelocity(self, velocity_degrees):
-        velocity_usteps = self.degreesToMicrosteps(velocity_degrees)
-        if velocity_usteps != self.previous_set_velocity:
-            try:
-                if (velocity_usteps < -self.config["axis_parameters"]["4"]):
-                    velocity_usteps = -self.config["axis_parameters"]["4"]
+            return
 
-                elif (velocity_usteps > self.config["axis_parameters"]["4"]):
-                    velocity_usteps = self.config["axis_parameters"]["4"]
-
-                self.drive.rotate(velocity_usteps)
-                self.previous_set_velocity = velocity_usteps
-            except Exception as e:
-                pass
+        with self.state_lock:
+            # an abort taken over since the move was sent has precedence
+            if self.nextState == AxisState.SLEW and not self.halting:
+                self.nextState = AxisState.GOTO_POSITION
+                self.state_changed.notify_all()
 
     def __abort(self):
-        retries = 0
-        while retries < 10:
-            try:
-                self.drive.stop()
-                success = True
-                break
+        # queued without waiting, the loop keeps running while the stop is retried
+        if self.ool_abort == None or self.ool_abort.done():
+            self.ool_abort = self.io.submit(self.drive.stop, priority=IOPriority.ABORT, retries=self.config["abort_retries"], backoff=self.config["abort_backoff"])
 
-            except Exception as e:
-                retries += 1
-                time.sleep(0.5)
-                success = False
-        return success     
 
+    def __restoreRamp(self):
+        try:
+            for key in self.RAMP_PARAMETERS:
+                if key in self.config["axis_parameters"]:
+                    self.io.call(self.drive.setAxisParameter, int(key), self.config["axis_parameters"][key], priority=IOPriority.CONTROL)
+            self.ramp_scaled = False
+        except Exception as e:
+            self.last_error = str(e)
+            self.errors += 1
 
     def stop(self):
-        self.abort()
-        time.sleep(1)
+        # the control loop still runs until the drive is stopped
+        try:
+            if self.abort().result(timeout=self.parent.config["settle_timeout"])["success"]:
+                self.waitForState((AxisState.IDLE,), timeout=self.parent.config["settle_timeout"])
+        except Exception as e:
+            logging.warning("{} Failed to stop the axis before shutdown {}".format(self.name, e))
         self.running = False
+        self.io.stop()
         
 
     def __pollTask(self):
 
-        self.mutex.acquire()
+        # separate requests, the reads of the control loop are queued in between
         try:
-            self.driver_status_flags = self.drive.getStatusFlags()
+            self.driver_status_flags = self.io.call(self.drive.getStatusFlags, priority=IOPriority.POLL)
             self.success += 1
 
         except Exception as e:
@@ -432,7 +639,7 @@ class Axis(threading.Thread):
 
 
         try:
-            self.driver_error_flags = self.drive.getErrorFlags()
+            self.driver_error_flags = self.io.call(self.drive.getErrorFlags, priority=IOPriority.POLL)
             self.success += 1
 
         except Exception as e:
@@ -441,7 +648,7 @@ class Axis(threading.Thread):
 
 
         try:
-            self.driver_voltage = self.drive.analogInput(8)/10
+            self.driver_voltage = self.io.call(self.drive.analogInput, 8, priority=IOPriority.POLL)/10
             self.success += 1
 
         except Exception as e:
@@ -449,13 +656,12 @@ class Axis(threading.Thread):
             self.errors += 1
         
         try:
-            self.driver_temperature = self.drive.analogInput(9)
+            self.driver_temperature = self.io.call(self.drive.analogInput, 9, priority=IOPriority.POLL)
             self.success += 1
 
         except Exception as e:
             self.last_error = str(e)
             self.errors += 1
-        self.mutex.release()
 
 
     def __publishTask(self):
@@ -463,129 +669,228 @@ class Axis(threading.Thread):
         self.parent.parent.telegraf.metric(self.name, current_status)
 
 
+    def beginTick(self, looptime, timestamp=None):
+        # the mount control mode passes the common timestamp of the tick of both axes
+        self.looptime = looptime
+        self.tick_timestamp = timestamp if timestamp != None else time.time()
+        self.looprate = round(1.0 / self.looptime, 3) if self.looptime > 0 else 0.0
+
+        self.profiler.start()
+
     def run(self):
+        """Control loop of the axis on its own, used when the mount runs in the axis control mode
+        """
         while self.running:
 
-            self.currentLoopTime = datetime.datetime.utcnow()
-            self.loopdelta = self.currentLoopTime - self.prevLoopTime # calculate a timedelta between loops for looprate calculation
-            self.prevLoopTime = self.currentLoopTime
+            self.beginTick(self.loop.wait())
+            self.completeRead(self.submitRead())
+
+            if self.drive_read_valid:
+                if self.parent.model_active:
+                    self.pos_celestial_degrees = self.parent.mountToCelestial(self.type, self.pos_mount_degrees)
+                else:
+                    self.pos_celestial_degrees = self.pos_mount_degrees
+                self.profiler.mark("pointing_model")
+
+            self.step(self.parent.parent.object.updateSnapshot(self.tick_timestamp))
 
-            self.looptime = self.loopdelta.total_seconds()
-            self.looprate = round(1.0 / self.looptime, 3)
+    def step(self, snapshot):
+        """Rest of a control tick after the drive read: setpoints, state machine, publication of the snapshot
 
-            #===================
-            self.mutex.acquire()
-            #===================
+        Arguments:
+        snapshot -- the ephemeris snapshot at the time of the tick, shared by both axes in the mount control mode
+        """
+        # there are 2 setpoints in the cascaded controller, the trajectory comes with its rate and acceleration
+        if snapshot == None:
+            # no ephemeris (yet), hold the current position instead of running towards (0, 0)
+            self.trajectory_setpoint_degrees = self.pos_celestial_degrees
+            self.trajectory_rate_degrees = 0.0
+            self.trajectory_acceleration_degrees = 0.0
+        elif self.type == AxisType.AZIMUTH:
+            self.trajectory_setpoint_degrees = snapshot.azimuth
+            self.trajectory_rate_degrees = snapshot.azimuth_rate
+            self.trajectory_acceleration_degrees = snapshot.azimuth_acceleration
+        else:
+            self.trajectory_setpoint_degrees = snapshot.elevation
+            self.trajectory_rate_degrees = snapshot.elevation_rate
+            self.trajectory_acceleration_degrees = snapshot.elevation_acceleration
+        self.offaxis_setpoint_degrees = self.parent.parent.guider.getOffAxisSetpoint(self.type)
 
-            self.__getAxisStatus()
+        # there are 2 error signals as well
+        self.trajectory_error_degrees = self.trajectory_setpoint_degrees + self.offaxis_output_degrees - self.pos_celestial_degrees
+        self.offaxis_error_degrees = self.offaxis_setpoint_degrees - self.parent.parent.guider.getOffAxisValue(self.type)
 
-            # there are 2 setpoints in the cascaded controller
-            self.trajectory_setpoint_degrees = self.parent.parent.object.getPositionAxis(self.type)
-            self.offaxis_setpoint_degrees = self.parent.parent.guider.getOffAxisSetpoint(self.type)
+        if abs(self.trajectory_error_degrees) < self.config["target_threshold_trajectory"]:
+            self.trajectory_on_target = True
+        else:
+            self.trajectory_on_target = False
 
-            # there are 2 error signals as well
-            self.trajectory_error_degrees = self.trajectory_setpoint_degrees + self.pid_offaxis.output - self.pos_celestial_degrees
-            self.offaxis_error_degrees = self.offaxis_setpoint_degrees - self.parent.parent.guider.getOffAxisValue(self.type)
+        if abs(self.offaxis_error_degrees) < self.config["target_threshold_offaxis"]:
+            self.offaxis_on_target = True
+        else:
+            self.offaxis_on_target = False
 
-            if abs(self.trajectory_error_degrees) < self.config["target_threshold_trajectory"]:
-                self.trajectory_on_target = True
-            else:
-                self.trajectory_on_target = False
+        self.profiler.mark("setpoint")
+
+        #===================
+        self.state_lock.acquire()
+        #===================
+
+        self.profiler.mark("lock")
+        previous = (self.state, self.nextState)
+
+        # drive command of this tick, sent after the state lock is released so commands and status
+        # requests of other threads do not wait for the drive link
+        drive_command = None
 
-            if abs(self.offaxis_error_degrees) < self.config["target_threshold_offaxis"]:
-                self.offaxis_on_target = True
+        # transitions of the drive commands completed since the previous tick
+        while self.transitions:
+            self.nextState, response = self.transitions.popleft()
+            if self.nextState == AxisState.ABORT:
+                self.halting = False
+            self.commands.discard(response)
+            response.set_result({"success": True})
+
+        # state register
+        #--------------------------
+        self.state = self.nextState
+        #--------------------------
+
+        # state dependent actions
+        if self.state == AxisState.IDLE:
+            pass
+
+        elif self.state == AxisState.GOTO_POSITION:
+            valid, positionReached = self.__positionReached()
+
+            if valid and positionReached and self.ramp_scaled:
+                # restore the ramp first, the axis only becomes IDLE (and accepts a new move) on the next tick
+                drive_command = (self.__restoreRamp,)
+                self.nextState = self.state
+            elif valid and positionReached:
+                self.nextState = AxisState.IDLE
             else:
-                self.offaxis_on_target = False
+                self.nextState = self.state
 
-            # state register
-            #--------------------------
-            self.state = self.nextState
-            #--------------------------
+        elif self.state == AxisState.SLEW:
+            t_tick = self.loop.previous
+            t = t_tick - self.slew_start
 
-            # state dependent actions
-            if self.state == AxisState.IDLE:
-                pass
+            if t < self.slew_profile.duration:
+                position, velocity, acceleration = self.slew_profile.evaluate(t)
+                self.slew_setpoint_degrees = position
 
-            elif self.state == AxisState.GOTO_POSITION:
-                valid, positionReached = self.__positionReached()
+                # the profile velocity is the feedforward, the position loop corrects the deviation
+                feedforward = velocity + self.ka_feedforward * acceleration * self.loop.period
+                self.velocity_command_degrees = float(self.controller.update(self.channel_position, t_tick, position, self.pos_mount_degrees, feedforward))
+                drive_command = (self.__setVelocity, self.velocity_command_degrees)
+            else:
+                # the drive finishes the last bit in position mode
+                self.slew_setpoint_degrees = self.slew_profile.stop
+                drive_command = (self.__finishSlew,)
 
-                if valid and positionReached:
-                    self.nextState = AxisState.IDLE
-                else:
-                    self.nextState = self.state
 
+        elif self.state == AxisState.GOTO_VELOCITY:
+            valid, isStopped = self.__isStopped()
 
-            elif self.state == AxisState.GOTO_VELOCITY:
-                valid, isStopped = self.__isStopped()
+            if valid and isStopped:
+                self.nextState = AxisState.IDLE
+            else:
+                self.nextState = self.state
 
-                if valid and isStopped:
-                    self.nextState = AxisState.IDLE
-                else:
-                    self.nextState = self.state
 
+        elif self.state == AxisState.ABORT:
+            valid, isStopped = self.__isStopped()
 
-            elif self.state == AxisState.ABORT:
-                valid, isStopped = self.__isStopped()
+            if valid and isStopped and self.ramp_scaled:
+                drive_command = (self.__restoreRamp,)
+                self.nextState = self.state
+            elif valid and isStopped:
+                self.nextState = AxisState.IDLE
+                self.controller.reset([self.channel_position, self.channel_offaxis])
+                self.offaxis_output_degrees = 0.0
+            else:
+                self.nextState = self.state
 
-                if valid and isStopped:
-                    self.nextState = AxisState.IDLE
-                    self.pid_position.clear()
-                    self.pid_offaxis.clear()
-                else:
-                    self.nextState = self.state
 
+        elif self.state == AxisState.TRACK:
+
+            # both loops are advanced to the timestamp of this tick
+            t_tick = self.loop.previous
 
-            elif self.state == AxisState.TRACK:
-                
-                # set the desired off axis setpoing
-                self.pid_offaxis.SetPoint = self.parent.parent.guider.getOffAxisSetpoint(self.type) # adjust this later to a flexible off-axis value
-                
-                # update the offaxis controller with the observed offset by the guider in that axis
-                self.pid_offaxis.update(self.parent.parent.guider.getOffAxisValue(self.type))
+            # update the offaxis controller with the observed offset by the guider in that axis, at its own (lower) rate
+            if self.ticks % self.offaxis_decimation == 0:
+                self.offaxis_output_degrees = float(self.controller.update(self.channel_offaxis, t_tick, self.offaxis_setpoint_degrees, self.parent.parent.guider.getOffAxisValue(self.type)))
+            self.ticks += 1
 
-                if self.parent.parent.guider.object_detection_enabled and self.parent.parent.guider.keypoints != []:
+            if self.parent.parent.guider.object_detection_enabled and self.parent.parent.guider.keypoints != []:
                 # update the position loop with the calculated trajectory + output of offaxis controller
-                    self.pid_position.SetPoint = self.trajectory_setpoint_degrees - self.pid_offaxis.output
-                else:
-                    self.pid_position.SetPoint = self.trajectory_setpoint_degrees
+                setpoint = self.trajectory_setpoint_degrees - self.offaxis_output_degrees
+            else:
+                setpoint = self.trajectory_setpoint_degrees
 
-                # update the position loop with the current mount coordinates (albeit pushed through the pointing model)
-                self.pid_position.update(self.pos_celestial_degrees)
+            # feedforward the trajectory rate, extrapolated to the next tick with the acceleration, so the
+            # integrator only has to correct the residual error instead of carrying the whole target rate
+            self.feedforward_velocity_degrees = self.kv_feedforward * self.trajectory_rate_degrees + \
+                                                self.ka_feedforward * self.trajectory_acceleration_degrees * self.loop.period
 
-                if abs(self.pid_position.output) > 0:
-                    self.__setVelocity(self.pid_position.output)
+            # update the position loop with the current mount coordinates (albeit pushed through the pointing model),
+            # the feedforward is part of the limited velocity command
+            self.velocity_command_degrees = float(self.controller.update(self.channel_position, t_tick, setpoint, self.pos_celestial_degrees, self.feedforward_velocity_degrees))
+            self.profiler.mark("pid")
 
-            elif self.state == AxisState.OOL:
-                valid, isStopped = self.__isStopped()
+            if abs(self.velocity_command_degrees) > 0:
+                drive_command = (self.__setVelocity, self.velocity_command_degrees)
 
-                if valid and not isStopped:
-                    self.__abort()
-                else:
-                    pass
+            self.trajectory_error_sum_squares += self.trajectory_error_degrees**2
+            self.trajectory_error_samples += 1
+            self.trajectory_error_rms = math.sqrt(self.trajectory_error_sum_squares / self.trajectory_error_samples)
+            self.trajectory_error_max = max(self.trajectory_error_max, abs(self.trajectory_error_degrees))
 
-            elif self.state == AxisState.PARK:
-                valid, positionReached = self.__positionReached()
+        elif self.state == AxisState.OOL:
+            valid, isStopped = self.__isStopped()
 
-                if valid and positionReached:
-                    self.nextState = AxisState.IDLE
-                else:
-                    self.nextState = self.state
-
-            if (self.pos_mount_degrees < self.config["limit_min"] or self.pos_mount_degrees > self.config["limit_max"]):
-                self.out_of_limits = True # purely for indicative purposes
-                if not self.state == AxisState.PARK:
-                    # do not throw us back into OOL when we are parking from the OOL state
-                    # park mode is safe as regards the OOL because the home position (0,0) is hardcoded in the function
-                    self.nextState = AxisState.OOL
+            if valid and not isStopped:
+                self.__abort()
             else:
-                self.out_of_limits = False
+                pass
+
+        elif self.state == AxisState.PARK:
+            valid, positionReached = self.__positionReached()
+
+            if valid and positionReached:
+                self.nextState = AxisState.IDLE
+            else:
+                self.nextState = self.state
+
+        if (self.pos_mount_degrees < self.config["limit_min"] or self.pos_mount_degrees > self.config["limit_max"]):
+            self.out_of_limits = True # purely for indicative purposes
+            if not self.state == AxisState.PARK:
+                # do not throw us back into OOL when we are parking from the OOL state
+                # park mode is safe as regards the OOL because the home position (0,0) is hardcoded in the function
+                self.nextState = AxisState.OOL
+        else:
+            self.out_of_limits = False
+
+        if (self.state, self.nextState) != previous:
+            self.state_changed.notify_all()
+
+        self.profiler.mark("state_machine")
+
+        #===================
+        self.state_lock.release()
+        #===================
 
+        if drive_command != None:
+            drive_command[0](*drive_command[1:])
+        self.profiler.mark("drive_command")
 
-            #===================
-            self.mutex.release()
-            #===================
+        self.__publishSnapshot()
+        self.profiler.mark("publish")
 
+        self.__recordTelemetry()
+        self.profiler.mark("telemetry")
 
-            time.sleep(self.config["controller_parameters"]["looprate"])
+        self.profiler.stop()
 
 
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+import time
+
+
+def callsPerSecond(function, *args, duration=0.5, **kwargs):
+    """Measure how many times a function can be called per second.
+
+    Arguments:
+    function -- the callable to benchmark
+    duration -- minimum wall-clock time in seconds to keep calling the function
+    *args, **kwargs -- passed to the function on every call
+
+    Returns the achieved rate in calls/second.
+    """
+
+    calls = 0
+    t_start = time.perf_counter()
+    t_stop = t_start + duration
+
+    while True:
+        # call in small batches so the clock is not read on every iteration
+        for _ in range(100):
+            function(*args, **kwargs)
+        calls += 100
+
+        t_now = time.perf_counter()
+        if t_now >= t_stop:
+            break
+
+    return calls / (t_now - t_start)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+import datetime
+import os
+import shlex
+import subprocess
+import tempfile
+import ephem
+import katpoint
+import numpy as np
+
+from astropy.io import fits
+from astropy.wcs import WCS
+
+
+def solutionFile(filename):
+    """Astrometry.net WCS solution next to a frame, <frame>.wcs
+    """
+    return os.path.splitext(filename)[0] + ".wcs"
+
+
+def siteObserver(site, date):
+    """ephem observer at site (lat, lon in degrees, alt in metres), same atmosphere as the object ephemerides
+    """
+    observer = ephem.Observer()
+    observer.lat = np.radians(site[0])
+    observer.lon = np.radians(site[1])
+    observer.elevation = site[2]
+    observer.date = ephem.Date(date)
+    return observer
+
+
+def plateSolve(filename, header, observer, solver, timeout):
+    """Run the plate solver on a frame, returns the header of the WCS solution
+
+    The search is limited to the plate scale of the header and a few degrees around the celestial pointing of the
+    mount at exposure time, so the solver does not search the whole sky.
+    """
+    ra, dec = observer.radec_of(np.radians(header["CENTAZ_C"]), np.radians(header["CENTEL_C"]))
+    scale = max(header["PIXSCAL1"], header["PIXSCAL2"])
+
+    with tempfile.TemporaryDirectory() as directory:
+        command = shlex.split(solver) + [
+                                            "--scale-units", "arcsecperpix",
+                                            "--scale-low", str(0.9 * scale),
+                                            "--scale-high", str(1.1 * scale),
+                                            "--ra", str(np.degrees(ra)),
+                                            "--dec", str(np.degrees(dec)),
+                                            "--radius", "5",
+                                            "--dir", directory,
+                                            filename
+                                        ]
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout, check=True)
+
+        solution = os.path.join(directory, os.path.basename(solutionFile(filename)))
+        if not os.path.exists(solution):
+            raise RuntimeError("no plate solution found")
+        return fits.getheader(solution)
+
+
+def measureFrame(filename, site, solver=None, timeout=60.0):
+    """Mount and celestial az/el in degrees of the centre of a calibration frame
+
+    Arguments:
+    filename -- FITS frame written by Camera.captureFits
+    site -- (lat, lon, alt) of the mount in degrees and metres
+    solver -- plate solver command line (astrometry.net solve-field), only frames with a <frame>.wcs solution are used when None
+    timeout -- seconds the solver may take per frame
+
+    Runs in a worker process, so it only takes and returns plain values. The sky position of the frame centre is
+    taken from the WCS solution and converted to the apparent az/el at the time of exposure.
+    """
+    try:
+        header = fits.getheader(filename)
+        # DATE-OBS is UTC, an explicit offset is converted
+        date = datetime.datetime.fromisoformat(header["DATE-OBS"])
+        if date.tzinfo != None:
+            date = date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        observer = siteObserver(site, date)
+
+        if os.path.exists(solutionFile(filename)):
+            solution = fits.getheader(solutionFile(filename))
+        elif solver:
+            solution = plateSolve(filename, header, observer, solver, timeout)
+        else:
+            raise RuntimeError("frame is not plate solved")
+
+        # CRPIX of the frame header is the optical centre, FITS pixel coordinates are 1 based
+        ra, dec = WCS(solution).all_pix2world(header["CRPIX1"] + 0.5, header["CRPIX2"] + 0.5, 1)
+
+        body = ephem.FixedBody()
+        body._ra = np.radians(float(ra))
+        body._dec = np.radians(float(dec))
+        body._epoch = ephem.J2000
+        body.compute(observer)
+
+        return {
+                    "success" : True,
+                    "file" : filename,
+                    "date" : header["DATE-OBS"],
+                    "az_mount" : float(header["CENTAZ_M"]),
+                    "el_mount" : float(header["CENTEL_M"]),
+                    "az" : float(np.degrees(body.az)),
+                    "el" : float(np.degrees(body.alt))
+                }
+
+    except Exception as e:
+        return {"success" : False, "file" : filename, "message" : "{}: {}".format(type(e).__name__, e)}
+
+
+def fitPointingModel(az, el, az_mount, el_mount, enabled_params=(1, 3, 4, 5, 6, 7), clip=3.0, min_points=8, max_iterations=10):
+    """Least squares fit of a katpoint pointing model with iterative outlier rejection
+
+    Arguments:
+    az, el -- celestial (requested) positions in degrees
+    az_mount, el_mount -- mount positions in degrees that pointed at them
+    enabled_params -- P-numbers of the fitted parameters, the others are zero
+    clip -- points with a residual above clip standard deviations (robust estimate) are rejected
+    min_points -- the fit fails when fewer points are left
+    max_iterations -- rejection passes, the fit stops earlier once the set of points is stable
+
+    All points are fitted at once by katpoint, the residuals of every pass are evaluated on the whole set, so a
+    point rejected early can be accepted again. Returns the model and a dict with the fitted parameters, their
+    standard errors, the residuals in arcseconds and the mask of the used points.
+    """
+    az = np.radians(np.asarray(az, dtype=float))
+    el = np.radians(np.asarray(el, dtype=float))
+    delta_az = np.radians((np.asarray(az_mount, dtype=float) - np.degrees(az) + 180.0) % 360.0 - 180.0)
+    delta_el = np.radians(np.asarray(el_mount, dtype=float)) - el
+
+    used = np.ones(len(az), dtype=bool)
+    pm = katpoint.PointingModel()
+
+    for iteration in range(max_iterations):
+        if np.count_nonzero(used) < min_points:
+            raise ValueError("{} points left after outlier rejection, at least {} are required".format(np.count_nonzero(used), min_points))
+
+        pm = katpoint.PointingModel()
+        params, sigma_params = pm.fit(az[used], el[used], delta_az[used], delta_el[used], enabled_params=list(enabled_params), keep_disabled_params=True)
+        pm.set(params)
+
+        model_az, model_el = pm.offset(az, el)
+        residual = 3600.0 * np.degrees(np.hypot((delta_az - model_az) * np.cos(el), delta_el - model_el))
+
+        # the residual on the sky of 2D gaussian errors is Rayleigh distributed, its per axis standard deviation
+        # follows from the median of the used points, so the outliers do not inflate the threshold
+        sigma = np.median(residual[used]) / np.sqrt(2.0 * np.log(2.0))
+        accepted = residual <= clip * max(sigma, 1e-3)
+
+        if np.array_equal(accepted, used) or iteration == max_iterations - 1:
+            break
+        used = accepted
+
+    used_residual = residual[used]
+    result = {
+                "points" : len(az),
+                "points_used" : int(np.count_nonzero(used)),
+                "iterations" : iteration + 1,
+                "params" : [float(p) for p in params],
+                "sigma_params_arcsec" : [float(s) for s in 3600.0 * np.degrees(sigma_params)],
+                "residual_rms_arcsec" : float(np.sqrt(np.mean(used_residual**2))),
+                "residual_max_arcsec" : float(np.max(used_residual)),
+                "residuals_arcsec" : [float(r) for r in residual],
+                "used" : [bool(u) for u in used]
+            }
+
+    return pm, result
@@ -6,7 +6,8 @@ import os
 import sys
 import threading
 from threading import Timer
-from core.timer import CustomTimer
+from concurrent.futures import ThreadPoolExecutor
+from core.timer import CustomTimer, DeadlineLoop
 from core.axis import AxisType
 import time
 import json
@@ -63,6 +64,9 @@ class Camera(threading.Thread):
         self.platescale_y_arcsec = self.platescale_y * 3600.0 # arcseconds per pixel
 
         self.prevLoopTime = time.time()
+
+        # paces the loop while not streaming, frame acquisition paces it otherwise
+        self.idle_loop = DeadlineLoop(self.config["f_idle_interval"], policy=self.config["s_overrun_policy"])
         self.currentLoopTime = time.time()
 
         self.sender = imagezmq.ImageSender("tcp://{}:{}".format(self.config["s_streamhost"], self.config["i_streamport"]), REQ_REP=False)
@@ -131,6 +135,9 @@ class Camera(threading.Thread):
         # drive mutex
         self.mutex = threading.Lock()
 
+        # FITS files are written in the background when requested, so the exposure returns before the write
+        self.fits_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fits-writer")
+
         self.state = CameraState.IDLE
         self.nextState = CameraState.IDLE
 
@@ -345,7 +352,12 @@ class Camera(threading.Thread):
         else:
             raise CameraException("The value is not in the allowed range")
 
-    def captureFits(self, suffix):
+    def captureFits(self, suffix, background=False):
+        """Capture a frame and write it as FITS, returns the file name
+
+        With background the header is still taken right after the exposure, but the file is written by the
+        FITS writer thread and a Future of the file name is returned, so the mount can move on meanwhile.
+        """
         if (self.state == self.nextState == CameraState.STILL):
 
             self.mutex.acquire()
@@ -365,7 +377,7 @@ class Camera(threading.Thread):
 
             # Format header
             hdr = fits.Header()
-            hdr['DATE-OBS'] = datetime.datetime.fromtimestamp(t).strftime("%Y-%m-%dT%H:%M:%S.%f")
+            hdr['DATE-OBS'] = datetime.datetime.fromtimestamp(t, tz=datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f") # UTC as required by FITS
             hdr['EXPTIME'] = self.config["i_exposure"]
             hdr['CRPIX1'] = float(self.config["i_width"])/2.0
             hdr['CRPIX2'] = float(self.config["i_height"])/2.0
@@ -375,9 +387,9 @@ class Camera(threading.Thread):
             hdr['PIXSCAL2'] = self.platescale_y_arcsec
 
             #lat, lon, alt = self.parent.gps.getPosition()
-            hdr['GEOD_LAT'] = self.parent.mount.config["f_lat"]
-            hdr['GEOD_LON'] = self.parent.mount.config["f_lon"]
-            hdr['GEOD_ALT'] = self.parent.mount.config["f_alt"]
+            hdr['GEOD_LAT'] = self.parent.mount.config["lat"]
+            hdr['GEOD_LON'] = self.parent.mount.config["lon"]
+            hdr['GEOD_ALT'] = self.parent.mount.config["alt"]
             hdr['CENTAZ'] = self.parent.mount.azimuth.pos_mount_degrees
             hdr['CENTALT'] = self.parent.mount.elevation.pos_mount_degrees
             hdr['CRVAL1'] = 0.0
@@ -410,13 +422,19 @@ class Camera(threading.Thread):
             hdu = fits.PrimaryHDU(data=img, header=hdr)
             dest = self.config["s_fits_storage_dir"] + "/" + fname
 
-            hdu.writeto(dest)
-            return dest
+            if background:
+                return self.fits_writer.submit(self.__writeFits, hdu, dest)
+            return self.__writeFits(hdu, dest)
+
+    def __writeFits(self, hdu, dest):
+        hdu.writeto(dest)
+        return dest
 
     def stop(self):
         self.setIdle()
         self.poll_timer.cancel()
         self.publish_timer.cancel()
+        self.fits_writer.shutdown(wait=True)
         self.running = False
 
     def getOffAxisValue(self, axis):
@@ -461,7 +479,8 @@ class Camera(threading.Thread):
                         "object_offset_x" : self.object_offset_x,
                         "object_offset_y" : self.object_offset_y,
                         "object_offset_az" : self.object_offset_az,
-                        "object_offset_el" : self.object_offset_el
+                        "object_offset_el" : self.object_offset_el,
+                        **self.idle_loop.getStatus()
                     }
         return status
 
@@ -545,6 +564,6 @@ class Camera(threading.Thread):
             self.mutex.release()
 
             if self.state == CameraState.IDLE or self.state == CameraState.STILL:
-                time.sleep(1)
+                self.idle_loop.wait()
             else:
-                pass
+                self.idle_loop.reset()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+import datetime
+import itertools
+import logging
+import random
+import threading
+import time
+import numpy as np
+import ephem
+
+from core.benchmark import callsPerSecond
+
+
+class CatalogException(Exception):
+    pass
+
+
+def readTleFile(filename):
+    """Read a CelesTrak style (3 line) TLE file into a list of (name, line1, line2) tuples
+    """
+    with open(filename, "r") as f:
+        lines = [line.rstrip() for line in f if line.strip() != ""]
+
+    tles = []
+    i = 0
+    while i + 2 < len(lines):
+        if lines[i + 1].startswith("1 ") and lines[i + 2].startswith("2 "):
+            tles.append((lines[i].strip(), lines[i + 1], lines[i + 2]))
+            i += 3
+        else:
+            i += 1
+
+    return tles
+
+
+def tleEpoch(l1):
+    """UNIX timestamp of the epoch in TLE line 1 (columns 19-32, YYDDD.DDDDDDDD)
+    """
+    year = int(l1[18:20])
+    year += 2000 if year < 57 else 1900
+    days = float(l1[20:32])
+    return (datetime.datetime(year, 1, 1) - datetime.datetime(1970, 1, 1)).total_seconds() + (days - 1.0) * 86400.0
+
+
+class TleCatalog():
+    """Compact in-memory TLE catalog.
+
+    The elements are stored in one preallocated NumPy structured array (about 250 bytes per
+    satellite) and indexed by NORAD id and name with plain dicts, the epoch index is a lazily
+    rebuilt argsort. Re-ingesting a file only touches the records whose lines changed, and parsed
+    ephem bodies are memoized per NORAD id so selecting a target never parses the TLE again.
+    """
+
+    dtype = np.dtype([("norad", np.int32), ("epoch", np.float64), ("name", "U24"), ("line1", "S69"), ("line2", "S69")])
+
+    def __init__(self, capacity=1024):
+        self.records = np.zeros(capacity, dtype=self.dtype)
+        self.size = 0
+
+        self.index_norad = {}
+        self.index_name = {}
+        self.index_epoch = None # argsort of the epochs, rebuilt on demand
+
+        self.bodies = {}
+        self.mutex = threading.Lock()
+
+        self.last_ingest_time = 0.0
+        self.last_ingest = {"added" : 0, "updated" : 0, "unchanged" : 0}
+
+    def __grow(self):
+        records = np.zeros(2 * len(self.records), dtype=self.dtype)
+        records[:self.size] = self.records[:self.size]
+        self.records = records
+
+    def ingest(self, tles):
+        """Apply a list of (name, line1, line2) tuples, only new or changed records are written
+
+        Returns a dict with the number of added, updated and unchanged records.
+        """
+
+        added = updated = unchanged = 0
+
+        with self.mutex:
+            for name, l1, l2 in tles:
+                norad = int(l1[2:7])
+                line1 = l1.encode("ascii")
+                line2 = l2.encode("ascii")
+                name = name.strip()[:24]
+
+                row = self.index_norad.get(norad)
+
+                if row != None:
+                    record = self.records[row]
+                    if record["line1"] == line1 and record["line2"] == line2 and record["name"] == name:
+                        unchanged += 1
+                        continue
+
+                    # names are not unique, only drop the name entry when it still points at this satellite
+                    if self.index_name.get(record["name"].upper()) == row:
+                        del self.index_name[record["name"].upper()]
+                    self.bodies.pop(norad, None)
+                    updated += 1
+                else:
+                    if self.size == len(self.records):
+                        self.__grow()
+                    row = self.size
+                    self.size += 1
+                    self.index_norad[norad] = row
+                    added += 1
+
+                self.records[row] = (norad, tleEpoch(l1), name, line1, line2)
+                self.index_name[name.upper()] = row
+
+            if added > 0 or updated > 0:
+                self.index_epoch = None
+
+        return {"added" : added, "updated" : updated, "unchanged" : unchanged}
+
+    def ingestFile(self, filename):
+        t_start = time.perf_counter()
+        result = self.ingest(readTleFile(filename))
+        self.last_ingest_time = time.perf_counter() - t_start
+        self.last_ingest = result
+
+        logging.info("Ingested {}: {} added, {} updated, {} unchanged in {:.3f} s".format(filename, result["added"], result["updated"], result["unchanged"], self.last_ingest_time))
+        return result
+
+    def __row(self, norad=None, name=None):
+        if norad != None:
+            row = self.index_norad.get(int(norad))
+        elif name != None:
+            row = self.index_name.get(name.strip().upper())
+        else:
+            row = None
+
+        if row == None:
+            raise CatalogException("Object not found in catalog (norad {}, name {})".format(norad, name))
+
+        return row
+
+    def getTLE(self, norad=None, name=None):
+        record = self.records[self.__row(norad, name)]
+        return record["name"], record["line1"].decode("ascii"), record["line2"].decode("ascii")
+
+    def getBody(self, norad=None, name=None):
+        """Return the ephem body of a catalog object, parsed only once per TLE
+        """
+        row = self.__row(norad, name)
+        norad = int(self.records[row]["norad"])
+
+        body = self.bodies.get(norad)
+        if body == None:
+            body = ephem.readtle(*self.getTLE(norad))
+            self.bodies[norad] = body
+
+        return body
+
+    def getTLEs(self, newer_than=None):
+        """Return all elements as (name, line1, line2) tuples, optionally only those with an epoch after newer_than (UNIX time)
+        """
+        with self.mutex:
+            if newer_than == None:
+                rows = range(self.size)
+            else:
+                if self.index_epoch is None:
+                    self.index_epoch = np.argsort(self.records["epoch"][:self.size], kind="stable")
+                epochs = self.records["epoch"][self.index_epoch]
+                rows = self.index_epoch[np.searchsorted(epochs, newer_than, side="right"):]
+
+            return [(r["name"], r["line1"].decode("ascii"), r["line2"].decode("ascii")) for r in self.records[rows]]
+
+    def benchmark(self, filename=None):
+        """Measure lookup rates and, when a file is given, the time of a full reload
+        """
+        if self.size == 0:
+            return {"success": False, "message": "catalog is empty"}
+
+        ids = [int(n) for n in self.records["norad"][:self.size]]
+        sample = [random.choice(ids) for _ in range(1000)]
+        cycle = itertools.cycle(sample)
+
+        result = {
+                    "success" : True,
+                    "size" : self.size,
+                    "memory_bytes" : self.records.nbytes,
+                    "tle_lookups_per_second" : callsPerSecond(lambda: self.getTLE(next(cycle))),
+                    "body_lookups_per_second" : callsPerSecond(lambda: self.getBody(next(cycle)))
+                }
+
+        if filename != None:
+            t_start = time.perf_counter()
+            self.ingestFile(filename)
+            result["reload_seconds"] = time.perf_counter() - t_start
+
+        return result
+
+    def getStatus(self):
+        return {
+                    "catalog_size" : self.size,
+                    "catalog_memory_bytes" : self.records.nbytes,
+                    "catalog_ingest_time" : self.last_ingest_time,
+                    **{"catalog_{}".format(key) : value for key, value in self.last_ingest.items()}
+                }
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+import logging
+import math
+import numpy as np
+
+
+class ControllerBank():
+    """Bank of discrete PID controllers evaluated together on NumPy arrays.
+
+    Every channel is a PID controller with a first order low-pass on the derivative, output and output
+    rate limits, and back-calculation anti-windup: the integrator is corrected by antiwindup * (u - v),
+    the difference between the limited and the unlimited output, so it stops winding up as soon as the
+    actuator saturates. The feedforward is added before the limits so it is limited as well.
+
+    update() gets the timestamp of the tick from the caller and never reads a clock, the same sequence
+    of timestamps and measurements always gives the same outputs. The first update of a channel after a
+    reset uses its nominal step, later steps are clamped to max_steps nominal steps so a stalled loop
+    does not dump a large increment into the integrator. Channels may be updated separately by
+    different threads as long as every channel has a single writer.
+
+    A single channel (an integer index, as the axes update them once per tick) is advanced with plain
+    float arithmetic, the NumPy operations only pay off for several channels at once, e.g. in replay().
+    """
+
+    def __init__(self, channels, max_steps=5.0):
+        self.channels = channels
+        self.max_steps = max_steps
+
+        # parameters
+        self.kp = np.zeros(channels)
+        self.ki = np.zeros(channels)
+        self.kd = np.zeros(channels)
+        self.step = np.ones(channels) # nominal update period in seconds
+        self.derivative_filter = np.zeros(channels) # time constant of the derivative low-pass in seconds
+        self.antiwindup = np.zeros(channels) # back-calculation gain in 1/s
+        self.output_limit = np.full(channels, np.inf)
+        self.rate_limit = np.full(channels, np.inf) # output units per second
+
+        # state
+        self.last_time = np.full(channels, np.nan)
+        self.error = np.zeros(channels)
+        self.proportional = np.zeros(channels)
+        self.integral = np.zeros(channels)
+        self.derivative = np.zeros(channels)
+        self.output = np.zeros(channels)
+        self.saturated = np.zeros(channels, dtype=bool)
+        self.updates = np.zeros(channels, dtype=np.int64)
+
+    def configure(self, channel, kp, ki, kd, step, derivative_filter=0.0, antiwindup=0.0, output_limit=np.inf, rate_limit=np.inf):
+        self.kp[channel] = kp
+        self.ki[channel] = ki
+        self.kd[channel] = kd
+        self.step[channel] = step
+        self.derivative_filter[channel] = derivative_filter
+        self.antiwindup[channel] = antiwindup
+        self.output_limit[channel] = output_limit
+        self.rate_limit[channel] = rate_limit
+        self.reset(channel)
+
+    def setGains(self, channel, kp, ki, kd):
+        self.kp[channel] = kp
+        self.ki[channel] = ki
+        self.kd[channel] = kd
+        logging.info("Controller channel {} gains set to Kp {} Ki {} Kd {}".format(channel, kp, ki, kd))
+
+    def reset(self, channels):
+        self.last_time[channels] = np.nan
+        self.error[channels] = 0.0
+        self.proportional[channels] = 0.0
+        self.integral[channels] = 0.0
+        self.derivative[channels] = 0.0
+        self.output[channels] = 0.0
+        self.saturated[channels] = False
+
+    def update(self, channels, t, setpoint, measurement, feedforward=0.0):
+        """Advance the given channels (an index or an array of indices) to time t, returns their outputs
+        """
+        if isinstance(channels, (int, np.integer)):
+            return self.__updateChannel(int(channels), t, setpoint, measurement, feedforward)
+
+        step = self.step[channels]
+        dt = t - self.last_time[channels]
+        dt = np.where(np.isnan(dt), step, np.clip(dt, 0.0, self.max_steps * step))
+
+        error = setpoint - measurement
+
+        proportional = self.kp[channels] * error
+
+        # backward Euler discretisation of kd * s / (tf * s + 1)
+        tf = self.derivative_filter[channels]
+        denominator = np.where(tf + dt > 0.0, tf + dt, 1.0)
+        derivative = (tf * self.derivative[channels] + self.kd[channels] * (error - self.error[channels])) / denominator
+
+        integral = self.integral[channels]
+        unlimited = proportional + integral + derivative + feedforward
+
+        limit = self.output_limit[channels]
+        output = np.clip(unlimited, -limit, limit)
+
+        previous = self.output[channels]
+        change = self.rate_limit[channels] * dt
+        output = np.clip(output, previous - change, previous + change)
+
+        # integrate, with the back-calculation of the limited output (gain times step kept below 1)
+        tracking = np.minimum(self.antiwindup[channels] * dt, 1.0)
+        integral = integral + self.ki[channels] * error * dt + tracking * (output - unlimited)
+
+        self.last_time[channels] = t
+        self.error[channels] = error
+        self.proportional[channels] = proportional
+        self.integral[channels] = integral
+        self.derivative[channels] = derivative
+        self.output[channels] = output
+        self.saturated[channels] = output != unlimited
+        self.updates[channels] += 1
+
+        return output
+
+    def __updateChannel(self, channel, t, setpoint, measurement, feedforward):
+        # same discretisation as update() on python floats, the arrays are only indexed per element
+        step = float(self.step[channel])
+        dt = t - float(self.last_time[channel])
+        dt = step if math.isnan(dt) else min(max(dt, 0.0), self.max_steps * step)
+
+        error = setpoint - measurement
+
+        proportional = float(self.kp[channel]) * error
+
+        tf = float(self.derivative_filter[channel])
+        denominator = tf + dt if tf + dt > 0.0 else 1.0
+        derivative = (tf * float(self.derivative[channel]) + float(self.kd[channel]) * (error - float(self.error[channel]))) / denominator
+
+        integral = float(self.integral[channel])
+        unlimited = proportional + integral + derivative + feedforward
+
+        limit = float(self.output_limit[channel])
+        output = min(max(unlimited, -limit), limit)
+
+        previous = float(self.output[channel])
+        change = float(self.rate_limit[channel]) * dt
+        output = min(max(output, previous - change), previous + change)
+
+        tracking = min(float(self.antiwindup[channel]) * dt, 1.0)
+        integral = integral + float(self.ki[channel]) * error * dt + tracking * (output - unlimited)
+
+        self.last_time[channel] = t
+        self.error[channel] = error
+        self.proportional[channel] = proportional
+        self.integral[channel] = integral
+        self.derivative[channel] = derivative
+        self.output[channel] = output
+        self.saturated[channel] = output != unlimited
+        self.updates[channel] += 1
+
+        return output
+
+    def replay(self, channels, times, setpoints, measurements, feedforward=None):
+        """Run recorded inputs (one row per tick) through the given channels from a reset state, returns the outputs
+        """
+        self.reset(channels)
+
+        outputs = []
+        for i, t in enumerate(times):
+            outputs.append(self.update(channels, t, setpoints[i], measurements[i], feedforward[i] if feedforward is not None else 0.0))
+
+        return np.array(outputs)
+
+    def getStatus(self, channel):
+        return {
+                    "P" : float(self.proportional[channel]),
+                    "I" : float(self.integral[channel]),
+                    "D" : float(self.derivative[channel]),
+                    "output" : float(self.output[channel]),
+                    "saturated" : 1 if self.saturated[channel] else 0,
+                    "updates" : int(self.updates[channel])
+                }
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import enum
+import heapq
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from core.latency import LatencyHistogram
+
+
+class IOPriority(enum.IntEnum):
+    ABORT = 0 # stop commands, preempt all pending user commands
+    CONTROL = 1 # reads and velocity commands of the control loop
+    COMMAND = 2 # user commands
+    POLL = 3 # housekeeping
+
+
+class DriveIOPreempted(Exception):
+    pass
+
+
+class DriveIOStopped(Exception):
+    pass
+
+
+class DriveIO():
+    """Owner thread of a drive, every access to the drive is a request executed by this thread.
+
+    submit() queues a function with a priority and returns a concurrent.futures.Future of its result,
+    call() waits for it. Requests are executed one at a time, by priority and in submission order within
+    a priority, so the control loop, the poll task and user commands never hold a lock across serial I/O
+    and can not interleave transactions on the link.
+
+    A failed request with retries left is put aside and queued again after an exponential backoff, the
+    thread keeps serving the other requests in the meantime and the future only completes after the last
+    attempt. An ABORT request preempts: all pending COMMAND requests, including those waiting for a retry,
+    fail with DriveIOPreempted before it is executed. A transaction already on the link can not be
+    interrupted, so the worst case abort latency is one transaction plus the abort itself; the latency from
+    submission to completion of every abort is kept in a histogram next to the queue wait times.
+
+    After stop() new requests fail right away and the requests still queued fail with DriveIOStopped, so
+    no caller is left waiting on a thread that is gone.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.requests = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.running = True
+        self.lock = threading.Lock() # only orders submissions against stop()
+
+        # retries waiting for their backoff, only touched by the I/O thread
+        self.delayed = []
+
+        self.executed = 0
+        self.failed = 0
+        self.retried = 0
+        self.preempted = 0
+        self.wait = LatencyHistogram()
+        self.abort_latency = LatencyHistogram()
+
+        self.thread = threading.Thread(target=self.__work, name="{}-io".format(name), daemon=True)
+        self.thread.start()
+
+    def submit(self, function, *args, priority=IOPriority.COMMAND, retries=0, backoff=0.05):
+        """Queue function(*args), returns a Future of its result
+
+        A failing request is attempted retries more times, the n-th retry after backoff * 2**(n-1) seconds.
+        """
+        future = Future()
+        future.attempts = 0
+        with self.lock:
+            if not self.running:
+                future.set_exception(DriveIOStopped("{} I/O thread is stopped".format(self.name)))
+                return future
+            self.requests.put((priority, next(self.sequence), time.perf_counter_ns(), future, function, args, retries, backoff))
+        return future
+
+    def call(self, function, *args, priority=IOPriority.COMMAND, retries=0, backoff=0.05):
+        return self.submit(function, *args, priority=priority, retries=retries, backoff=backoff).result()
+
+    def __preempt(self):
+        kept = []
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if request[0] == IOPriority.COMMAND:
+                self.preempted += 1
+                self.__fail(request, DriveIOPreempted("{} command {} preempted by abort".format(self.name, request[4].__name__)))
+            else:
+                kept.append(request)
+
+        for request in kept:
+            self.requests.put(request)
+
+        for _, request in self.delayed:
+            if request[0] == IOPriority.COMMAND:
+                self.preempted += 1
+                self.__fail(request, DriveIOPreempted("{} command {} preempted by abort".format(self.name, request[4].__name__)))
+        self.delayed = [(t, request) for t, request in self.delayed if request[0] != IOPriority.COMMAND]
+        heapq.heapify(self.delayed)
+
+    def __fail(self, request, exception):
+        future = request[3]
+        if not future.cancelled():
+            future.set_exception(exception)
+
+    def __next(self):
+        # retries that are due go back into the queue at their original priority and sequence
+        now = time.monotonic()
+        while self.delayed != [] and self.delayed[0][0] <= now:
+            self.requests.put(heapq.heappop(self.delayed)[1])
+
+        timeout = self.delayed[0][0] - now if self.delayed != [] else None
+        try:
+            return self.requests.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def __work(self):
+        while self.running:
+            request = self.__next()
+            if request == None:
+                continue
+
+            priority, _, submitted, future, function, args, retries, backoff = request
+            if function == None:
+                break
+
+            if priority == IOPriority.ABORT:
+                self.__preempt()
+
+            if future.attempts == 0:
+                self.wait.record(time.perf_counter_ns() - submitted)
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+            try:
+                future.attempts += 1
+                result = function(*args)
+            except Exception as e:
+                if future.attempts <= retries:
+                    self.retried += 1
+                    heapq.heappush(self.delayed, (time.monotonic() + backoff * 2**(future.attempts - 1), request))
+                    continue
+
+                self.failed += 1
+                future.set_exception(e)
+            else:
+                self.executed += 1
+                future.set_result(result)
+
+            if priority == IOPriority.ABORT:
+                self.abort_latency.record(time.perf_counter_ns() - submitted)
+
+        while not self.requests.empty():
+            self.__fail(self.requests.get_nowait(), DriveIOStopped("{} I/O thread is stopped".format(self.name)))
+        for _, request in self.delayed:
+            self.__fail(request, DriveIOStopped("{} I/O thread is stopped".format(self.name)))
+        self.delayed = []
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.requests.put((IOPriority.ABORT, -1, time.perf_counter_ns(), Future(), None, (), 0, 0.0))
+
+    def getStatus(self):
+        wait = self.wait.getSummary()
+        abort = self.abort_latency.getSummary()
+        return {
+                    "io_executed" : self.executed,
+                    "io_failed" : self.failed,
+                    "io_retried" : self.retried,
+                    "io_preempted" : self.preempted,
+                    "io_queued" : self.requests.qsize(),
+                    "io_delayed" : len(self.delayed),
+                    "io_wait_p50_us" : wait["p50_us"],
+                    "io_wait_p99_us" : wait["p99_us"],
+                    "io_wait_max_us" : wait["max_us"],
+                    "io_aborts" : abort["samples"],
+                    "io_abort_latency_p99_us" : abort["p99_us"],
+                    "io_abort_latency_max_us" : abort["max_us"]
+                }
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+import time
+import numpy as np
+
+from core.passes import gast, UNIX_EPOCH_JD
+from core.trajectory import hermiteCoefficientArray
+
+
+class EphemerisTableException(Exception):
+    pass
+
+
+def localSiderealTime(t, lon):
+    """Local apparent sidereal time in radians at UNIX times t, longitude in degrees
+
+    The right ascension of date is measured from the true equinox, so the hour angle needs the apparent sidereal
+    time, the mean sidereal time is off by the equation of the equinoxes (up to about 17 arcseconds).
+    """
+    jd = np.floor(t / 86400.0) + UNIX_EPOCH_JD
+    fr = t / 86400.0 - np.floor(t / 86400.0)
+    return gast(jd, fr) + np.radians(lon)
+
+
+def refraction(el, pressure=1010.0, temperature=15.0):
+    """Atmospheric refraction in degrees for a geometric elevation in degrees (Saemundsson), ephem's default atmosphere
+    """
+    el = np.maximum(el, -1.0) # kept constant below the horizon
+    scale = pressure / 1010.0 * 283.0 / (273.0 + temperature)
+    return scale * 1.02 / np.tan(np.radians(el + 10.3 / (el + 5.11))) / 60.0
+
+
+def equatorialToHorizontal(ra, dec, t, lat, lon):
+    """Topocentric RA/Dec of date (degrees) to az/el (degrees) at UNIX times t, refraction included
+    """
+    ha = localSiderealTime(t, lon) - np.radians(ra)
+    dec = np.radians(dec)
+    phi = np.radians(lat)
+
+    el = np.degrees(np.arcsin(np.sin(phi) * np.sin(dec) + np.cos(phi) * np.cos(dec) * np.cos(ha)))
+    az = np.degrees(np.arctan2(-np.cos(dec) * np.sin(ha), np.sin(dec) * np.cos(phi) - np.cos(dec) * np.sin(phi) * np.cos(ha))) % 360.0
+
+    return az, el + refraction(el)
+
+
+def horizontalToEquatorial(az, el, t, lat, lon):
+    """Az/el (degrees) to topocentric RA/Dec of date (degrees) at UNIX times t, refraction neglected
+    """
+    az = np.radians(az)
+    el = np.radians(el)
+    phi = np.radians(lat)
+
+    dec = np.arcsin(np.sin(phi) * np.sin(el) + np.cos(phi) * np.cos(el) * np.cos(az))
+    ha = np.arctan2(-np.sin(az) * np.cos(el), np.cos(phi) * np.sin(el) - np.sin(phi) * np.cos(el) * np.cos(az))
+
+    return np.degrees(localSiderealTime(t, lon) - ha) % 360.0, np.degrees(dec)
+
+
+class EphemerisTable():
+    """Externally computed (CPF/OEM style) ephemeris, tracked by interpolation.
+
+    Rows of (UNIX time, az, el) or (UNIX time, RA, Dec) are uploaded in chunks into a staging array.
+    Committing the upload converts all rows to both frames at once, unwraps azimuth and right
+    ascension and fits a cubic Hermite polynomial to every interval, so no propagation is needed
+    during the pass. Before the first and after the last row the table holds the end position.
+
+    The fit is kept as the array of row times and a float64 (intervals, 4, 4) array of the az, el, ra
+    and dec coefficients, 136 bytes per row.
+    """
+
+    FRAMES = ("azel", "radec")
+
+    def __init__(self, lat, lon, capacity=4096):
+        self.lat = lat
+        self.lon = lon
+        self.capacity = capacity
+
+        self.name = ""
+        self.frame = None
+        self.staging = None
+        self.staged = 0
+
+        self.mutex = threading.Lock()
+
+        # (times, coefficients) of the last commit, replaced as a whole so readers never see a mix
+        self.fit = None
+        self.rows = 0
+        self.t0 = None
+        self.t1 = None
+
+        self.last_commit_time = 0.0
+
+    def begin(self, name, frame="azel"):
+        """Start a new upload, an upload in progress is discarded
+        """
+        if frame not in self.FRAMES:
+            raise EphemerisTableException("Unknown frame {}, expected one of {}".format(frame, self.FRAMES))
+
+        with self.mutex:
+            self.name = name
+            self.frame = frame
+            self.staging = np.empty((self.capacity, 3))
+            self.staged = 0
+
+    def append(self, rows):
+        """Append a chunk of [time, az, el] or [time, ra, dec] rows to the upload, returns the number of staged rows
+        """
+        rows = np.asarray(rows, dtype=float).reshape(-1, 3)
+
+        if not np.all(np.isfinite(rows)):
+            raise EphemerisTableException("Chunk contains non finite values")
+
+        with self.mutex:
+            if self.staging is None:
+                raise EphemerisTableException("No upload in progress")
+
+            if self.staged + len(rows) > len(self.staging):
+                staging = np.empty((max(2 * len(self.staging), self.staged + len(rows)), 3))
+                staging[:self.staged] = self.staging[:self.staged]
+                self.staging = staging
+
+            self.staging[self.staged:self.staged + len(rows)] = rows
+            self.staged += len(rows)
+
+            return self.staged
+
+    def commit(self):
+        """Convert and fit the uploaded rows, the previous table is replaced atomically
+        """
+        t_start = time.perf_counter()
+
+        with self.mutex:
+            if self.staging is None:
+                raise EphemerisTableException("No upload in progress")
+            rows = self.staging[:self.staged]
+            frame = self.frame
+            self.staging = None
+            self.staged = 0
+
+        # chunks may arrive out of order, duplicate epochs keep the last row
+        t, unique = np.unique(rows[::-1, 0], return_index=True)
+        rows = rows[::-1][unique]
+
+        if len(t) < 3:
+            raise EphemerisTableException("At least 3 rows are required, got {}".format(len(t)))
+
+        if frame == "azel":
+            az, el = rows[:, 1], rows[:, 2]
+            ra, dec = horizontalToEquatorial(az, el, t, self.lat, self.lon)
+        else:
+            ra, dec = rows[:, 1], rows[:, 2]
+            az, el = equatorialToHorizontal(ra, dec, t, self.lat, self.lon)
+
+        az = np.degrees(np.unwrap(np.radians(az)))
+        ra = np.degrees(np.unwrap(np.radians(ra)))
+
+        # interval times relative to the first row keep the polynomial arguments small
+        x = t - t[0]
+        coefficients = np.stack([hermiteCoefficientArray(y, x) for y in (az, el, ra, dec)], axis=1)
+
+        with self.mutex:
+            self.fit = (t, coefficients)
+            self.rows = len(t)
+            self.t0 = float(t[0])
+            self.t1 = float(t[-1])
+
+        self.last_commit_time = time.perf_counter() - t_start
+        logging.info("Committed ephemeris table {} of {} rows ({}) in {:.3f} s".format(self.name, len(t), frame, self.last_commit_time))
+
+        return {"rows" : len(t), "start" : self.t0, "stop" : self.t1}
+
+    def evaluate(self, t):
+        """Evaluate the table at UNIX time t
+
+        Returns a tuple (az, el, ra, dec, az_rate, el_rate, az_acc, el_acc) like TrajectorySegment.evaluate(),
+        or None when no table is committed.
+        """
+        fit = self.fit
+        if fit == None:
+            return None
+        times, coefficients = fit
+
+        # hold the end positions outside the table
+        hold = t < times[0] or t > times[-1]
+        t = min(max(t, float(times[0])), float(times[-1]))
+
+        index = min(max(int(np.searchsorted(times, t, side="right")) - 1, 0), len(coefficients) - 1)
+        s = t - float(times[index])
+        # one conversion of the row to floats, arithmetic on numpy scalars is much slower
+        (a0, b0, c0, d0), (a1, b1, c1, d1), (a2, b2, c2, d2), (a3, b3, c3, d3) = coefficients[index].tolist()
+
+        az = a0 + s * (b0 + s * (c0 + s * d0))
+        el = a1 + s * (b1 + s * (c1 + s * d1))
+        ra = a2 + s * (b2 + s * (c2 + s * d2))
+        dec = a3 + s * (b3 + s * (c3 + s * d3))
+
+        if hold:
+            return az, el, ra, dec, 0.0, 0.0, 0.0, 0.0
+
+        az_rate = b0 + s * (2.0 * c0 + 3.0 * s * d0)
+        el_rate = b1 + s * (2.0 * c1 + 3.0 * s * d1)
+
+        az_acc = 2.0 * c0 + 6.0 * s * d0
+        el_acc = 2.0 * c1 + 6.0 * s * d1
+
+        return az, el, ra, dec, az_rate, el_rate, az_acc, el_acc
+
+    def sample(self, times):
+        """Unwrapped azimuth and elevation in degrees at a sequence of UNIX times, vectorised like evaluate()
+        """
+        times_table, coefficients = self.fit
+
+        t = np.clip(np.asarray(times, dtype=float), times_table[0], times_table[-1])
+        index = np.clip(np.searchsorted(times_table, t, side="right") - 1, 0, len(coefficients) - 1)
+        s = t - times_table[index]
+
+        a, b, c, d = np.moveaxis(coefficients[index, :2], -1, 0)
+        position = a + s[:, None] * (b + s[:, None] * (c + s[:, None] * d))
+        return position[:, 0], position[:, 1]
+
+    def getStatus(self):
+        return {
+                    "table_name" : self.name,
+                    "table_rows" : self.rows,
+                    "table_start" : self.t0 if self.t0 != None else 0.0,
+                    "table_stop" : self.t1 if self.t1 != None else 0.0,
+                    "table_staged" : self.staged,
+                    "table_commit_time" : self.last_commit_time
+                }
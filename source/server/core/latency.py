@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import time
+
+
+class LatencyHistogram():
+    """Fixed bucket latency histogram in nanoseconds.
+
+    Buckets are logarithmic with 4 sub-buckets per power of 2 (about 19 % resolution), the bucket of a
+    sample follows from its bit length without any search. There is a single writer (the control loop),
+    readers copy the counts; an increment racing a read is at worst missed by that read, so no lock is
+    taken on the hot path.
+    """
+
+    BUCKETS = 4 * 44 # up to 2**44 ns, about 4.9 hours
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # swap in fresh objects, the writer keeps working on whatever it read last
+        self.counts = [0] * self.BUCKETS
+        self.max = 0
+
+    def record(self, ns):
+        e = ns.bit_length()
+        index = 4 * e + ((ns >> (e - 3)) & 3) if e >= 3 else 4 * e
+        if index >= self.BUCKETS:
+            index = self.BUCKETS - 1
+
+        self.counts[index] += 1
+        if ns > self.max:
+            self.max = ns
+
+    @staticmethod
+    def upperBound(index):
+        e, sub = divmod(index, 4)
+        if e < 3:
+            return 1 << e
+        return (5 + sub) << (e - 3)
+
+    def percentiles(self, quantiles):
+        """Return the upper bucket bounds in ns of the given quantiles (0..1), None when there are no samples
+        """
+        counts = list(self.counts)
+        maximum = self.max
+        total = sum(counts)
+        if total == 0:
+            return [None for _ in quantiles]
+
+        result = []
+        for q in quantiles:
+            target = q * total
+            cumulative = 0
+            for index, count in enumerate(counts):
+                cumulative += count
+                if count > 0 and cumulative >= target:
+                    break
+            result.append(min(self.upperBound(index), maximum))
+
+        return result
+
+    def getSummary(self):
+        counts = list(self.counts)
+        p50, p99 = self.percentiles((0.5, 0.99))
+        return {
+                    "samples" : sum(counts),
+                    "p50_us" : p50 / 1000.0 if p50 != None else 0.0,
+                    "p99_us" : p99 / 1000.0 if p99 != None else 0.0,
+                    "max_us" : self.max / 1000.0
+                }
+
+
+class LoopProfiler():
+    """Per-stage timing of a control loop.
+
+    start() opens a cycle, every mark(stage) records the time since the previous mark into the histogram
+    of that stage and stop() records the whole cycle plus the period since the previous cycle. A mark
+    costs one perf_counter_ns() call and a histogram update, cheap enough to stay enabled.
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.histograms = {stage : LatencyHistogram() for stage in self.stages + ["cycle", "period"]}
+
+        self.cycle_start = None
+        self.previous_start = None
+        self.last_mark = 0
+
+        self.overhead_ns = self.__measureOverhead()
+
+    def __measureOverhead(self, n=10000):
+        histogram = LatencyHistogram()
+        t_start = time.perf_counter_ns()
+        for _ in range(n):
+            now = time.perf_counter_ns()
+            histogram.record(now - t_start)
+        return (time.perf_counter_ns() - t_start) / n
+
+    def start(self):
+        now = time.perf_counter_ns()
+        if self.previous_start != None:
+            self.histograms["period"].record(now - self.previous_start)
+        self.previous_start = now
+        self.cycle_start = now
+        self.last_mark = now
+
+    def mark(self, stage):
+        now = time.perf_counter_ns()
+        self.histograms[stage].record(now - self.last_mark)
+        self.last_mark = now
+
+    def skip(self):
+        # the time since the previous mark is not attributed to any stage, it is still part of the cycle
+        self.last_mark = time.perf_counter_ns()
+
+    def stop(self):
+        now = time.perf_counter_ns()
+        self.histograms["cycle"].record(now - self.cycle_start)
+        self.last_mark = now
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+    def getSummary(self):
+        return {stage : histogram.getSummary() for stage, histogram in self.histograms.items()}
+
+    def getStatus(self):
+        """Flat p50/p99/max per stage in microseconds for the telemetry
+        """
+        status = {"latency_overhead_ns" : self.overhead_ns}
+        for stage, summary in self.getSummary().items():
+            for key in ("p50_us", "p99_us", "max_us"):
+                status["latency_{}_{}".format(stage, key)] = summary[key]
+        return status
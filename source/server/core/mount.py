@@ -7,13 +7,25 @@ import time
 import datetime
 from datetime import timedelta
 import sys
+import os
+import glob
+import itertools
+import multiprocessing
 import threading
 import enum
 import logging
 import katpoint
+import concurrent.futures
 from core.axis import Axis, AxisState, AxisException, AxisType
+from core.tmcl import PipelinedTMCM1240
+from core.controller import ControllerBank
+from core.slew import SlewPlanner, sCurveTime
+from core.simulation import SimulatedTmclInterface
+from core.telemetry import exportTelemetry, parseTime
+from core.pointing import PointingTable
+from core.calibration import measureFrame, fitPointingModel
+from core.timer import DeadlineLoop
 from core.camera import CameraState
-from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED
 import numpy as np
 
 class MountException(Exception):
@@ -35,6 +47,8 @@ class Mount(object):
 
         self.pm = katpoint.PointingModel() # define an empty pointing model
         self.model_active = False
+        self.pointing_table = None # compiled pointing model, katpoint is evaluated directly when None
+        self.pointing_table_validation = None
 
         if self.config["use_test_calib"]:
             self.calib_points_az = self.config["calib_az_test"]
@@ -43,19 +57,36 @@ class Mount(object):
             self.calib_points_az = self.config["calib_az"]
             self.calib_points_el = self.config["calib_el"]
 
-        self.calibration_jobs = []
         self.calibrating = False
+
+        # calibration frames are measured in processes forked from a clean single threaded server process, so they
+        # inherit no locks held by the threads of this process and never import the server module again
+        self.calibration_context = multiprocessing.get_context("forkserver")
+        self.calibration_context.set_forkserver_preload(["core.calibration"])
+
+        # position and off-axis loops of both axes, configured by the axes
+        self.controller = ControllerBank(2 * len(AxisType))
+
+        # coordinated slews of both axes
+        self.slew_planner = SlewPlanner(self.config)
         
 
         try:
-            self.cm0 = ConnectionManager(["--port=/dev/ttyACM0", "--data-rate=1000000"], debug=False)
-            self.interface0 = self.cm0.connect()
-            self.drive0 = TMCM_1240(connection=self.interface0)
+            if self.config["simulated"]:
+                # simulated drives with the same serial addresses and encoder directions as the real ones
+                logging.warning("Running the mount on simulated drives")
+                self.interface0 = SimulatedTmclInterface(module_address=1, config=self.config["simulation"], encoder_direction=-1)
+                self.interface1 = SimulatedTmclInterface(module_address=2, config=self.config["simulation"], encoder_direction=1)
+            else:
+                self.cm0 = ConnectionManager(["--port=/dev/ttyACM0", "--data-rate=1000000"], debug=False)
+                self.interface0 = self.cm0.connect()
+                self.cm1 = ConnectionManager(["--port=/dev/ttyACM1", "--data-rate=1000000"], debug=False)
+                self.interface1 = self.cm1.connect()
+
+            self.drive0 = PipelinedTMCM1240(connection=self.interface0, depth=self.config["pipeline_depth"], velocity_refresh=self.config["velocity_refresh"])
             self.drive0_addr = self.drive0.getGlobalParameter(self.drive0.GPs.serialAddress, bank=0)
 
-            self.cm1 = ConnectionManager(["--port=/dev/ttyACM1", "--data-rate=1000000"], debug=False)
-            self.interface1 = self.cm1.connect()
-            self.drive1 = TMCM_1240(connection=self.interface1)
+            self.drive1 = PipelinedTMCM1240(connection=self.interface1, depth=self.config["pipeline_depth"], velocity_refresh=self.config["velocity_refresh"])
             self.drive1_addr = self.drive1.getGlobalParameter(self.drive1.GPs.serialAddress, bank=0)
         except Exception as e:
             logging.critical("Exception encountered during mount INIT {}".format(e))
@@ -80,13 +111,78 @@ class Mount(object):
             logging.critical("Exception encountered during mount INIT")
             sys.exit(0)
 
-        #Start axis threads
-        self.azimuth.start()
-        self.elevation.start()
+        if self.config["control_mode"] == "mount":
+            # one loop reads both drives at once and commands both axes from the same tick, the axes share its deadlines
+            parameters = self.config["azimuth"]["controller_parameters"]
+            self.loop = DeadlineLoop(parameters["looprate"], policy=parameters["overrun_policy"])
+            self.azimuth.loop = self.loop
+            self.elevation.loop = self.loop
+
+            self.control_thread = threading.Thread(target=self.__controlLoop, name="mount-loop", daemon=True)
+            self.control_thread.start()
+        else:
+            #Start axis threads
+            self.azimuth.start()
+            self.elevation.start()
+
+    def __controlLoop(self):
+        """Coordinated control loop of both axes, used in the mount control mode
+
+        The position reads of both drives are queued at the same time and run in parallel on the I/O threads
+        of the two links. The pointing model is evaluated once on the (az, el) pair of the same tick and both
+        axes are stepped with the same ephemeris snapshot.
+        """
+        axes = (self.azimuth, self.elevation)
+
+        while self.running:
+
+            looptime = self.loop.wait()
+            t_tick = time.time()
+            for axis in axes:
+                axis.beginTick(looptime, t_tick)
+
+            requests = [axis.submitRead() for axis in axes]
+            for axis, request in zip(axes, requests):
+                axis.completeRead(request)
+
+            pos_celestial = self.reversePointingModel(self.azimuth.pos_mount_degrees, self.elevation.pos_mount_degrees)
+
+            for axis, position in zip(axes, pos_celestial):
+                if axis.drive_read_valid:
+                    axis.pos_celestial_degrees = position
+                    axis.profiler.mark("pointing_model")
+
+            # the ephemeris of this tick, evaluated once for both axes
+            snapshot = self.parent.object.updateSnapshot(t_tick)
+            for axis in axes:
+                # the step of the other axis is not part of the stages of this one
+                axis.profiler.skip()
+                axis.step(snapshot)
 
     def setPointingModel(self, params):
+        """Activate a pointing model and compile it into a lookup table
+
+        The table is validated against katpoint at random points, when the error of either direction exceeds
+        pointing_table_tolerance arcseconds the model is evaluated by katpoint directly.
+        """
         try:
-            self.pm.set(params)
+            pm = katpoint.PointingModel()
+            pm.set(params)
+
+            table = PointingTable(pm, step=self.config["pointing_table_step"], el_min=self.elevation.config["limit_min"], el_max=min(self.elevation.config["limit_max"], self.config["pointing_table_el_max"]))
+            validation = table.validate(pm, samples=self.config["pointing_table_samples"])
+
+            if max(validation["forward_max_arcsec"], validation["reverse_max_arcsec"]) > self.config["pointing_table_tolerance"]:
+                logging.warning("Pointing table error exceeds {} arcsec, evaluating the pointing model with katpoint {}".format(self.config["pointing_table_tolerance"], validation))
+                table = None
+            else:
+                logging.info("Pointing table compiled {}".format(validation))
+
+            # swapped in as a whole, the control loop keeps using the previous model until here
+            self.pm = pm
+            self.pointing_table = table
+            self.pointing_table_validation = validation
+
             success = True
             message = self.pm.values()
             self.model_active = True
@@ -95,7 +191,35 @@ class Mount(object):
             message = str(e)
             self.model_active = False
 
-        return {"success" : success, "message" : message}
+        return {"success" : success, "message" : message, "pointing_table" : self.pointing_table_validation, "pointing_table_active" : self.pointing_table != None}
+
+    def applyPointingModel(self, az, el):
+        """Mount az/el in degrees of celestial az/el in degrees, scalars or arrays
+
+        Vectorised over arrays, so planning tools can convert whole trajectories at once.
+        """
+        if not self.model_active:
+            return az, el
+
+        table = self.pointing_table
+        if table != None:
+            return table.apply(az, el)
+
+        az_mount_rad, el_mount_rad = self.pm.apply(np.radians(az), np.radians(el))
+        return np.degrees(az_mount_rad), np.degrees(el_mount_rad)
+
+    def reversePointingModel(self, az, el):
+        """Celestial az/el in degrees of mount az/el in degrees, scalars or arrays
+        """
+        if not self.model_active:
+            return az, el
+
+        table = self.pointing_table
+        if table != None:
+            return table.reverse(az, el)
+
+        az_celestial_rad, el_celestial_rad = self.pm.reverse(np.radians(az), np.radians(el))
+        return np.degrees(az_celestial_rad), np.degrees(el_celestial_rad)
 
     def mountToCelestial(self, type, angle):
 
@@ -103,116 +227,216 @@ class Mount(object):
         # celestial = the celestial sphere coordinate system (=mount coordinate system + applied model)
 
         if type == AxisType.AZIMUTH:
-            pos_mount_azimuth = angle
-            pos_mount_elevation = self.elevation.pos_mount_degrees
-
-            pos_celestial_azimuth_rad, pos_celestial_elevation_rad = self.pm.reverse(np.radians(pos_mount_azimuth), np.radians(pos_mount_elevation))
-
-            return np.degrees(pos_celestial_azimuth_rad)
+            pos_celestial_azimuth, pos_celestial_elevation = self.reversePointingModel(angle, self.elevation.pos_mount_degrees)
+            return pos_celestial_azimuth
 
         elif type == AxisType.ELEVATION:
-            pos_mount_azimuth = self.azimuth.pos_mount_degrees
-            pos_mount_elevation = angle
-
-            pos_celestial_azimuth_rad, pos_celestial_elevation_rad = self.pm.reverse(np.radians(pos_mount_azimuth), np.radians(pos_mount_elevation))
-
-            return np.degrees(pos_celestial_elevation_rad)
+            pos_celestial_azimuth, pos_celestial_elevation = self.reversePointingModel(self.azimuth.pos_mount_degrees, angle)
+            return pos_celestial_elevation
 
     def celestialToMount(self, type, angle):
         # mount = the mount coordinate system
         # celestial = the celstial sphere coordinate system (=mount coordinate system + applied model)
 
         if type == AxisType.AZIMUTH:
-            pos_celestial_azimuth = angle
-            pos_celestial_elevation = self.elevation.pos_celestial_elevation
+            pos_mount_azimuth, pos_mount_elevation = self.applyPointingModel(angle, self.elevation.pos_celestial_degrees)
+            return pos_mount_azimuth
+
+        elif type == AxisType.ELEVATION:
+            pos_mount_azimuth, pos_mount_elevation = self.applyPointingModel(self.azimuth.pos_celestial_degrees, angle)
+            return pos_mount_elevation
 
-            pos_mount_azimuth_rad, pos_mount_elevation_rad = self.pm.apply(np.radians(pos_celestial_azimuth), np.radians(pos_celestial_elevation))
+    def calibrate(self, points=8):
+        """Capture a FITS frame at every calibration point, returns the files and the timing of the run
 
-            return np.degrees(pos_mount_azimuth_rad)
+        The points are visited in the order of the shortest total slew time from the current position. Every
+        point is chained as slew, settling for calibration_settle seconds and exposure, each step starts when the
+        previous one completes. The FITS file of a point is written in the background while the mount already
+        slews to the next one. An abort of the mount ends the run after the current point.
+        """
+        if self.parent.guider.state != CameraState.STILL:
+            self.calibrating = False
+            raise MountException("Camera must be in state STILL to commence calibration")
 
-        elif type == AxisType.ELEVATION:
-            pos_celestial_azimuth = self.azimuth.pos_celestial_elevation
-            pos_celestial_elevation = angle
+        if not (self.azimuth.state == AxisState.IDLE and self.elevation.state == AxisState.IDLE):
+            raise MountException("Both axes must be IDLE to commence calibration")
 
-            pos_mount_azimuth_rad, pos_mount_elevation_rad = self.pm.apply(np.radians(pos_celestial_azimuth), np.radians(pos_celestial_elevation))
+        t_start = time.perf_counter()
 
-            return np.degrees(pos_mount_elevation_rad)
+        az_from = self.azimuth.pos_mount_degrees
+        el_from = self.elevation.pos_mount_degrees
+        order, slew_time = self.slew_planner.order(az_from, el_from, self.calib_points_az, self.calib_points_el)
+        slew_time_listed = float(np.sum(self.slew_planner.duration(np.diff(np.concatenate(([az_from], self.calib_points_az))), np.diff(np.concatenate(([el_from], self.calib_points_el))))))
+        logging.info("Calibrating {} points in order {}, {:.1f} s of slewing ({:.1f} s in the configured order)".format(len(order), order, slew_time, slew_time_listed))
 
-    def calibrate(self, points=8):
+        self.calibrating = True
+        writes = []
+        timing = []
+        try:
+            for n in order:
+                # an abort during the previous capture must not start the slew to the next point
+                if not self.calibrating:
+                    raise MountException("Calibration aborted after {} of {} points".format(len(writes), len(order)))
+
+                t0 = time.perf_counter()
+                self.gotoMountPosition(self.calib_points_az[n], self.calib_points_el[n], calibration=True)
+                t1 = time.perf_counter()
+
+                time.sleep(self.config["calibration_settle"])
+
+                if not self.calibrating:
+                    raise MountException("Calibration aborted after {} of {} points".format(len(writes), len(order)))
+
+                t2 = time.perf_counter()
+                write = self.parent.guider.captureFits(suffix="calibration{}".format(n), background=True)
+                if write == None:
+                    raise MountException("Camera left state STILL during calibration")
+                writes.append(write)
+                t3 = time.perf_counter()
 
-        # clear the ID list of the previous calibration jobs
-        self.calibration_jobs = []
+                timing.append({"point" : n, "az_mount" : self.calib_points_az[n], "el_mount" : self.calib_points_el[n], "slew" : t1 - t0, "capture" : t3 - t2})
 
-        # log the calibration start time
-        start_time = datetime.datetime.utcnow()
+            files = [write.result() for write in writes]
+        finally:
+            # frames already captured are written out in any case
+            concurrent.futures.wait(writes)
+            self.calibrating = False
+
+        wall_time = time.perf_counter() - t_start
+        logging.info("Calibration of {} points took {:.1f} s".format(len(files), wall_time))
+
+        return {
+                    "success" : True,
+                    "files" : files,
+                    "order" : order,
+                    "slew_time_planned" : slew_time,
+                    "slew_time_listed_order" : slew_time_listed,
+                    "wall_time" : wall_time,
+                    "points" : timing
+                }
+
+    def fitCalibration(self, pattern=None, activate=True):
+        """Fit a pointing model to the frames of a calibration run and activate it
 
-        if self.parent.guider.state == CameraState.STILL:
+        Arguments:
+        pattern -- glob of the calibration frames in calibration_dir, calibration_pattern when None
+        activate -- activate the fitted model, otherwise only the fit is returned
+
+        The frames are plate solved in a pool of calibration_workers processes, the fit rejects outliers
+        iteratively. The model is only activated when its residual RMS is below calibration_max_rms arcseconds,
+        it is swapped in as a whole by setPointingModel so the control loop never sees a partial model.
+        """
+        try:
+            t0 = time.perf_counter()
+            files = sorted(glob.glob(os.path.join(self.config["calibration_dir"], pattern if pattern != None else self.config["calibration_pattern"])))
+            if files == []:
+                raise MountException("No calibration frames found")
+
+            site = (self.config["lat"], self.config["lon"], self.config["alt"])
+            solver = self.config["calibration_solver"] or None
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.config["calibration_workers"], mp_context=self.calibration_context) as pool:
+                measurements = list(pool.map(measureFrame, files, itertools.repeat(site), itertools.repeat(solver), itertools.repeat(self.config["calibration_solver_timeout"])))
+            t_measured = time.perf_counter()
+
+            failed = {m["file"] : m["message"] for m in measurements if not m["success"]}
+            measurements = [m for m in measurements if m["success"]]
+            for filename, message in failed.items():
+                logging.warning("Calibration frame {} rejected: {}".format(filename, message))
+
+            pm, fit = fitPointingModel(
+                                        [m["az"] for m in measurements],
+                                        [m["el"] for m in measurements],
+                                        [m["az_mount"] for m in measurements],
+                                        [m["el_mount"] for m in measurements],
+                                        enabled_params=self.config["calibration_params"],
+                                        clip=self.config["calibration_clip"],
+                                        min_points=self.config["calibration_min_points"]
+                                    )
+            fit["files"] = [m["file"] for m in measurements]
+            fit["failed"] = failed
+            fit["measure_time"] = t_measured - t0
+            fit["fit_time"] = time.perf_counter() - t_measured
+            logging.info("Pointing model fit {}".format({key : fit[key] for key in ("points", "points_used", "residual_rms_arcsec", "residual_max_arcsec", "measure_time", "fit_time")}))
+
+            if fit["residual_rms_arcsec"] > self.config["calibration_max_rms"]:
+                return {"success" : False, "message" : "Residual RMS {:.1f} arcsec exceeds {} arcsec, model not activated".format(fit["residual_rms_arcsec"], self.config["calibration_max_rms"]), "fit" : fit}
+
+            if not activate:
+                return {"success" : True, "message" : pm.values(), "fit" : fit}
+
+            response = self.setPointingModel(fit["params"])
+            response["fit"] = fit
+            return response
 
-            # set a flag indicating we are in a calibration procedure, and that we are not to be messed with
-            self.calibrating = True
+        except Exception as e:
+            return {"success" : False, "message" : str(e)}
 
-            # add the listener which will modifying concurrent job start dates for
-            self.parent.scheduler.add_listener(self.updateCalibrationJob, EVENT_JOB_EXECUTED)
+    def __waitForState(self, states, timeout):
+        """Block until both axes have settled in one of states, raises a MountException after timeout seconds
+        """
+        t_stop = time.monotonic() + timeout
+        for axis in (self.azimuth, self.elevation):
+            if not axis.waitForState(states, max(0.0, t_stop - time.monotonic())):
+                raise MountException("{} did not settle in {} within {:.1f} s, state {} next state {}".format(axis.name, [state.name for state in states], timeout, axis.state.name, axis.nextState.name))
 
-            # schedule preliminary gotoPosition jobs every minute, the job listener will glue them together nby modifying the start time of the next once the previous one executes
-            n = 0
-            for az, el in zip(self.calib_points_az, self.calib_points_el):
+    def __slew(self, az_mount, el_mount, calibration=False):
+        """Coordinated slew of both axes to a mount position, returns when both axes are IDLE again
 
-                scheduling_time = start_time + timedelta(minutes=n)
-                goto_job = self.parent.scheduler.add_job(self.gotoMountPosition, trigger='date', run_date=scheduling_time, args=None, kwargs={"az_mount" : az, "el_mount" : el}, name="Move to calibration point {} az{} el{}".format(n, az, el))
-                self.calibration_jobs.append(goto_job.id)
-                
-                fits_time = start_time + timedelta(minutes=n + 1)
-                capture_job = self.parent.scheduler.add_job(self.parent.guider.captureFits, trigger='date', run_date=fits_time, args=None, kwargs={"suffix" : "calibration{}".format(n)}, name="Capture FITS at point {}".format(n))
-                self.calibration_jobs.append(capture_job.id)
+        In stream mode both axes follow S-curve profiles of the same duration, in staged mode the drive ramps
+        of the faster axis are slowed down so both moveTo commands take as long as the slower one. A slew of
+        a calibration run is not started once the run was aborted.
+        """
+        az_from = self.azimuth.pos_mount_degrees
+        el_from = self.elevation.pos_mount_degrees
 
-                # store the job id as we will use it later to retrieve the next job
-                
-                n += 1
+        if self.config["slew_mode"] == "stream":
+            profile_azimuth, profile_elevation = self.slew_planner.plan(az_from, el_from, az_mount, el_mount)
+            # both profiles last as long as the slower axis needs, also when one axis does not move
+            duration = max(profile_azimuth.duration, profile_elevation.duration)
 
-            while self.calibrating:
-                time.sleep(1)
+            if calibration and not self.calibrating:
+                raise MountException("Calibration aborted, slew to AZ{:.3f} EL{:.3f} not started".format(az_mount, el_mount))
 
-            self.parent.scheduler.remove_listener(self.updateCalibrationJob)
+            # common start on the next tick
+            t_start = time.monotonic() + self.azimuth.loop.period
+            response_azimuth = self.azimuth.slew(profile_azimuth, t_start)
+            response_elevation = self.elevation.slew(profile_elevation, t_start)
 
         else:
+            # drive ramps without a jerk limit
+            planner = self.slew_planner
+            duration_azimuth = float(sCurveTime(az_mount - az_from, planner.velocity[0], planner.acceleration[0], np.inf))
+            duration_elevation = float(sCurveTime(el_mount - el_from, planner.velocity[1], planner.acceleration[1], np.inf))
+            duration = max(duration_azimuth, duration_elevation)
 
-            self.calibrating = False
-            raise MountException("Camera must be in state STILL to commence calibration")
+            if calibration and not self.calibrating:
+                raise MountException("Calibration aborted, slew to AZ{:.3f} EL{:.3f} not started".format(az_mount, el_mount))
 
+            response_azimuth = self.azimuth.gotoPosition(az_mount, stretch=duration / duration_azimuth if duration_azimuth > 0 else 1.0)
+            response_elevation = self.elevation.gotoPosition(el_mount, stretch=duration / duration_elevation if duration_elevation > 0 else 1.0)
 
-    def updateCalibrationJob(self, event):
+        logging.info("Slewing to AZ{:.3f} EL{:.3f} in {:.1f} s ({})".format(az_mount, el_mount, duration, self.config["slew_mode"]))
 
-        id_job_finished = event.job_id
-        index_job_finished = self.calibration_jobs.index(id_job_finished)
-        index_next_job = index_job_finished + 1
-        try:
-            next_job_id = self.calibration_jobs[index_next_job]
-            next_job = self.parent.scheduler.get_job(next_job_id)
-            next_job.modify(next_run_time=datetime.datetime.utcnow() + timedelta(seconds=3))
-        except Exception as e:
-            self.calibrating = False
+        # both commands are queued before waiting for either of them
+        response_azimuth = response_azimuth.result()
+        response_elevation = response_elevation.result()
 
+        if response_azimuth["success"] and response_elevation["success"]:
+            # returns on the tick both state machines are back in IDLE
+            self.__waitForState((AxisState.IDLE,), duration + self.config["settle_timeout"])
+        else:
+            raise MountException("Encountered exception during axis commanding: response_azimuth {} response_elevation {}".format(response_azimuth, response_elevation))
 
-    def gotoMountPosition(self, az_mount, el_mount):
+    def gotoMountPosition(self, az_mount, el_mount, calibration=False):
 
-        if 	az_mount < self.azimuth.config["f_limit_min"] or \
-            az_mount > self.azimuth.config["f_limit_max"] or \
-            el_mount < self.elevation.config["f_limit_min"] or \
-            el_mount > self.elevation.config["f_limit_max"]:
+        if 	az_mount < self.azimuth.config["limit_min"] or \
+            az_mount > self.azimuth.config["limit_max"] or \
+            el_mount < self.elevation.config["limit_min"] or \
+            el_mount > self.elevation.config["limit_max"]:
             raise MountException("Requested target position is outside of limits")
         else:
             if self.azimuth.state == AxisState.IDLE and self.elevation.state == AxisState.IDLE:
-                response_azimuth = self.azimuth.gotoPosition(az_mount)
-                response_elevation = self.elevation.gotoPosition(el_mount)
-                time.sleep(2)
-
-                if response_azimuth["success"] and response_elevation["success"]:
-                    # wait until both axis are at IDLE again before releasing the job
-                    while self.azimuth.state != AxisState.IDLE or self.elevation.state != AxisState.IDLE:
-                        time.sleep(1)
-                else:
-                    raise MountException("Encountered exception during axis commanding: response_azimuth {} response_elevation {}".format(response_azimuth, response_elevation))
+                self.__slew(az_mount, el_mount, calibration)
 
 
     def gotoPosition(self, az, el):
@@ -230,33 +454,19 @@ class Mount(object):
         el -- the desired elevation angle in the celestial frame
         """
 
-        if not self.model_active:
-            # if the pointing model is not active, the celestial frame coordinates are equal to the ones of the mount
-            az_mount, el_mount = az, el
-        else:
-            az_mount_rad, el_mount_rad = self.pm.apply(np.radians(az), np.radians(el))
-            az_mount = np.degrees(az_mount_rad)
-            el_mount = np.degrees(el_mount_rad)
+        # if the pointing model is not active, the celestial frame coordinates are equal to the ones of the mount
+        az_mount, el_mount = self.applyPointingModel(az, el)
         
         logging.debug("Slewing to actual axis position AZ{} EL{}".format(az_mount, el_mount))
 
-        if 	az_mount < self.azimuth.config["f_limit_min"] or \
-            az_mount > self.azimuth.config["f_limit_max"] or \
-            el_mount < self.elevation.config["f_limit_min"] or \
-            el_mount > self.elevation.config["f_limit_max"]:
+        if 	az_mount < self.azimuth.config["limit_min"] or \
+            az_mount > self.azimuth.config["limit_max"] or \
+            el_mount < self.elevation.config["limit_min"] or \
+            el_mount > self.elevation.config["limit_max"]:
             raise MountException("Requested target position is outside of limits")
         else:
             if self.azimuth.state == AxisState.IDLE and self.elevation.state == AxisState.IDLE:
-                response_azimuth = self.azimuth.gotoPosition(az_mount)
-                response_elevation = self.elevation.gotoPosition(el_mount)
-                time.sleep(2)
-
-                if response_azimuth["success"] and response_elevation["success"]:
-                    # wait until both axis are at IDLE again before releasing the job
-                    while self.azimuth.state != AxisState.IDLE or self.elevation.state != AxisState.IDLE:
-                        time.sleep(1)
-                else:
-                    raise MountException("Encountered exception during axis commanding: response_azimuth {} response_elevation {}".format(response_azimuth, response_elevation))
+                self.__slew(az_mount, el_mount)
 
 
     def gotoVelocity(self, vel_az, vel_el):
@@ -269,26 +479,52 @@ class Mount(object):
 
         if 	(self.azimuth.state == AxisState.IDLE or self.azimuth.state == AxisState.GOTO_VELOCITY) and \
             (self.elevation.state == AxisState.IDLE or self.elevation.state == AxisState.GOTO_VELOCITY):
-            self.azimuth.gotoVelocity(vel_az)
-            self.elevation.gotoVelocity(vel_el)
-            time.sleep(2)
+            response_azimuth = self.azimuth.gotoVelocity(vel_az)
+            response_elevation = self.elevation.gotoVelocity(vel_el)
+
+            # the responses complete once the axes are in GOTO_VELOCITY
+            response_azimuth = response_azimuth.result()
+            response_elevation = response_elevation.result()
+            if not (response_azimuth["success"] and response_elevation["success"]):
+                raise MountException("Encountered exception during axis commanding: response_azimuth {} response_elevation {}".format(response_azimuth, response_elevation))
 
     def setPosition(self, az, el):
-        self.azimuth.setPosition(az)
-        self.elevation.setPosition(el)
-        time.sleep(2)
+        responses = self.azimuth.setPosition(az) + self.elevation.setPosition(el)
+
+        failed = [response for response in (response.result() for response in responses) if not response["success"]]
+        if failed != []:
+            raise MountException("Encountered exception during axis commanding: {}".format(failed))
 
     def startTracking(self):
         """Command the mount to start tracking
+
+        The cable wrap of the whole remaining pass is planned first and locked for the pass, so the
+        azimuth axis never has to unwind in the middle of a pass. The lock is only taken when the
+        mount actually starts tracking.
         """		
 
         if self.parent.object.objectLoaded():
 
-            object_az, object_el = self.parent.object.getPosition()
+            # right after loading an object the producer has not published its first sample yet
+            snapshot = self.parent.object.getSnapshot()
+            if snapshot == None:
+                logging.warning("No ephemeris of the object available yet, not starting to track")
+                return
+
+            object_az, object_el = snapshot.azimuth, snapshot.elevation
+
+            wrap_az = self.parent.object.planWrap(self.azimuth.config["limit_min"], self.azimuth.config["limit_max"], reference=self.azimuth.pos_mount_degrees, lock=False)
+            if wrap_az != None:
+                object_az = wrap_az
+            else:
+                logging.warning("No cable wrap keeps the pass within the azimuth limits, using incremental unwrapping")
         
             if 	self.azimuth.state == AxisState.IDLE and self.elevation.state == AxisState.IDLE and \
-                object_az > self.azimuth.config["f_limit_min"] and object_az < self.azimuth.config["f_limit_max"] and \
-                object_el > self.elevation.config["f_limit_min"] and object_el < self.elevation.config["f_limit_max"]:
+                object_az > self.azimuth.config["limit_min"] and object_az < self.azimuth.config["limit_max"] and \
+                object_el > self.elevation.config["limit_min"] and object_el < self.elevation.config["limit_max"]:
+
+                if wrap_az != None:
+                    self.parent.object.lockWrap(wrap_az)
 
                 self.azimuth.startTracking()
                 self.elevation.startTracking()
@@ -307,29 +543,79 @@ class Mount(object):
         self.azimuth.setPidOffAxisLoop(p, i, d)
         self.elevation.setPidOffAxisLoop(p, i, d)       
 
+    def setFeedforward(self, kv, ka):
+        self.azimuth.setFeedforward(kv, ka)
+        self.elevation.setFeedforward(kv, ka)
+
+    def getLatency(self):
+        return {
+                    "azimuth" : self.azimuth.getLatency(),
+                    "elevation" : self.elevation.getLatency()
+                }
+
+    def resetLatency(self):
+        self.azimuth.resetLatency()
+        self.elevation.resetLatency()
+
     def abort(self):
+        self.calibrating = False
+        self.parent.object.unlockWrap()
         response_azimuth = self.azimuth.abort()
         response_elevation = self.elevation.abort()
-        time.sleep(2)	
+        response_azimuth = response_azimuth.result()
+        response_elevation = response_elevation.result()
 
         if response_azimuth["success"] and response_elevation["success"]:
             # wait until both axis are at IDLE again before releasing the job
-            while self.azimuth.state != AxisState.IDLE or self.elevation.state != AxisState.IDLE:
-                time.sleep(1)
+            self.__waitForState((AxisState.IDLE,), self.config["settle_timeout"])
         else:
             raise MountException("Encountered exception during axis commanding: response_azimuth {} response_elevation {}".format(response_azimuth, response_elevation))		
 
 
+    def exportTelemetry(self, t_start=None, t_stop=None, format="npy"):
+        """Write the per-tick telemetry of both axes to the telemetry directory, one file per axis
+
+        Arguments:
+        t_start -- start of the time range (UNIX time, datetime or ISO string in UTC), from the oldest record when None
+        t_stop -- end of the time range, up to the latest record when None
+        format -- npy (NumPy structured array) or parquet (requires pyarrow)
+
+        The records are copied out of the ring buffers of the axes, the control loops keep running.
+        """
+        try:
+            t_start = parseTime(t_start)
+            t_stop = parseTime(t_stop)
+
+            os.makedirs(self.config["telemetry_dir"], exist_ok=True)
+            formatted_timestamp = datetime.datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+
+            files = {}
+            records = {}
+            for axis in (self.azimuth, self.elevation):
+                data = axis.telemetry.read(t_start, t_stop)
+                filename = os.path.join(self.config["telemetry_dir"], "{}_{}.{}".format(formatted_timestamp, axis.name, format))
+                exportTelemetry(data, filename, format)
+
+                files[axis.name] = filename
+                records[axis.name] = len(data)
+
+            logging.info("Exported telemetry {}".format(records))
+            return {"success": True, "files": files, "records": records}
+
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
     def getStatus(self):
         return {
-                    "azimuth" : self.azimuth.status,
-                    "elevation" : self.elevation.status
+                    "azimuth" : self.azimuth.getStatus(),
+                    "elevation" : self.elevation.getStatus()
                 }
 
 
     def stop(self):
         self.azimuth.stop()
         self.elevation.stop()
+        self.running = False
         self.interface0.close()
         self.interface1.close()
 
@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 
+import collections
+import itertools
+import os
 import threading
 import time
 import datetime
@@ -8,6 +11,30 @@ import logging
 import ephem
 from core.timer import CustomTimer
 from core.axis import AxisType
+from core.trajectory import TrajectoryCache
+from core.benchmark import callsPerSecond
+from core.passes import PassPredictor
+from core.catalog import TleCatalog
+from core.stars import StarIndex
+from core.wrap import planWrap
+from core.ephemeris_table import EphemerisTable
+
+
+EphemerisSnapshot = collections.namedtuple("EphemerisSnapshot", [
+                                                "timestamp",
+                                                "time",
+                                                "azimuth",
+                                                "elevation",
+                                                "ra",
+                                                "dec",
+                                                "azimuth_rate",
+                                                "elevation_rate",
+                                                "azimuth_acceleration",
+                                                "elevation_acceleration",
+                                                "west_east_correction_active",
+                                                "east_west_correction_active",
+                                                "wrap_locked"
+                                            ])
 
 
 class Object():
@@ -21,34 +48,197 @@ class Object():
         self.name = self.config["name"]
 
         self.object = None 
-        self.azimuth = 0.0
-        self.elevation = 0.0
-        self.ra = 0.0
-        self.dec = 0.0
+        self.table_active = False # tracking the uploaded ephemeris table instead of an ephem body
+        self.object_generation = 0 # incremented whenever a new object is loaded
+
+        # immutable ephemeris sample of the current control tick, replaced as a whole by the producer
+        self.snapshot = None
+        self.snapshot_mutex = threading.Lock() # the axis threads produce their own ticks in the axis control mode
+
+        # cable wrap lock requested for the current pass, applied by the ephemeris producer
+        self.wrap_azimuth = None
+        self.wrap_generation = 0
 
+        # azimuth unwrap state, only touched by the ephemeris producer
+        self.producer_generation = 0
+        self.producer_wrap_generation = 0
         self.__reset()
 
         self.observer = ephem.Observer()
+
+        # sliding window of interpolated trajectory, avoids an ephem computation on every control tick
+        self.trajectory = TrajectoryCache(self.parent.config["mount"], window=self.config["trajectory_window"], step=self.config["trajectory_step"])
+
+        # indexed TLE catalog, loaded from the configured TLE file if present
+        self.catalog = TleCatalog()
+        if os.path.exists(self.config["tle_file"]):
+            self.catalog.ingestFile(self.config["tle_file"])
+
+        mount_config = self.parent.config["mount"]
+
+        # precomputed index of the ephem star catalogue for calibration and focus star queries
+        self.star_index = StarIndex(mount_config["lat"], mount_config["lon"], index_file=self.config["star_index_file"])
+
+        # batch pass prediction for the satellites in the catalog
+        self.pass_predictor = PassPredictor(mount_config["lat"], mount_config["lon"], mount_config["alt"], cache_file=self.config["passes_cache_file"], step=self.config["passes_step"])
+
+        # externally computed ephemeris, uploaded in chunks and tracked by interpolation
+        self.table = EphemerisTable(mount_config["lat"], mount_config["lon"])
+
         self.publish_timer = CustomTimer(self.config["publish_interval"], self.__publishTask).start()
 
     
     def setTLE(self, name, l1, l2):
-        self.object = ephem.readtle(name, l1, l2)
-        self.__reset()
+        self.__setObject(ephem.readtle(name, l1, l2))
+
+    def setCatalogObject(self, norad):
+        """Select a satellite of the TLE catalog by NORAD id
+        """
+        try:
+            self.__setObject(self.catalog.getBody(norad))
+            return {"success": True, "message": ""}
+        except Exception as e:
+            self.__setObject(None)
+            return {"success": False, "message": str(e)}
+
+    def ingestCatalog(self, filename=None):
+        """(Re-)ingest a TLE file into the catalog, only changed records are applied
+        """
+        try:
+            result = self.catalog.ingestFile(filename if filename != None else self.config["tle_file"])
+            return {"success": True, **result}
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+    def getCatalogStatus(self):
+        return self.catalog.getStatus()
+
+    def benchmarkCatalog(self, filename=None):
+        return self.catalog.benchmark(filename)
+
+    def beginTable(self, name, frame="azel"):
+        """Start the upload of an ephemeris table, frame is "azel" or "radec" (topocentric, of date)
+        """
+        try:
+            self.table.begin(name, frame)
+            return {"success": True, "message": ""}
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+    def appendTable(self, rows):
+        """Append a chunk of [UNIX time, az, el] or [UNIX time, ra, dec] rows in degrees to the upload
+        """
+        try:
+            return {"success": True, "staged": self.table.append(rows)}
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+    def commitTable(self, select=True):
+        """Finish the upload and optionally track the table right away
+        """
+        try:
+            result = self.table.commit()
+            if select:
+                self.__setObject(None, table_active=True)
+            return {"success": True, **result}
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+    def getTableStatus(self):
+        return self.table.getStatus()
+
+    def __setObject(self, body, table_active=False):
+        self.trajectory.load(body)
+        self.object = body
+        self.table_active = table_active
+        self.snapshot = None
+        self.unlockWrap()
+
+        # signal the producer to reset its unwrap state
+        self.object_generation += 1
 
     def __reset(self):
         self.east_west_correction_active = False
         self.west_east_correction_active = False
+        self.wrap_locked = False
         self.azimuth_previous = 180.0
 
+    def planWrap(self, limit_min, limit_max, reference=None, lock=True):
+        """Plan the cable wrap for the remainder of the current pass and lock it (unless lock is False)
+
+        The pass is sampled from now until the object sets (at most wrap_plan_horizon seconds) and shifted
+        by the multiple of 360 degrees that keeps it within the azimuth limits, closest to the reference
+        (current mount) azimuth. Until the lock is released the azimuth is unwrapped continuously instead
+        of by the incremental 350/5 degree correction.
+
+        Returns the planned (unwrapped) azimuth of the object now, or None if no wrap avoids a limit crossing.
+        """
+        body = self.object
+        step = self.config["wrap_plan_step"]
+        offsets = np.arange(int(self.config["wrap_plan_horizon"] / step) + 1) * step
+
+        if self.table_active:
+            az, el = self.table.sample(time.time() + offsets)
+        elif body != None:
+            az, el, ra, dec = self.trajectory.sample(body.copy(), self.trajectory.getObserver(), ephem.now() + offsets / 86400.0)
+        else:
+            return None
+
+        # only the part of the pass until the object sets is relevant
+        setting = np.nonzero(el[1:] < 0.0)[0]
+        if len(setting) > 0:
+            az = az[:setting[0] + 1]
+
+        offsets, start = planWrap(az[np.newaxis, :], limit_min, limit_max, reference)
+
+        if np.isnan(start[0]):
+            return None
+
+        if lock:
+            self.lockWrap(float(start[0]))
+        return float(start[0])
+
+    def lockWrap(self, azimuth):
+        """Lock the azimuth unwrap to the branch containing the given (unwrapped) azimuth
+        """
+        self.wrap_azimuth = azimuth
+        self.wrap_generation += 1
+
+    def unlockWrap(self):
+        self.wrap_azimuth = None
+        self.wrap_generation += 1
+
+    def planPassWraps(self, start=None, hours=12.0, min_elevation=10.0, samples=60):
+        """Predict the passes of the catalog and plan the cable wrap of all of them in one vectorised call
+        """
+        result = self.getPasses(start, hours, min_elevation)
+        if not result["success"] or result["passes"] == []:
+            return result
+
+        try:
+            passes = result["passes"]
+            limits = self.parent.config["mount"]["azimuth"]
+
+            tles = [self.catalog.getTLE(p["norad"]) for p in passes]
+            az, el = self.pass_predictor.track(tles, [p["rise"] for p in passes], [p["set"] for p in passes], samples)
+            offsets, start_azimuth = planWrap(az, limits["limit_min"], limits["limit_max"])
+
+            for p, offset, azimuth in zip(passes, offsets, start_azimuth):
+                p["wrap_offset"] = float(offset) if np.isfinite(offset) else None
+                p["wrap_start_azimuth"] = float(azimuth) if np.isfinite(azimuth) else None
+
+            return result
+
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
     def setBody(self, name):
         try:
             object = getattr(ephem, name)
-            self.object = object()
-            self.__reset()
+            self.__setObject(object())
             return {"success": True, "message": ""}
         except Exception as e:
-            self.object = None
+            self.__setObject(None)
             return {"success": False, "message": str(e)}
 
     def getBodies(self):
@@ -56,36 +246,116 @@ class Object():
 
     def setStar(self, name):
         try:
-            self.object = ephem.star(name)
-            self.__reset()
+            self.__setObject(ephem.star(name))
             return {"success": True, "message": ""}
         except Exception as e:
-            self.object = None
+            self.__setObject(None)
             return {"success": False, "message": str(e)}
         
     def getStars(self):
-        return [star.split(",")[0] for star in ephem.stars.db.split("\n")]
+        return self.star_index.getNames()
+
+    def getBrightestStars(self, az, el, radius=180.0, min_elevation=30.0, n=5):
+        """Return the n brightest catalogued stars above min_elevation within radius degrees of (az, el)
+        """
+        return {"success": True, "stars": self.star_index.brightest(az, el, radius, min_elevation, n)}
+
+    def getNearestStar(self, az=None, el=None, min_elevation=0.0):
+        """Return the catalogued star nearest to (az, el), by default the current celestial pointing of the mount
+        """
+        if az == None or el == None:
+            az = self.parent.mount.azimuth.pos_celestial_degrees
+            el = self.parent.mount.elevation.pos_celestial_degrees
+
+        star = self.star_index.nearest(az, el, min_elevation)
+        if star != None:
+            return {"success": True, "star": star}
+        else:
+            return {"success": False, "message": "no star above the requested elevation"}
+
+
+    def getPasses(self, start=None, hours=12.0, min_elevation=10.0):
+        """Predict the passes of all satellites in the TLE catalog
+
+        Arguments:
+        start -- UTC start of the prediction window (datetime or ISO string), defaults to now
+        hours -- length of the prediction window in hours
+        min_elevation -- elevation mask in degrees
+
+        Rise, culmination and set times are returned as UNIX timestamps.
+        """
+        try:
+            if start == None:
+                start = datetime.datetime.utcnow()
+            elif isinstance(start, str):
+                start = datetime.datetime.fromisoformat(start)
+
+            passes = self.pass_predictor.predict(self.catalog.getTLEs(), start, hours * 3600.0, min_elevation)
+            return {"success": True, "passes": passes, **self.pass_predictor.getStatus()}
+
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+    def updateSnapshot(self, t):
+        """Produce the ephemeris snapshot of the control tick at UNIX time t and return it, None without an object
+
+        Called by the control loop at every tick: once for both axes in the mount control mode, by every axis
+        for its own tick in the axis control mode. A snapshot of the same tick time is computed only once.
+        The producer is the only writer of the azimuth unwrap state, the telemetry reads the latest snapshot.
+        """
+        with self.snapshot_mutex:
+            snapshot = self.snapshot
+            if snapshot != None and snapshot.time == t:
+                return snapshot
+            return self.__produceSnapshot(t)
+
+    def __produceSnapshot(self, t):
+        # read the generation before the body, a concurrent load is then detected on the next tick at the latest
+        generation = self.object_generation
+        body = self.object
+        table_active = self.table_active
+
+        if body == None and not table_active:
+            return None
 
+        if generation != self.producer_generation:
+            self.producer_generation = generation
+            self.__reset()
+
+        # apply a new cable wrap lock (or release)
+        wrap_generation = self.wrap_generation
+        if wrap_generation != self.producer_wrap_generation:
+            self.producer_wrap_generation = wrap_generation
+            wrap_azimuth = self.wrap_azimuth
+            self.wrap_locked = wrap_azimuth != None
+            self.west_east_correction_active = False
+            self.east_west_correction_active = False
+            if self.wrap_locked:
+                self.azimuth_previous = wrap_azimuth
 
-    def getPosition(self, t=None):
-        if self.object != None:
-            if t != None:
-                self.observer.date = t
-            else:
-                self.observer.date = datetime.datetime.utcnow()
+        timestamp = datetime.datetime.utcfromtimestamp(t)
+        date = ephem.Date(timestamp)
 
-            self.observer.lat = self.parent.mount.config["lat"] * ephem.degree
-            self.observer.lon = self.parent.mount.config["lon"] * ephem.degree
-            self.observer.elevation = self.parent.mount.config["alt"]
+        if table_active:
+            sample = self.table.evaluate(t)
+        else:
+            sample = self.trajectory.evaluate(date)
 
-            self.object.compute(self.observer)
+        if sample != None:
+            # interpolate the precomputed trajectory
+            azimuth_unwrapped, elevation, ra_unwrapped, dec, azimuth_rate, elevation_rate, azimuth_acceleration, elevation_acceleration = sample
+            azimuth = azimuth_unwrapped % 360.0 # not the final azimuth
+            ra = ra_unwrapped % 360.0
+        else:
+            # cache not (yet) available, fall back to a direct computation without rates
+            azimuth, elevation, ra, dec = self.computePosition(body, date)
+            azimuth_rate = elevation_rate = azimuth_acceleration = elevation_acceleration = 0.0
 
-            # fetch object attributes
-            azimuth = np.degrees(self.object.az) # not the final azimuth
-            self.elevation = np.degrees(self.object.alt)
-            self.ra = np.degrees(self.object.ra)
-            self.dec = np.degrees(self.object.dec)
+        if self.wrap_locked:
+            # continuous unwrap on the branch planned for this pass
+            azimuth = self.azimuth_previous + ((azimuth - self.azimuth_previous + 180.0) % 360.0 - 180.0)
 
+        else:
             # determine azimuth correction
             if  self.azimuth_previous > 350.0 and azimuth < 5.0:
                 self.west_east_correction_active = True
@@ -96,18 +366,101 @@ class Object():
 
             # apply azimuth correction
             if self.west_east_correction_active:
-                self.azimuth = azimuth + 360.0
+                azimuth = azimuth + 360.0
             elif self.east_west_correction_active:
-                self.azimuth = azimuth - 360.0
-            else:
-                self.azimuth = azimuth   
+                azimuth = azimuth - 360.0
+
+        self.azimuth_previous = azimuth
+
+        # drop the sample if another object was loaded while computing it
+        if generation == self.object_generation:
+            self.snapshot = EphemerisSnapshot(
+                                                timestamp=timestamp,
+                                                time=t,
+                                                azimuth=azimuth,
+                                                elevation=elevation,
+                                                ra=ra,
+                                                dec=dec,
+                                                azimuth_rate=azimuth_rate,
+                                                elevation_rate=elevation_rate,
+                                                azimuth_acceleration=azimuth_acceleration,
+                                                elevation_acceleration=elevation_acceleration,
+                                                west_east_correction_active=self.west_east_correction_active,
+                                                east_west_correction_active=self.east_west_correction_active,
+                                                wrap_locked=self.wrap_locked
+                                            )
+            return self.snapshot
 
-            self.azimuth_previous = self.azimuth
+        return None
 
-            return self.azimuth, self.elevation 
+    def getSnapshot(self):
+        """Return the latest ephemeris snapshot, or None when no object is loaded (yet)
+        """
+        return self.snapshot
+
+    def getPosition(self):
+        snapshot = self.snapshot
+        if snapshot != None:
+            return snapshot.azimuth, snapshot.elevation
         else:
             return 0.0, 0.0
 
+    def computePosition(self, body, date):
+        """Compute az, el, ra, dec in degrees directly with ephem, azimuth in the range 0..360
+        """
+        self.observer.date = date
+        self.observer.lat = self.parent.mount.config["lat"] * ephem.degree
+        self.observer.lon = self.parent.mount.config["lon"] * ephem.degree
+        self.observer.elevation = self.parent.mount.config["alt"]
+
+        body.compute(self.observer)
+
+        return np.degrees(body.az), np.degrees(body.alt), np.degrees(body.ra), np.degrees(body.dec)
+
+    def validateTrajectory(self, samples=100):
+        """Compare the interpolated trajectory against a direct ephem evaluation and benchmark both methods
+
+        Returns a dict with the maximum interpolation errors in arcseconds and the achieved calls/second
+        """
+        if self.object == None:
+            return {"success": False, "message": "no object loaded"}
+
+        segment = self.trajectory.segment
+        if segment == None:
+            return {"success": False, "message": "no trajectory available"}
+
+        body = self.object.copy()
+        observer = self.trajectory.getObserver()
+        times = np.random.uniform(segment.t0, segment.t1, samples)
+        az, el, ra, dec = self.trajectory.sample(body, observer, times)
+
+        interpolated = np.array([segment.evaluate(t)[:4] for t in times])
+
+        # reduce the azimuth error to the shortest angular distance
+        error_az = np.abs((interpolated[:, 0] - az + 180.0) % 360.0 - 180.0) * 3600.0
+        error_el = np.abs(interpolated[:, 1] - el) * 3600.0
+
+        # cycle through the sample times, ephem only computes lazily when the attributes are read
+        cycle = itertools.cycle(times)
+
+        def direct():
+            observer.date = next(cycle)
+            body.compute(observer)
+            return body.az, body.alt
+
+        calls_direct = callsPerSecond(direct, duration=0.5)
+        calls_interpolated = callsPerSecond(lambda: segment.evaluate(next(cycle)), duration=0.5)
+
+        return {
+                    "success" : True,
+                    "samples" : samples,
+                    "max_error_az_arcsec" : float(np.max(error_az)),
+                    "max_error_az_sky_arcsec" : float(np.max(error_az * np.cos(np.radians(el)))),
+                    "max_error_el_arcsec" : float(np.max(error_el)),
+                    "calls_per_second_direct" : calls_direct,
+                    "calls_per_second_interpolated" : calls_interpolated
+                }
+
     def getPositionAxis(self, axis):
         az, el = self.getPosition()
         if axis == AxisType.AZIMUTH:
@@ -116,25 +469,39 @@ class Object():
             return el
 
     def objectLoaded(self):
-        if self.object != None:
+        if self.object != None or self.table_active:
             return True
         else:
             return False
 
 
     def getStatus(self):
+        body = self.object
+        snapshot = self.snapshot
+
+        if body != None:
+            name = body.name
+        elif self.table_active:
+            name = self.table.name
+        else:
+            name = ""
+
         return {
-                    "name" : self.object.name if self.object != None else "",
-                    "azimuth" : self.azimuth,
-                    "elevation" : self.elevation,
-                    "west_east_correction_active" : 1 if self.west_east_correction_active else 0,
-                    "east_west_correction_active" : 1 if self.east_west_correction_active else 0,
-                    "ra" : self.ra,
-                    "dec" : self.dec
+                    "name" : name,
+                    "azimuth" : snapshot.azimuth if snapshot != None else 0.0,
+                    "elevation" : snapshot.elevation if snapshot != None else 0.0,
+                    "azimuth_rate" : snapshot.azimuth_rate if snapshot != None else 0.0,
+                    "elevation_rate" : snapshot.elevation_rate if snapshot != None else 0.0,
+                    "west_east_correction_active" : 1 if snapshot != None and snapshot.west_east_correction_active else 0,
+                    "east_west_correction_active" : 1 if snapshot != None and snapshot.east_west_correction_active else 0,
+                    "wrap_locked" : 1 if snapshot != None and snapshot.wrap_locked else 0,
+                    "ra" : snapshot.ra if snapshot != None else 0.0,
+                    "dec" : snapshot.dec if snapshot != None else 0.0,
+                    **self.trajectory.getStatus(),
+                    **self.table.getStatus()
                 }
 
     def __publishTask(self):
-        self.getPosition()
         current_status = self.getStatus()
         self.parent.telegraf.metric(self.name, current_status)
 
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
+
+from sgp4.api import Satrec, SatrecArray
+
+
+class PassPredictionException(Exception):
+    pass
+
+
+# WGS84 ellipsoid
+WGS84_A = 6378.137 # km
+WGS84_F = 1.0 / 298.257223563
+
+UNIX_EPOCH_JD = 2440587.5
+
+
+def observerEcef(lat, lon, alt):
+    """Geodetic observer position (degrees, degrees, metres) to ECEF in km
+    """
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    alt = alt / 1000.0
+
+    e2 = WGS84_F * (2.0 - WGS84_F)
+    n = WGS84_A / np.sqrt(1.0 - e2 * np.sin(lat)**2)
+
+    x = (n + alt) * np.cos(lat) * np.cos(lon)
+    y = (n + alt) * np.cos(lat) * np.sin(lon)
+    z = (n * (1.0 - e2) + alt) * np.sin(lat)
+
+    return np.array([x, y, z])
+
+
+def gmst(jd, fr):
+    """Greenwich mean sidereal time in radians (IAU 1982), UT1 is approximated by UTC
+    """
+    t = ((jd - 2451545.0) + fr) / 36525.0
+    seconds = 67310.54841 + (876600.0 * 3600.0 + 8640184.812866) * t + 0.093104 * t**2 - 6.2e-6 * t**3
+    return np.mod(np.radians(seconds / 240.0), 2.0 * np.pi)
+
+
+def gast(jd, fr):
+    """Greenwich apparent sidereal time in radians, the mean sidereal time plus the equation of the equinoxes
+
+    The nutation in longitude comes from its four largest terms (Meeus, Astronomical Algorithms ch. 22),
+    good to about 0.5 arcseconds.
+    """
+    t = ((jd - 2451545.0) + fr) / 36525.0
+    node = np.radians(125.04452 - 1934.136261 * t) # longitude of the ascending node of the Moon
+    sun = np.radians(280.4665 + 36000.7698 * t) # mean longitudes of the Sun and the Moon
+    moon = np.radians(218.3165 + 481267.8813 * t)
+
+    nutation = -17.20 * np.sin(node) - 1.32 * np.sin(2.0 * sun) - 0.23 * np.sin(2.0 * moon) + 0.21 * np.sin(2.0 * node)
+    obliquity = np.radians(23.4392911 - 0.0130042 * t)
+
+    return np.mod(gmst(jd, fr) + np.radians(nutation * np.cos(obliquity) / 3600.0), 2.0 * np.pi)
+
+
+def temeToAzEl(r, jd, fr, lat, lon, site):
+    """Convert TEME positions to topocentric azimuth/elevation in degrees
+
+    Arguments:
+    r -- array (..., 3) of TEME positions in km, the time axis is the second to last axis of r[..., 0]
+    jd, fr -- julian dates broadcastable against r[..., 0]
+    lat, lon -- observer geodetic coordinates in degrees
+    site -- observer ECEF position in km
+    """
+
+    theta = gmst(jd, fr)
+    cos_t = np.cos(theta)
+    sin_t = np.sin(theta)
+
+    # rotate TEME into the earth fixed frame (polar motion neglected)
+    x = cos_t * r[..., 0] + sin_t * r[..., 1] - site[0]
+    y = -sin_t * r[..., 0] + cos_t * r[..., 1] - site[1]
+    z = r[..., 2] - site[2]
+
+    phi = np.radians(lat)
+    lam = np.radians(lon)
+
+    east = -np.sin(lam) * x + np.cos(lam) * y
+    north = -np.sin(phi) * np.cos(lam) * x - np.sin(phi) * np.sin(lam) * y + np.cos(phi) * z
+    up = np.cos(phi) * np.cos(lam) * x + np.cos(phi) * np.sin(lam) * y + np.sin(phi) * z
+
+    az = np.degrees(np.arctan2(east, north)) % 360.0
+    el = np.degrees(np.arctan2(up, np.hypot(east, north)))
+
+    return az, el
+
+
+def hermitePosition(t, t0, t1, r0, v0, r1, v1):
+    """Cubic Hermite interpolation of TEME positions (km) from the positions and velocities (km/s) at t0 and t1, per row
+    """
+    h = (t1 - t0)[..., np.newaxis]
+    s = ((t - t0) / (t1 - t0))[..., np.newaxis]
+    return (2.0 * s**3 - 3.0 * s**2 + 1.0) * r0 + (s**3 - 2.0 * s**2 + s) * h * v0 + (3.0 * s**2 - 2.0 * s**3) * r1 + (s**3 - s**2) * h * v1
+
+
+class PassPredictor():
+    """Batch pass prediction for large sets of TLEs.
+
+    All satellites of a block are propagated on a common time grid with the vectorised SGP4 of the
+    sgp4 package. Horizon crossings and culminations are located on the grid and refined in windows
+    of one (two) grid steps sampled every refine_step seconds, the satellites sharing a window are
+    propagated with one SatrecArray call. Within the window samples the crossing is found by regula
+    falsi and the culmination by parabolic interpolation on the Hermite interpolated positions.
+    Results are cached on disk per satellite, keyed by the TLE epoch, the observer and the elevation
+    mask.
+
+    A pass is only found when at least one grid sample is above the mask: every pass longer than step
+    seconds is found, shorter (grazing) passes only when they happen to contain a grid sample.
+    """
+
+    def __init__(self, lat, lon, alt, cache_file=None, step=60.0, block_size=500, refine_step=5.0):
+        self.lat = lat
+        self.lon = lon
+        self.alt = alt
+        self.site = observerEcef(lat, lon, alt)
+
+        self.step = step
+        self.block_size = block_size
+        self.refine_step = refine_step
+
+        self.cache_file = cache_file
+        self.cache = {}
+        self.mutex = threading.Lock()
+
+        self.last_prediction_time = 0.0
+        self.last_propagated = 0
+        self.last_cached = 0
+
+        self.__loadCache()
+
+    def __loadCache(self):
+        if self.cache_file != None and os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, "r") as f:
+                    self.cache = json.load(f)
+            except Exception as e:
+                logging.warning("Could not load pass cache {}: {}".format(self.cache_file, e))
+                self.cache = {}
+
+    def __saveCache(self):
+        if self.cache_file != None:
+
+            # drop predictions for windows that ended more than a day ago
+            expired = time.time() - 86400.0
+            self.cache = {key : entry for key, entry in self.cache.items() if entry["stop"] > expired}
+
+            try:
+                # write to a temporary file first so a crash never leaves a corrupt cache behind
+                tmp = self.cache_file + ".tmp"
+                with open(tmp, "w") as f:
+                    json.dump(self.cache, f)
+                os.replace(tmp, self.cache_file)
+            except Exception as e:
+                logging.warning("Could not save pass cache {}: {}".format(self.cache_file, e))
+
+    def __cacheKey(self, l1, min_elevation):
+        # line 1 columns 3-7 hold the catalog number, 19-32 the epoch
+        return "{}:{}:{:.4f}:{:.4f}:{:.1f}:{:.2f}".format(l1[2:7].strip(), l1[18:32].strip(), self.lat, self.lon, self.alt, min_elevation)
+
+    def predict(self, tles, start, duration, min_elevation=0.0):
+        """Predict all passes above min_elevation for a list of (name, line1, line2) tuples
+
+        Arguments:
+        tles -- iterable of (name, line1, line2)
+        start -- naive UTC datetime of the window start
+        duration -- window length in seconds
+        min_elevation -- elevation mask in degrees
+
+        Returns a list of pass dicts sorted by rise time. Passes shorter than the grid step may be missed.
+        """
+
+        t_start = time.perf_counter()
+        tles = list(tles)
+
+        start_unix = (start - datetime.datetime(1970, 1, 1)).total_seconds()
+        stop_unix = start_unix + duration
+
+        passes = []
+        pending = []
+
+        with self.mutex:
+            for name, l1, l2 in tles:
+                entry = self.cache.get(self.__cacheKey(l1, min_elevation))
+                if entry != None and entry["start"] <= start_unix and entry["stop"] >= stop_unix:
+                    passes += [p for p in entry["passes"] if p["set"] >= start_unix and p["rise"] <= stop_unix]
+                else:
+                    pending.append((name, l1, l2))
+
+        for i in range(0, len(pending), self.block_size):
+            block = pending[i:i + self.block_size]
+            block_passes = self.__predictBlock(block, start_unix, stop_unix, min_elevation)
+
+            with self.mutex:
+                for (name, l1, l2), satellite_passes in zip(block, block_passes):
+                    self.cache[self.__cacheKey(l1, min_elevation)] = {"start" : start_unix, "stop" : stop_unix, "passes" : satellite_passes}
+
+            passes += [p for satellite_passes in block_passes for p in satellite_passes]
+
+        if pending != []:
+            with self.mutex:
+                self.__saveCache()
+
+        self.last_prediction_time = time.perf_counter() - t_start
+        self.last_propagated = len(pending)
+        self.last_cached = len(tles) - len(pending)
+
+        logging.info("Predicted {} passes, {} satellites propagated in {:.2f} s".format(len(passes), len(pending), self.last_prediction_time))
+
+        return sorted(passes, key=lambda p: p["rise"])
+
+    def __predictBlock(self, block, start_unix, stop_unix, min_elevation):
+
+        names = [name.strip() for name, l1, l2 in block]
+        satellites = [Satrec.twoline2rv(l1, l2) for name, l1, l2 in block]
+
+        # common time grid, the last sample always coincides with the end of the window
+        samples = int(np.ceil((stop_unix - start_unix) / self.step)) + 1
+        t = np.minimum(start_unix + np.arange(samples) * self.step, stop_unix)
+        jd = np.floor(t / 86400.0) + UNIX_EPOCH_JD
+        fr = t / 86400.0 - np.floor(t / 86400.0)
+
+        errors, r, v = SatrecArray(satellites).sgp4(jd, fr)
+        az, el = temeToAzEl(r, jd, fr, self.lat, self.lon, self.site)
+
+        # propagation errors (decayed satellites, ...) never count as visible
+        el = np.where(errors == 0, el, -90.0)
+        above = el >= min_elevation
+
+        # horizon crossings between sample i and i+1
+        crossing = above[:, 1:] != above[:, :-1]
+        sat_index, sample_index = np.nonzero(crossing)
+
+        rising = above[sat_index, sample_index + 1]
+        t_cross, az_cross = self.__refineCrossings(satellites, sat_index, t[sample_index], t[sample_index + 1], min_elevation)
+
+        # pair the (time, azimuth) of the rises and sets of every satellite, crossings are ordered by satellite and time
+        pass_sat, pass_rise, pass_set = [], [], []
+
+        for s in range(len(satellites)):
+            lo, hi = np.searchsorted(sat_index, [s, s + 1])
+            rises = [(t_cross[e], az_cross[e]) for e in range(lo, hi) if rising[e]]
+            sets = [(t_cross[e], az_cross[e]) for e in range(lo, hi) if not rising[e]]
+
+            # satellite already above the mask at the start of the window, or still above at the end
+            if above[s, 0]:
+                rises.insert(0, (start_unix, az[s, 0]))
+            if above[s, -1]:
+                sets.append((stop_unix, az[s, -1]))
+
+            pass_sat += [s] * len(sets)
+            pass_rise += rises
+            pass_set += sets
+
+        passes = [[] for _ in satellites]
+
+        if pass_sat != []:
+            pass_sat = np.array(pass_sat)
+            t_rise, az_rise = np.array(pass_rise, dtype=float).T
+            t_set, az_set = np.array(pass_set, dtype=float).T
+            descriptions = self.__describePasses(satellites, pass_sat, t, el[pass_sat], t_rise, t_set, az_rise, az_set)
+
+            for s, description in zip(pass_sat, descriptions):
+                description["name"] = names[s]
+                passes[s].append(description)
+
+        return passes
+
+    def __topocentric(self, satellites, t):
+        """Az/el of satellites[i] at time t[i] for arbitrary per-satellite times
+        """
+        jd = np.floor(t / 86400.0) + UNIX_EPOCH_JD
+        fr = t / 86400.0 - np.floor(t / 86400.0)
+
+        r = np.empty((len(satellites), 3))
+        for i, satellite in enumerate(satellites):
+            error, position, velocity = satellite.sgp4(jd[i], fr[i])
+            r[i] = position if error == 0 else np.nan
+
+        return temeToAzEl(r, jd, fr, self.lat, self.lon, self.site)
+
+    def __propagateWindows(self, satellites, sat_index, times):
+        """TEME positions and velocities of satellites[sat_index[k]] at the sample times of row k of times
+
+        Rows starting at the same time must hold the same sample times (windows on the grid), the satellites of
+        a window are propagated together with one SatrecArray call, so the number of calls is the number of
+        distinct windows and not the number of satellites. Failed propagations give NaN.
+        """
+        starts, group = np.unique(times[:, 0], return_inverse=True)
+        order = np.argsort(group, kind="stable")
+        bounds = np.searchsorted(group[order], np.arange(len(starts) + 1))
+
+        r = np.empty(times.shape + (3,))
+        v = np.empty(times.shape + (3,))
+
+        for j in range(len(starts)):
+            members = order[bounds[j]:bounds[j + 1]]
+            t = times[members[0]]
+            jd = np.floor(t / 86400.0) + UNIX_EPOCH_JD
+            fr = t / 86400.0 - np.floor(t / 86400.0)
+
+            errors, r_window, v_window = SatrecArray([satellites[i] for i in sat_index[members]]).sgp4(jd, fr)
+            failed = (errors != 0)[..., np.newaxis]
+            r[members] = np.where(failed, np.nan, r_window)
+            v[members] = np.where(failed, np.nan, v_window)
+
+        return r, v
+
+    def __interpolate(self, t, times, r, v):
+        """Az/el at time t[k] from the states propagated at the (evenly spaced) sample times of row k
+        """
+        rows = np.arange(len(t))
+        i = np.clip(np.floor((t - times[:, 0]) / (times[:, 1] - times[:, 0])).astype(int), 0, times.shape[1] - 2)
+        position = hermitePosition(t, times[rows, i], times[rows, i + 1], r[rows, i], v[rows, i], r[rows, i + 1], v[rows, i + 1])
+
+        jd = np.floor(t / 86400.0) + UNIX_EPOCH_JD
+        fr = t / 86400.0 - np.floor(t / 86400.0)
+        return temeToAzEl(position, jd, fr, self.lat, self.lon, self.site)
+
+    def __windowAzEl(self, times, r):
+        jd = np.floor(times / 86400.0) + UNIX_EPOCH_JD
+        fr = times / 86400.0 - np.floor(times / 86400.0)
+        return temeToAzEl(r, jd, fr, self.lat, self.lon, self.site)
+
+    def __refineCrossings(self, satellites, sat_index, t0, t1, min_elevation, iterations=4):
+        """Refine the horizon crossing times within the grid intervals [t0, t1], returns the times and azimuths
+
+        The interval is sampled every refine_step seconds, the crossing is then located by regula falsi on the
+        elevation above the mask between the two samples around it.
+        """
+
+        if len(sat_index) == 0:
+            return np.array([]), np.array([])
+
+        samples = int(np.ceil(self.step / self.refine_step)) + 1
+        times = t0[:, np.newaxis] + (t1 - t0)[:, np.newaxis] * np.linspace(0.0, 1.0, samples)
+        r, v = self.__propagateWindows(satellites, sat_index, times)
+        f = np.nan_to_num(self.__windowAzEl(times, r)[1] - min_elevation, nan=-90.0)
+
+        # first sample interval in which the visibility changes
+        rows = np.arange(len(sat_index))
+        above = f >= 0.0
+        i = np.argmax(above[:, 1:] != above[:, :1], axis=1)
+
+        lo, hi = times[rows, i], times[rows, i + 1]
+        f_lo, f_hi = f[rows, i], f[rows, i + 1]
+
+        for _ in range(iterations):
+            denominator = np.where(f_hi != f_lo, f_hi - f_lo, 1.0)
+            tm = np.clip(lo - f_lo * (hi - lo) / denominator, lo, hi)
+            fm = np.nan_to_num(self.__interpolate(tm, times, r, v)[1] - min_elevation, nan=-90.0)
+
+            # keep the bracket that still contains the sign change
+            left = np.sign(fm) == np.sign(f_lo)
+            lo = np.where(left, tm, lo)
+            f_lo = np.where(left, fm, f_lo)
+            hi = np.where(left, hi, tm)
+            f_hi = np.where(left, f_hi, fm)
+
+        t_cross = np.where(np.abs(f_lo) < np.abs(f_hi), lo, hi)
+        return t_cross, self.__interpolate(t_cross, times, r, v)[0]
+
+    def __describePasses(self, satellites, pass_sat, t, el, t_rise, t_set, az_rise, az_set):
+        """Locate the culminations of a batch of passes and describe them
+
+        Arguments:
+        satellites -- satellites of the block
+        pass_sat -- index of the satellite of every pass
+        t -- the common time grid
+        el -- elevation of the satellite of every pass on the time grid
+        t_rise, t_set, az_rise, az_set -- refined rise and set times and their azimuths of every pass
+        """
+
+        # coarse culmination on the grid, the true one lies within one grid step of it
+        inside = (t[np.newaxis, :] >= t_rise[:, np.newaxis]) & (t[np.newaxis, :] <= t_set[:, np.newaxis])
+        i = np.argmax(np.where(inside, el, -np.inf), axis=1)
+
+        first = np.clip(i - 1, 0, max(len(t) - 3, 0))
+        last = np.minimum(first + 2, len(t) - 1)
+        samples = 2 * int(np.ceil(self.step / self.refine_step)) + 1
+        times = t[first][:, np.newaxis] + (t[last] - t[first])[:, np.newaxis] * np.linspace(0.0, 1.0, samples)
+
+        r, v = self.__propagateWindows(satellites, pass_sat, times)
+        el_window = np.nan_to_num(self.__windowAzEl(times, r)[1], nan=-90.0)
+        el_window = np.where((times >= t_rise[:, np.newaxis]) & (times <= t_set[:, np.newaxis]), el_window, -np.inf)
+
+        rows = np.arange(len(pass_sat))
+        j = np.argmax(el_window, axis=1)
+        lower = np.maximum(t_rise, times[:, 0])
+        upper = np.minimum(t_set, times[:, -1])
+        t_culmination = np.where(np.isfinite(el_window[rows, j]), times[rows, j], np.clip((t_rise + t_set) / 2.0, lower, upper))
+
+        # successive parabolic refinements on a shrinking bracket around the culmination
+        h = times[:, 1] - times[:, 0]
+        for _ in range(4):
+            t_left = np.clip(t_culmination - h, lower, upper)
+            t_right = np.clip(t_culmination + h, lower, upper)
+            el_left = self.__interpolate(t_left, times, r, v)[1]
+            el_mid = self.__interpolate(t_culmination, times, r, v)[1]
+            el_right = self.__interpolate(t_right, times, r, v)[1]
+
+            denominator = el_left - 2.0 * el_mid + el_right
+            symmetric = (t_culmination - h >= lower) & (t_culmination + h <= upper) & (denominator < 0)
+            offset = np.clip(0.5 * (el_left - el_right) / np.where(symmetric, denominator, -1.0), -1.0, 1.0) * h
+
+            # near the rise, set or the edges of the window fall back to the best of the three samples
+            best = np.argmax(np.nan_to_num(np.column_stack((el_left, el_mid, el_right)), nan=-90.0), axis=1)
+            fallback = np.choose(best, [t_left, t_culmination, t_right])
+
+            t_culmination = np.where(symmetric, t_culmination + offset, fallback)
+            h = h / 4.0
+
+        t_culmination = np.clip(t_culmination, lower, upper)
+        az_culmination, el_culmination = self.__interpolate(t_culmination, times, r, v)
+
+        return [{
+                    "norad" : satellites[pass_sat[k]].satnum,
+                    "rise" : float(t_rise[k]),
+                    "rise_az" : float(az_rise[k]),
+                    "culmination" : float(t_culmination[k]),
+                    "culmination_az" : float(az_culmination[k]),
+                    "culmination_el" : float(el_culmination[k]),
+                    "set" : float(t_set[k]),
+                    "set_az" : float(az_set[k])
+                } for k in range(len(pass_sat))]
+
+    def track(self, tles, t_start, t_stop, samples=60):
+        """Sample the az/el track of a batch of passes
+
+        Arguments:
+        tles -- (name, line1, line2) of every pass
+        t_start, t_stop -- arrays of UNIX start and stop times of every pass
+        samples -- number of samples per pass
+
+        Returns az, el arrays of shape (passes, samples) in degrees.
+        """
+        satellites = [Satrec.twoline2rv(l1, l2) for name, l1, l2 in tles]
+        t_start = np.asarray(t_start, dtype=float)
+        t_stop = np.asarray(t_stop, dtype=float)
+
+        az = np.empty((len(satellites), samples))
+        el = np.empty((len(satellites), samples))
+
+        for j, fraction in enumerate(np.linspace(0.0, 1.0, samples)):
+            az[:, j], el[:, j] = self.__topocentric(satellites, t_start + fraction * (t_stop - t_start))
+
+        return az, el
+
+    def getStatus(self):
+        return {
+                    "prediction_time" : self.last_prediction_time,
+                    "propagated" : self.last_propagated,
+                    "cached" : self.last_cached,
+                    "cache_entries" : len(self.cache)
+                }
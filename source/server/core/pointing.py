@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import array
+import math
+import numpy as np
+
+
+class PointingTable():
+    """Pointing model compiled into dense az/el correction grids.
+
+    The corrections of the forward (celestial -> mount, katpoint apply) and the inverse direction (mount ->
+    celestial, the iterative katpoint reverse) are tabulated once on a regular grid of step degrees and
+    interpolated bilinearly. The model is periodic in azimuth, so the grid covers 0..360 degrees and the
+    corrections are added to the unwrapped input azimuth. Elevations outside the grid get the corrections
+    of its edge; the grid stops at el_max because the tan(el) terms of the model diverge at the zenith.
+
+    apply() and reverse() take scalars or arrays in degrees. Scalars go through a pure Python path on flat
+    copies of the grids, so a control tick costs a few lookups instead of an iterative solve.
+    """
+
+    def __init__(self, model, step=0.5, el_min=-5.0, el_max=89.0):
+        self.step = step
+        self.el_min = el_min
+
+        self.n_az = int(round(360.0 / step)) + 1
+        self.n_el = int(math.floor((el_max - el_min) / step)) + 1
+        self.el_max = el_min + (self.n_el - 1) * step
+
+        az, el = np.meshgrid(np.arange(self.n_az) * step, el_min + np.arange(self.n_el) * step, indexing="ij")
+
+        # corrections in degrees, indexed [az, el]
+        az_rad, el_rad = model.apply(np.radians(az), np.radians(el))
+        self.forward_az, self.forward_el = self.__corrections(az, el, az_rad, el_rad)
+
+        az_rad, el_rad = model.reverse(np.radians(az), np.radians(el))
+        self.reverse_az, self.reverse_el = self.__corrections(az, el, az_rad, el_rad)
+
+        # indexing a flat array returns a Python float, much cheaper than a NumPy scalar
+        self.flat_forward = (array.array("d", self.forward_az.ravel()), array.array("d", self.forward_el.ravel()))
+        self.flat_reverse = (array.array("d", self.reverse_az.ravel()), array.array("d", self.reverse_el.ravel()))
+
+    @staticmethod
+    def __corrections(az, el, az_rad, el_rad):
+        # azimuth corrections are small, any wrap of the model output is undone
+        d_az = (np.degrees(az_rad) - az + 180.0) % 360.0 - 180.0
+        d_el = np.degrees(el_rad) - el
+        return d_az, d_el
+
+    def __interpolateScalar(self, flat, az, el):
+        flat_az, flat_el = flat
+
+        x = (az % 360.0) / self.step
+        y = (min(max(el, self.el_min), self.el_max) - self.el_min) / self.step
+        i = min(int(x), self.n_az - 2)
+        j = min(int(y), self.n_el - 2)
+        fx = x - i
+        fy = y - j
+
+        w00 = (1.0 - fx) * (1.0 - fy)
+        w10 = fx * (1.0 - fy)
+        w01 = (1.0 - fx) * fy
+        w11 = fx * fy
+
+        n = self.n_el
+        k = i * n + j
+        d_az = w00 * flat_az[k] + w10 * flat_az[k + n] + w01 * flat_az[k + 1] + w11 * flat_az[k + n + 1]
+        d_el = w00 * flat_el[k] + w10 * flat_el[k + n] + w01 * flat_el[k + 1] + w11 * flat_el[k + n + 1]
+        return az + d_az, el + d_el
+
+    def __interpolate(self, table_az, table_el, az, el):
+        az = np.asarray(az, dtype=float)
+        el = np.asarray(el, dtype=float)
+
+        x = (az % 360.0) / self.step
+        y = (np.clip(el, self.el_min, self.el_max) - self.el_min) / self.step
+        i = np.minimum(x.astype(int), self.n_az - 2)
+        j = np.minimum(y.astype(int), self.n_el - 2)
+        fx = x - i
+        fy = y - j
+
+        w00 = (1.0 - fx) * (1.0 - fy)
+        w10 = fx * (1.0 - fy)
+        w01 = (1.0 - fx) * fy
+        w11 = fx * fy
+
+        d_az = w00 * table_az[i, j] + w10 * table_az[i + 1, j] + w01 * table_az[i, j + 1] + w11 * table_az[i + 1, j + 1]
+        d_el = w00 * table_el[i, j] + w10 * table_el[i + 1, j] + w01 * table_el[i, j + 1] + w11 * table_el[i + 1, j + 1]
+        return az + d_az, el + d_el
+
+    def apply(self, az, el):
+        """Mount az/el in degrees of celestial az/el in degrees (katpoint apply)
+        """
+        if isinstance(az, float) and isinstance(el, float):
+            return self.__interpolateScalar(self.flat_forward, az, el)
+        return self.__interpolate(self.forward_az, self.forward_el, az, el)
+
+    def reverse(self, az, el):
+        """Celestial az/el in degrees of mount az/el in degrees (katpoint reverse)
+        """
+        if isinstance(az, float) and isinstance(el, float):
+            return self.__interpolateScalar(self.flat_reverse, az, el)
+        return self.__interpolate(self.reverse_az, self.reverse_el, az, el)
+
+    def validate(self, model, samples=10000, seed=0):
+        """Errors on the sky in arcseconds of both directions against the katpoint model, at random points of the grid area
+        """
+        rng = np.random.default_rng(seed)
+        az = rng.uniform(0.0, 360.0, samples)
+        el = rng.uniform(self.el_min, self.el_max, samples)
+
+        result = {"samples" : samples, "grid_step" : self.step, "el_min" : self.el_min, "el_max" : self.el_max}
+
+        for direction, table, exact in (("forward", self.apply, model.apply), ("reverse", self.reverse, model.reverse)):
+            az_table, el_table = table(az, el)
+            az_rad, el_rad = exact(np.radians(az), np.radians(el))
+
+            d_az = (az_table - np.degrees(az_rad) + 180.0) % 360.0 - 180.0
+            d_el = el_table - np.degrees(el_rad)
+            error = 3600.0 * np.hypot(d_az * np.cos(np.radians(el_table)), d_el)
+
+            result["{}_rms_arcsec".format(direction)] = float(np.sqrt(np.mean(error**2)))
+            result["{}_max_arcsec".format(direction)] = float(np.max(error))
+
+        return result
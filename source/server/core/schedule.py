@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+import datetime
+import logging
+import time
+import numpy as np
+
+from core.slew import SlewPlanner
+
+
+class ScheduleException(Exception):
+    pass
+
+
+class ObservationScheduler():
+    """Slew-cost-aware observation scheduler.
+
+    Candidates with a visibility window and a priority are inserted greedily in the order of their value
+    (priority x visible time). A candidate is accepted when, at its position in the time ordered plan, the
+    mount can slew to it from the previous observation and on to the next one in time, its start may be
+    delayed for that but it must keep at least min_duration seconds. The accepted plan is submitted to
+    APScheduler as one batch of jobs.
+    """
+
+    def __init__(self, parent, config):
+        self.parent = parent
+        self.config = config
+        self.name = self.config["name"]
+
+        mount_config = self.parent.config["mount"]
+
+        # the same coordinated slews as the mount
+        self.slew_planner = SlewPlanner(mount_config)
+
+        self.last_plan_time = 0.0
+
+    def slewTime(self, az_from, el_from, az_to, el_to):
+        """Estimated slew time in seconds between two positions (vectorised), including the settle time
+        """
+        d_az = np.abs(np.asarray(az_to) - np.asarray(az_from)) % 360.0
+        d_az = np.minimum(d_az, 360.0 - d_az)
+        d_el = np.asarray(el_to) - np.asarray(el_from)
+
+        return self.slew_planner.duration(d_az, d_el) + self.config["settle_time"]
+
+    def __position(self, candidate, t):
+        """Approximate az/el of a candidate at time t by interpolation of its known positions
+        """
+        times = [candidate["start"], candidate.get("culmination", None), candidate["stop"]]
+        az = [candidate["az_start"], candidate.get("az_culmination", None), candidate["az_stop"]]
+        el = [candidate["el_start"], candidate.get("el_culmination", None), candidate["el_stop"]]
+
+        points = [(ti, ai, ei) for ti, ai, ei in zip(times, az, el) if ti != None and ai != None and ei != None]
+        times, az, el = zip(*points)
+
+        az = np.degrees(np.unwrap(np.radians(az)))
+        return float(np.interp(t, times, az) % 360.0), float(np.interp(t, times, el))
+
+    def plan(self, candidates, start_position=(0.0, 0.0), start_time=None):
+        """Build a conflict free plan
+
+        Arguments:
+        candidates -- list of dicts with at least start, stop (UNIX time), priority, az_start, el_start, az_stop, el_stop
+                      and optionally culmination, az_culmination, el_culmination
+        start_position -- (az, el) of the mount when the plan starts
+        start_time -- UNIX time before which nothing can be scheduled, default now
+
+        Returns the plan as a list of dicts (the candidate plus observe_start, observe_stop, slew_time) ordered in time.
+        """
+
+        t_start = time.perf_counter()
+
+        if start_time == None:
+            start_time = time.time()
+
+        min_duration = self.config["min_duration"]
+        margin = self.config["slew_margin"]
+
+        candidates = [c for c in candidates if c["stop"] - max(c["start"], start_time) >= min_duration]
+        value = [c.get("priority", 1.0) * (c["stop"] - max(c["start"], start_time)) for c in candidates]
+
+        # the plan is kept ordered in time, every entry is (observe_start, observe_stop, candidate)
+        plan = []
+
+        for index in np.argsort(value)[::-1]:
+            candidate = candidates[index]
+
+            # position in the time ordered plan
+            position = 0
+            while position < len(plan) and plan[position][0] < candidate["start"]:
+                position += 1
+
+            # earliest start: after the previous observation and the slew from its end position
+            if position > 0:
+                previous_start, previous_stop, previous = plan[position - 1]
+                az_from, el_from = self.__position(previous, previous_stop)
+                earliest = previous_stop
+            else:
+                az_from, el_from = start_position
+                earliest = start_time
+
+            az_to, el_to = self.__position(candidate, max(candidate["start"], earliest))
+            slew = float(self.slewTime(az_from, el_from, az_to, el_to)) + margin
+            observe_start = max(candidate["start"], earliest + slew)
+
+            # the next observation limits the end, it must still be reachable from our end position
+            observe_stop = candidate["stop"]
+            if position < len(plan):
+                next_start, next_stop, following = plan[position]
+                az_next, el_next = self.__position(following, next_start)
+
+                if observe_stop > next_start:
+                    observe_stop = next_start
+                az_end, el_end = self.__position(candidate, observe_stop)
+                observe_stop = min(observe_stop, next_start - margin - float(self.slewTime(az_end, el_end, az_next, el_next)))
+
+            if observe_stop - observe_start >= min_duration:
+                plan.insert(position, (observe_start, observe_stop, candidate))
+
+        result = []
+        previous_position = start_position
+
+        for observe_start, observe_stop, candidate in plan:
+            az, el = self.__position(candidate, observe_start)
+            entry = dict(candidate)
+            entry["observe_start"] = observe_start
+            entry["observe_stop"] = observe_stop
+            entry["observe_az"] = az
+            entry["observe_el"] = el
+            entry["slew_time"] = float(self.slewTime(previous_position[0], previous_position[1], az, el))
+            result.append(entry)
+
+            previous_position = self.__position(candidate, observe_stop)
+
+        self.last_plan_time = time.perf_counter() - t_start
+        logging.info("Planned {} of {} candidates in {:.3f} s".format(len(result), len(candidates), self.last_plan_time))
+
+        return result
+
+    def __targetJob(self, target):
+        kind = target["type"]
+        if kind == "tle":
+            return self.parent.object.setCatalogObject, {"norad" : int(target["id"])}
+        elif kind == "star":
+            return self.parent.object.setStar, {"name" : target["id"]}
+        elif kind == "body":
+            return self.parent.object.setBody, {"name" : target["id"]}
+        else:
+            raise ScheduleException("Unknown target type {}".format(kind))
+
+    def schedule(self, candidates):
+        """Plan the candidates and submit the plan to APScheduler as one batch of jobs
+
+        Every observation becomes 4 date jobs: load the target and slew to its start position, start tracking
+        and abort at the end of the observation.
+        """
+        try:
+            start_position = (self.parent.mount.azimuth.pos_celestial_degrees, self.parent.mount.elevation.pos_celestial_degrees)
+            plan = self.plan(candidates, start_position=start_position)
+
+            jobs = []
+            for n, entry in enumerate(plan):
+                t_start = datetime.datetime.utcfromtimestamp(entry["observe_start"])
+                t_slew = datetime.datetime.utcfromtimestamp(entry["observe_start"] - entry["slew_time"] - self.config["slew_margin"])
+                t_stop = datetime.datetime.utcfromtimestamp(entry["observe_stop"])
+                label = entry.get("name", "observation {}".format(n))
+
+                target_function, target_kwargs = self.__targetJob(entry["target"])
+
+                batch = [
+                            (target_function, t_slew, target_kwargs, "Plan: load {}".format(label)),
+                            (self.parent.mount.gotoPosition, t_slew, {"az" : entry["observe_az"], "el" : entry["observe_el"]}, "Plan: slew to {}".format(label)),
+                            (self.parent.mount.startTracking, t_start, None, "Plan: track {}".format(label)),
+                            (self.parent.mount.abort, t_stop, None, "Plan: stop {}".format(label))
+                        ]
+
+                for function, run_date, kwargs, name in batch:
+                    job = self.parent.scheduler.add_job(function, trigger='date', run_date=run_date, kwargs=kwargs, name=name)
+                    jobs.append(job.id)
+
+            return {"success": True, "plan": plan, "jobs": jobs, "plan_time": self.last_plan_time}
+
+        except Exception as e:
+            return {"success": False, "message": "Exception occurred: {}".format(e)}
+
+    def schedulePasses(self, start=None, hours=12.0, min_elevation=10.0, priority=1.0):
+        """Schedule the catalog passes of a night, all with the same priority
+        """
+        result = self.parent.object.getPasses(start, hours, min_elevation)
+        if not result["success"]:
+            return result
+
+        candidates = [{
+                        "name" : p["name"],
+                        "target" : {"type" : "tle", "id" : p["norad"]},
+                        "priority" : priority,
+                        "start" : p["rise"],
+                        "stop" : p["set"],
+                        "culmination" : p["culmination"],
+                        "az_start" : p["rise_az"],
+                        "el_start" : min_elevation,
+                        "az_culmination" : p["culmination_az"],
+                        "el_culmination" : p["culmination_el"],
+                        "az_stop" : p["set_az"],
+                        "el_stop" : min_elevation
+                    } for p in result["passes"]]
+
+        return self.schedule(candidates)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+import collections
+import math
+import random
+import threading
+import time
+
+from PyTrinamic.TMCL import TMCL_Command, TMCL_Request, TMCL_Reply, TMCL_Status
+from PyTrinamic.connections.tmcl_interface import tmcl_interface
+from PyTrinamic.modules.TMCM1240.TMCM_1240 import _APs, _GPs
+
+
+class SimulatedMotor():
+    """Stepper motor behind the TMCM-1240 ramp generator.
+
+    Velocities are in usteps/s and accelerations in usteps/s^2, like the axis parameters. Below V1 the
+    ramp uses A1 and D1, above it the maximum acceleration and deceleration (V1 = 0 disables the first
+    phase). In position mode the motor follows a braking curve to the target and stops on it. The
+    state is integrated lazily, in steps of at most one millisecond, whenever the drive is accessed.
+    """
+
+    STEP = 0.001
+
+    def __init__(self):
+        self.parameters = collections.defaultdict(int)
+        self.parameters.update({
+                                    _APs.MaxVelocity : 51200,
+                                    _APs.MaxAcceleration : 51200
+                                })
+
+        self.position = 0.0
+        self.velocity = 0.0
+        self.target_position = 0
+        self.target_velocity = 0
+        self.position_mode = False
+
+        self.last_update = time.monotonic()
+
+    def __acceleration(self, speeding_up):
+        p = self.parameters
+        amax = p[_APs.MaxAcceleration]
+        dmax = p[_APs.MaxDeceleration] or amax
+        v1 = p[_APs.V1]
+
+        if v1 == 0 or abs(self.velocity) >= v1:
+            return amax if speeding_up else dmax
+        else:
+            return (p[_APs.A1] or amax) if speeding_up else (p[_APs.D1] or dmax)
+
+    def __step(self, h):
+        vmax = self.parameters[_APs.MaxVelocity]
+
+        if self.position_mode:
+            distance = self.target_position - self.position
+            if abs(distance) <= max(abs(self.velocity) * h, 0.5) and abs(self.velocity) <= self.__acceleration(False) * h:
+                self.position = float(self.target_position)
+                self.velocity = 0.0
+                return
+
+            deceleration = self.__acceleration(False)
+            desired = math.copysign(min(vmax, math.sqrt(2.0 * deceleration * abs(distance))), distance)
+        else:
+            desired = max(-vmax, min(vmax, self.target_velocity))
+
+        # speeding up when the desired velocity is larger and has the same sign
+        speeding_up = abs(desired) > abs(self.velocity) and desired * self.velocity >= 0.0
+        dv = self.__acceleration(speeding_up) * h
+
+        if desired > self.velocity:
+            self.velocity = min(desired, self.velocity + dv)
+        else:
+            self.velocity = max(desired, self.velocity - dv)
+
+        self.position += self.velocity * h
+
+    def update(self, now):
+        dt = now - self.last_update
+        self.last_update = now
+
+        while dt > 0.0:
+            h = min(dt, self.STEP)
+            self.__step(h)
+            dt -= h
+
+    def positionReached(self):
+        return self.position_mode and self.position == self.target_position and self.velocity == 0.0
+
+
+class SimulatedTmclInterface(tmcl_interface):
+    """Drop-in for the PyTrinamic USB TMCL interface, answering from a SimulatedMotor.
+
+    Requests are decoded in _send() and answered in _recv(), which only returns after the configured
+    latency (plus uniform jitter) has passed since the request was sent. Requests sent back to back are
+    answered in order, each after the processing time of the previous one, so pipelined bursts behave
+    as on the real link. error_rate rejects the request with a checksum error without executing it,
+    timeout_rate raises after timeout seconds.
+    """
+
+    def __init__(self, module_address, config, encoder_direction=1):
+        super(SimulatedTmclInterface, self).__init__()
+
+        self.module_address = module_address
+        self.config = config
+        self.encoder_direction = encoder_direction
+
+        self.motor = SimulatedMotor()
+        self.encoder_offset = 0.0
+
+        self.random = random.Random(self.config["seed"] + module_address)
+        self.pending = collections.deque()
+        self.last_ready = 0.0
+        self.mutex = threading.Lock()
+
+    def close(self):
+        return 0
+
+    def _send(self, hostID, moduleID, data):
+        now = time.monotonic()
+        request = TMCL_Request.from_buffer(data)
+
+        ready = max(now + self.config["latency"] + self.random.uniform(0.0, self.config["jitter"]), self.last_ready + self.config["processing"])
+        self.last_ready = ready
+
+        # a request with a checksum error is rejected by the module without being executed
+        if self.random.random() < self.config["error_rate"]:
+            status, value = TMCL_Status.WRONG_CHECKSUM, 0
+        else:
+            with self.mutex:
+                self.motor.update(now)
+                status, value = self.__execute(request)
+
+        timeout = self.random.random() < self.config["timeout_rate"]
+        self.pending.append((ready, timeout, TMCL_Reply(hostID, self.module_address, status, request.command, value).toBuffer()))
+
+    def _recv(self, hostID, moduleID):
+        ready, timeout, reply = self.pending.popleft()
+
+        if timeout:
+            time.sleep(self.config["timeout"])
+            raise TimeoutError("Simulated timeout of drive {}".format(self.module_address))
+
+        delay = ready - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        return reply
+
+    def __encoder(self):
+        return self.encoder_offset + self.encoder_direction * self.motor.position
+
+    def __execute(self, request):
+        motor = self.motor
+        command = request.command
+        kind = request.commandType
+        value = request.value - (1 << 32) if request.value >= (1 << 31) else request.value
+
+        if command == TMCL_Command.GAP:
+            if kind == _APs.ActualPosition:
+                result = round(motor.position)
+            elif kind == _APs.ActualVelocity:
+                result = round(motor.velocity)
+            elif kind == _APs.TargetPosition:
+                result = motor.target_position
+            elif kind == _APs.TargetVelocity:
+                result = motor.target_velocity
+            elif kind == _APs.PositionReachedFlag:
+                result = 1 if motor.positionReached() else 0
+            elif kind == _APs.EncoderPosition:
+                result = round(self.__encoder())
+            elif kind in (_APs.ExtendedErrorFlags, _APs.DrvStatusFlags):
+                result = 0
+            else:
+                result = motor.parameters[kind]
+
+        elif command == TMCL_Command.SAP:
+            if kind == _APs.ActualPosition:
+                motor.position = float(value)
+            elif kind == _APs.TargetPosition:
+                motor.target_position = value
+            elif kind == _APs.TargetVelocity:
+                motor.target_velocity = value
+                motor.position_mode = False
+            elif kind == _APs.EncoderPosition:
+                self.encoder_offset = value - self.encoder_direction * motor.position
+            else:
+                motor.parameters[kind] = value
+            result = value
+
+        elif command == TMCL_Command.MVP:
+            motor.target_position = value if kind == 0 else round(motor.position) + value
+            motor.position_mode = True
+            result = motor.target_position
+
+        elif command in (TMCL_Command.ROR, TMCL_Command.ROL, TMCL_Command.MST):
+            motor.target_velocity = {TMCL_Command.ROR : value, TMCL_Command.ROL : -value, TMCL_Command.MST : 0}[command]
+            motor.position_mode = False
+            result = 0
+
+        elif command == TMCL_Command.GGP:
+            result = self.module_address if kind == _GPs.serialAddress else 0
+
+        elif command == TMCL_Command.GIO:
+            # analog inputs: 8 supply voltage in 0.1 V, 9 temperature
+            result = {8 : int(self.config["voltage"] * 10), 9 : int(self.config["temperature"])}.get(kind, 0)
+
+        elif command in (TMCL_Command.SGP, TMCL_Command.STAP, TMCL_Command.STGP, TMCL_Command.SIO):
+            result = value
+
+        else:
+            return TMCL_Status.INVALID_COMMAND, 0
+
+        return TMCL_Status.SUCCESS, result & 0xFFFFFFFF
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+
+# usteps to degrees of the drive train, same as the Axis class
+DEGREES_PER_USTEP = 360.0 / (64.0 * 200.0 * 720.0)
+
+
+def sCurveTime(distance, velocity, acceleration, jerk):
+    """Duration in seconds of a rest-to-rest move with a jerk limited (S-curve) profile, vectorised over distance
+
+    Closed form, the profile reaches the velocity limit, only the acceleration limit, or neither.
+    """
+    distance = np.abs(distance)
+
+    # the acceleration that can actually be reached before the velocity limit
+    acceleration = np.minimum(acceleration, np.sqrt(velocity * jerk))
+    t_jerk = acceleration / jerk
+
+    # distance to reach the velocity limit and stop again
+    full = velocity * (velocity / acceleration + t_jerk)
+    # distance to reach the acceleration limit and stop again
+    reach = 2.0 * acceleration * t_jerk**2
+
+    # peak velocity of a move that reaches the acceleration limit but not the velocity limit
+    peak = 0.5 * acceleration * (np.sqrt(t_jerk**2 + 4.0 * distance / acceleration) - t_jerk)
+
+    return np.where(distance >= full, distance / velocity + velocity / acceleration + t_jerk,
+                    np.where(distance >= reach, 2.0 * (peak / acceleration + t_jerk), 4.0 * np.cbrt(distance / (2.0 * jerk))))
+
+
+class SCurveProfile():
+    """Rest-to-rest seven segment jerk limited profile from start to stop.
+
+    The profile can be stretched to a longer duration, which scales the velocity, acceleration and jerk
+    down by the first, second and third power of the stretch, so it stays within the limits. A profile
+    without a distance holds its position for the duration.
+    """
+
+    def __init__(self, start, stop, velocity, acceleration, jerk, duration=None):
+        self.start = start
+        self.stop = stop
+
+        distance = abs(stop - start)
+        direction = 1.0 if stop >= start else -1.0
+
+        acceleration = min(acceleration, (velocity * jerk) ** 0.5)
+        t_jerk = acceleration / jerk
+
+        full = velocity * (velocity / acceleration + t_jerk)
+        reach = 2.0 * acceleration * t_jerk**2
+
+        if distance >= full:
+            t_acceleration = velocity / acceleration - t_jerk
+            t_cruise = (distance - full) / velocity
+        elif distance >= reach:
+            peak = 0.5 * acceleration * ((t_jerk**2 + 4.0 * distance / acceleration) ** 0.5 - t_jerk)
+            t_acceleration = peak / acceleration - t_jerk
+            t_cruise = 0.0
+        else:
+            t_jerk = (distance / (2.0 * jerk)) ** (1.0 / 3.0)
+            t_acceleration = 0.0
+            t_cruise = 0.0
+
+        # stretch to the requested duration
+        minimum = 4.0 * t_jerk + 2.0 * t_acceleration + t_cruise
+        stretch = duration / minimum if duration != None and minimum > 0.0 and duration > minimum else 1.0
+
+        t_jerk *= stretch
+        t_acceleration *= stretch
+        t_cruise *= stretch
+        jerk = direction * jerk / stretch**3
+
+        # without a distance the profile holds the start position for the requested duration
+        if minimum == 0.0 and duration != None:
+            t_cruise = max(duration, 0.0)
+
+        self.duration = 4.0 * t_jerk + 2.0 * t_acceleration + t_cruise
+
+        # (time, position, velocity, acceleration, jerk) at the start of every segment
+        self.segments = []
+        t, p, v, a = 0.0, float(start), 0.0, 0.0
+        for length, j in ((t_jerk, jerk), (t_acceleration, 0.0), (t_jerk, -jerk), (t_cruise, 0.0), (t_jerk, -jerk), (t_acceleration, 0.0), (t_jerk, jerk)):
+            self.segments.append((t, p, v, a, j))
+            p += v * length + a * length**2 / 2.0 + j * length**3 / 6.0
+            v += a * length + j * length**2 / 2.0
+            a += j * length
+            t += length
+
+    def evaluate(self, t):
+        """Position, velocity and acceleration at t seconds after the start of the profile
+        """
+        if t >= self.duration:
+            return self.stop, 0.0, 0.0
+        if t <= 0.0:
+            return self.start, 0.0, 0.0
+
+        for segment in reversed(self.segments):
+            if t >= segment[0]:
+                break
+
+        t0, p, v, a, j = segment
+        dt = t - t0
+        return p + v * dt + a * dt**2 / 2.0 + j * dt**3 / 6.0, v + a * dt + j * dt**2 / 2.0, a + j * dt
+
+
+class SlewPlanner():
+    """Coordinated slews of the azimuth and elevation axes.
+
+    The limits are the maximum velocity and acceleration of the drive ramps (axis_parameters 4 and 5) and
+    the configured slew_jerk of every axis. Both axes get an S-curve of the duration of the slower one,
+    so they start and arrive together.
+    """
+
+    AXES = ("azimuth", "elevation")
+
+    def __init__(self, mount_config):
+        self.velocity = np.array([mount_config[axis]["axis_parameters"]["4"] * DEGREES_PER_USTEP for axis in self.AXES])
+        self.acceleration = np.array([mount_config[axis]["axis_parameters"]["5"] * DEGREES_PER_USTEP for axis in self.AXES])
+        self.jerk = np.array([mount_config[axis]["slew_jerk"] for axis in self.AXES])
+
+    def duration(self, d_az, d_el):
+        """Duration in seconds of coordinated slews over the given axis distances in degrees (vectorised)
+        """
+        return np.maximum(sCurveTime(d_az, self.velocity[0], self.acceleration[0], self.jerk[0]),
+                          sCurveTime(d_el, self.velocity[1], self.acceleration[1], self.jerk[1]))
+
+    def plan(self, az_from, el_from, az_to, el_to):
+        """Synchronised profiles (azimuth, elevation) between two mount positions
+        """
+        duration = float(self.duration(az_to - az_from, el_to - el_from))
+
+        return SCurveProfile(az_from, az_to, self.velocity[0], self.acceleration[0], self.jerk[0], duration), \
+               SCurveProfile(el_from, el_to, self.velocity[1], self.acceleration[1], self.jerk[1], duration)
+
+    def order(self, az_from, el_from, az, el):
+        """Visiting order of mount positions from a start position that minimises the total slew time
+
+        Returns the order as a list of indices into az/el and its total slew time in seconds. The open path
+        starts with the nearest neighbour tour and is improved by 2-opt moves (reversing a stretch of the
+        path) until no move shortens it, which for the few tens of points of a calibration run is close to
+        optimal and takes milliseconds.
+        """
+        az = np.concatenate(([az_from], np.asarray(az, dtype=float)))
+        el = np.concatenate(([el_from], np.asarray(el, dtype=float)))
+        n = len(az)
+        if n == 1:
+            return [], 0.0
+
+        # slew times between all pairs of positions, node 0 is the start
+        cost = self.duration(az[:, None] - az[None, :], el[:, None] - el[None, :])
+
+        path = [0]
+        remaining = set(range(1, n))
+        while remaining != set():
+            path.append(min(remaining, key=lambda node: cost[path[-1], node]))
+            remaining.remove(path[-1])
+
+        improved = True
+        while improved:
+            improved = False
+            for i in range(1, n - 1):
+                for j in range(i + 1, n):
+                    # reverse path[i..j], the path is open so there is no edge after the last node
+                    before = cost[path[i - 1], path[i]]
+                    after = cost[path[i - 1], path[j]]
+                    if j + 1 < n:
+                        before += cost[path[j], path[j + 1]]
+                        after += cost[path[i], path[j + 1]]
+                    if after < before - 1e-9:
+                        path[i:j + 1] = reversed(path[i:j + 1])
+                        improved = True
+
+        total = float(sum(cost[a, b] for a, b in zip(path[:-1], path[1:])))
+        return [node - 1 for node in path[1:]], total
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import datetime
+import logging
+import os
+import time
+import numpy as np
+import ephem
+import ephem.stars
+
+from core.passes import gmst, UNIX_EPOCH_JD
+
+
+def precessionMatrix(jd):
+    """IAU 1976 precession matrix rotating J2000 equatorial vectors to the mean equator of date
+    """
+    t = (jd - 2451545.0) / 36525.0
+    arcsec = np.pi / (180.0 * 3600.0)
+
+    zeta = (2306.2181 * t + 0.30188 * t**2 + 0.017998 * t**3) * arcsec
+    z = (2306.2181 * t + 1.09468 * t**2 + 0.018203 * t**3) * arcsec
+    theta = (2004.3109 * t - 0.42665 * t**2 - 0.041833 * t**3) * arcsec
+
+    cz, sz = np.cos(z), np.sin(z)
+    ct, st = np.cos(theta), np.sin(theta)
+    cx, sx = np.cos(zeta), np.sin(zeta)
+
+    return np.array([
+                        [cz * ct * cx - sz * sx, -cz * ct * sx - sz * cx, -cz * st],
+                        [sz * ct * cx + cz * sx, -sz * ct * sx + cz * cx, -sz * st],
+                        [st * cx, -st * sx, ct]
+                    ])
+
+
+class StarIndex():
+    """Precomputed index of the ephem star catalogue.
+
+    The catalogue is parsed once into J2000 unit vectors sorted by magnitude and persisted as a
+    .npz file. Queries precess the whole catalogue with one matrix product and convert it to
+    horizontal unit vectors, the selection is a vectorised dot product. With the ~115 stars of
+    ephem.stars this takes a few tens of microseconds, well below what a tree would save.
+    """
+
+    def __init__(self, lat, lon, index_file=None):
+        self.lat = lat
+        self.lon = lon
+        self.index_file = index_file
+
+        self.names = []
+        self.vectors = np.zeros((0, 3))
+        self.magnitudes = np.zeros(0)
+
+        self.precession_jd = None
+        self.precession = np.eye(3)
+
+        if not self.__load():
+            self.__build()
+            self.__save()
+
+    def __build(self):
+        t_start = time.perf_counter()
+        names, ra, dec, mag = [], [], [], []
+
+        for line in ephem.stars.db.split("\n"):
+            if line.strip() == "":
+                continue
+            body = ephem.readdb(line)
+            body.compute("2000/1/1 12:00:00") # astrometric J2000 coordinates
+            names.append(body.name)
+            ra.append(float(body.a_ra))
+            dec.append(float(body.a_dec))
+            mag.append(float(body.mag))
+
+        order = np.argsort(mag, kind="stable")
+        ra = np.array(ra)[order]
+        dec = np.array(dec)[order]
+
+        self.names = [names[i] for i in order]
+        self.magnitudes = np.array(mag)[order]
+        self.vectors = np.column_stack((np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)))
+
+        logging.info("Built star index of {} stars in {:.3f} s".format(len(self.names), time.perf_counter() - t_start))
+
+    def __load(self):
+        if self.index_file == None or not os.path.exists(self.index_file):
+            return False
+        try:
+            data = np.load(self.index_file)
+            self.names = [str(name) for name in data["names"]]
+            self.vectors = data["vectors"]
+            self.magnitudes = data["magnitudes"]
+            return True
+        except Exception as e:
+            logging.warning("Could not load star index {}: {}".format(self.index_file, e))
+            return False
+
+    def __save(self):
+        if self.index_file != None:
+            try:
+                np.savez(self.index_file, names=np.array(self.names), vectors=self.vectors, magnitudes=self.magnitudes)
+            except Exception as e:
+                logging.warning("Could not save star index {}: {}".format(self.index_file, e))
+
+    def getNames(self):
+        return list(self.names)
+
+    def horizontal(self, t=None):
+        """Azimuth and elevation in degrees of all stars at UNIX time t (default now), refraction neglected
+        """
+        if t == None:
+            t = time.time()
+
+        jd = np.floor(t / 86400.0) + UNIX_EPOCH_JD
+        fr = t / 86400.0 - np.floor(t / 86400.0)
+
+        # precession changes slowly, the matrix is refreshed once a day
+        if self.precession_jd == None or abs(jd + fr - self.precession_jd) > 1.0:
+            self.precession_jd = jd + fr
+            self.precession = precessionMatrix(self.precession_jd)
+
+        x, y, z = self.precession @ self.vectors.T
+
+        ha = gmst(jd, fr) + np.radians(self.lon) - np.arctan2(y, x)
+        phi = np.radians(self.lat)
+        cos_dec = np.hypot(x, y)
+
+        el = np.degrees(np.arcsin(np.sin(phi) * z + np.cos(phi) * cos_dec * np.cos(ha)))
+        az = np.degrees(np.arctan2(-cos_dec * np.sin(ha), z * np.cos(phi) - cos_dec * np.sin(phi) * np.cos(ha))) % 360.0
+
+        return az, el
+
+    def __separation(self, az, el, az0, el0):
+        az, el, az0, el0 = np.radians(az), np.radians(el), np.radians(az0), np.radians(el0)
+        cos_d = np.sin(el) * np.sin(el0) + np.cos(el) * np.cos(el0) * np.cos(az - az0)
+        return np.degrees(np.arccos(np.clip(cos_d, -1.0, 1.0)))
+
+    def __describe(self, i, az, el, separation):
+        return {
+                    "name" : self.names[i],
+                    "magnitude" : float(self.magnitudes[i]),
+                    "azimuth" : float(az[i]),
+                    "elevation" : float(el[i]),
+                    "separation" : float(separation[i])
+                }
+
+    def brightest(self, az, el, radius=180.0, min_elevation=30.0, n=5, t=None):
+        """The n brightest stars above min_elevation within radius degrees of (az, el)
+        """
+        star_az, star_el = self.horizontal(t)
+        separation = self.__separation(star_az, star_el, az, el)
+
+        # the index is sorted by magnitude, the first matches are the brightest
+        matches = np.nonzero((star_el >= min_elevation) & (separation <= radius))[0][:n]
+        return [self.__describe(i, star_az, star_el, separation) for i in matches]
+
+    def nearest(self, az, el, min_elevation=0.0, t=None):
+        """The catalogued star closest to (az, el) above min_elevation, None if no star is above it
+        """
+        star_az, star_el = self.horizontal(t)
+        separation = np.where(star_el >= min_elevation, self.__separation(star_az, star_el, az, el), np.inf)
+
+        i = int(np.argmin(separation))
+        if not np.isfinite(separation[i]):
+            return None
+
+        return self.__describe(i, star_az, star_el, separation)
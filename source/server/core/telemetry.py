@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import datetime
+import os
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# one record per control loop tick
+AXIS_TELEMETRY_DTYPE = np.dtype([
+                                    ("timestamp", "f8"), # UNIX time of the tick
+                                    ("state", "i1"),
+                                    ("looptime", "f4"),
+                                    ("pos_mount_degrees", "f8"),
+                                    ("pos_encoder_degrees", "f8"),
+                                    ("pos_celestial_degrees", "f8"),
+                                    ("vel_internal_degrees", "f8"),
+                                    ("trajectory_setpoint_degrees", "f8"),
+                                    ("trajectory_rate_degrees", "f8"),
+                                    ("trajectory_error_degrees", "f8"),
+                                    ("offaxis_setpoint_degrees", "f8"),
+                                    ("offaxis_error_degrees", "f8"),
+                                    ("offaxis_output_degrees", "f8"),
+                                    ("slew_setpoint_degrees", "f8"),
+                                    ("P_trajectory", "f8"),
+                                    ("I_trajectory", "f8"),
+                                    ("D_trajectory", "f8"),
+                                    ("FF_trajectory", "f8"),
+                                    ("velocity_command_degrees", "f8")
+                                ])
+
+
+class TelemetryBuffer():
+    """Preallocated ring buffer of structured NumPy records with a single writer.
+
+    append() overwrites the oldest record once the buffer is full, so the memory is bounded by the
+    capacity. Readers never block the writer: read() copies the buffer between two reads of the write
+    counter and only keeps the records that can not have been overwritten during the copy.
+    """
+
+    def __init__(self, capacity, dtype=AXIS_TELEMETRY_DTYPE):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=dtype)
+        self.written = 0 # total number of records, the next one goes to written % capacity
+
+    def append(self, record):
+        self.buffer[self.written % self.capacity] = record
+        self.written += 1
+
+    def read(self, t_start=None, t_stop=None):
+        """Records with a timestamp in [t_start, t_stop] (UNIX times, open ended when None) in chronological order
+        """
+        written = self.written
+        copy = self.buffer.copy()
+        after = self.written
+
+        # the record being written while the counter was read last may be incomplete as well
+        first = max(0, after + 1 - self.capacity)
+        if first >= written:
+            return copy[:0]
+
+        records = np.take(copy, np.arange(first, written) % self.capacity)
+
+        mask = np.ones(len(records), dtype=bool)
+        if t_start != None:
+            mask &= records["timestamp"] >= t_start
+        if t_stop != None:
+            mask &= records["timestamp"] <= t_stop
+
+        return records[mask]
+
+    def getStatus(self):
+        return {
+                    "telemetry_records" : min(self.written, self.capacity),
+                    "telemetry_written" : self.written,
+                    "telemetry_capacity" : self.capacity
+                }
+
+
+def parseTime(t):
+    """UNIX time of a UNIX timestamp, datetime or ISO string (UTC when no timezone is given), None stays None
+
+    Query parameters arrive as strings, a string holding a number is taken as a UNIX timestamp.
+    """
+    if t == None or isinstance(t, (int, float)):
+        return t
+    if isinstance(t, str):
+        try:
+            return float(t)
+        except ValueError:
+            t = datetime.datetime.fromisoformat(t)
+    if t.tzinfo == None:
+        t = t.replace(tzinfo=datetime.timezone.utc)
+    return t.timestamp()
+
+
+def exportTelemetry(records, filename, format="npy"):
+    """Write telemetry records to filename (.npy or Parquet), atomically through a temporary file
+    """
+    tmp = filename + ".tmp"
+
+    if format == "parquet" and pyarrow == None:
+        raise RuntimeError("Parquet export requires pyarrow")
+    if format not in ("npy", "parquet"):
+        raise ValueError("Unknown telemetry export format {}".format(format))
+
+    try:
+        if format == "npy":
+            with open(tmp, "wb") as f:
+                np.save(f, records)
+        else:
+            table = pyarrow.table({name : records[name] for name in records.dtype.names})
+            pyarrow.parquet.write_table(table, tmp)
+
+        os.replace(tmp, filename)
+
+    except Exception:
+        # a failed write must not leave a partial file behind
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
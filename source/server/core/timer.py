@@ -1,19 +1,290 @@
-from threading import Timer
+#!/usr/bin/env python3
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+class PeriodicTask():
+    """A function registered with the PeriodicScheduler, with its timing statistics
+    """
+
+    def __init__(self, name, period, function):
+        self.name = name
+        self.period = period
+        self.function = function
+
+        self.deadline = None
+        self.running = False
+        self.cancelled = False
+
+        self.runs = 0
+        self.errors = 0
+        self.overruns = 0 # deadlines skipped because the previous run had not finished yet
+        self.missed = 0 # deadlines skipped because the scheduler itself was late
+        self.lateness_max = 0.0
+        self.lateness_sum = 0.0
+        self.duration_max = 0.0
+        self.duration_sum = 0.0
+
+    def getStatus(self):
+        return {
+                    "period" : self.period,
+                    "runs" : self.runs,
+                    "errors" : self.errors,
+                    "overruns" : self.overruns,
+                    "missed_deadlines" : self.missed,
+                    "lateness_mean_ms" : 1000.0 * self.lateness_sum / self.runs if self.runs > 0 else 0.0,
+                    "lateness_max_ms" : 1000.0 * self.lateness_max,
+                    "duration_mean_ms" : 1000.0 * self.duration_sum / self.runs if self.runs > 0 else 0.0,
+                    "duration_max_ms" : 1000.0 * self.duration_max
+                }
+
+
+class PeriodicScheduler():
+    """Deadline based periodic executor shared by all subsystems.
+
+    The tasks are kept in a heap ordered by their next deadline on time.monotonic(), a fixed pool of
+    workers waits for the earliest deadline and the worker that takes a task runs it itself (one wake-up
+    per firing), so no threads are created while running. Deadlines advance by exactly
+    one period from the previous deadline, the work itself never shifts the schedule. A task that is still
+    running at its next deadline skips that deadline (an overrun), deadlines that passed while the
+    scheduler was late are skipped as missed, never executed in a burst.
+    """
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        self.heap = []
+        self.tasks = []
+        self.sequence = itertools.count()
+
+        self.condition = threading.Condition()
+        self.started = False
+
+    def __start(self):
+        for i in range(self.workers):
+            threading.Thread(target=self.__work, name="scheduler-{}".format(i), daemon=True).start()
+        self.started = True
+
+    def add(self, period, function, name=None):
+        """Run function every period seconds, the first run is one period from now
+        """
+        if name == None:
+            owner = getattr(function, "__self__", None)
+            prefix = getattr(owner, "name", type(owner).__name__) if owner != None else function.__module__
+            name = "{}.{}".format(prefix, function.__name__.strip("_"))
+
+        with self.condition:
+            # keep the names unique, they key the statistics
+            names = [task.name for task in self.tasks]
+            unique = name
+            n = 1
+            while unique in names:
+                n += 1
+                unique = "{}#{}".format(name, n)
+
+            task = PeriodicTask(unique, period, function)
+
+            if not self.started:
+                self.__start()
+            task.deadline = time.monotonic() + period
+            heapq.heappush(self.heap, (task.deadline, next(self.sequence), task))
+            self.tasks.append(task)
+            self.condition.notify()
+
+        return task
+
+    def cancel(self, task):
+        with self.condition:
+            task.cancelled = True
+            if task in self.tasks:
+                self.tasks.remove(task)
+            self.condition.notify()
+
+    def __work(self):
+        while True:
+            with self.condition:
+                while self.heap == [] or self.heap[0][0] > time.monotonic():
+                    self.condition.wait(self.heap[0][0] - time.monotonic() if self.heap != [] else None)
+
+                deadline, _, task = heapq.heappop(self.heap)
+                if task.cancelled:
+                    continue
+
+                now = time.monotonic()
+
+                # next deadline on the original grid, skipping the ones that already passed
+                skipped = int((now - deadline) / task.period)
+                task.missed += skipped
+                task.deadline = deadline + (skipped + 1) * task.period
+                heapq.heappush(self.heap, (task.deadline, next(self.sequence), task))
+
+                if task.running:
+                    task.overruns += 1
+                    continue
+                task.running = True
+
+                # another worker takes over waiting for the next deadline
+                self.condition.notify()
+
+            start = time.monotonic()
+            try:
+                task.function()
+            except Exception as e:
+                task.errors += 1
+                logging.error("Periodic task {} raised: {}".format(task.name, e))
+            finally:
+                duration = time.monotonic() - start
+                lateness = start - deadline
+
+                task.runs += 1
+                task.lateness_sum += lateness
+                task.lateness_max = max(task.lateness_max, lateness)
+                task.duration_sum += duration
+                task.duration_max = max(task.duration_max, duration)
+                task.running = False
+
+    def getStatus(self):
+        with self.condition:
+            tasks = list(self.tasks)
+        return {task.name : task.getStatus() for task in tasks}
+
+
+# the executor shared by the whole process
+scheduler = PeriodicScheduler()
+
 
 class CustomTimer():
+    """Periodic timer registered with the shared PeriodicScheduler
+    """
+
+    def __init__(self, t, hFunction, name=None):
+        self.t = t
+        self.hFunction = hFunction
+        self.name = name
+        self.task = None
+
+    def start(self):
+        self.task = scheduler.add(self.t, self.hFunction, self.name)
+        return self
+
+    def cancel(self):
+        if self.task != None:
+            scheduler.cancel(self.task)
+
+    def getStatus(self):
+        return self.task.getStatus() if self.task != None else {}
+
+
+class DeadlineLoop():
+    """Absolute deadline pacing for a control loop running in its own thread.
+
+    wait() sleeps until the next deadline on a fixed grid of time.monotonic() and returns the true time
+    since the previous tick, so the period does not depend on how long the work took. When a tick
+    overruns its deadline the policy decides what happens:
+
+    skip -- drop the deadlines that have passed entirely and run the current tick late right away, the
+            following ticks stay on the grid so the phase is kept
+    catchup -- run the missed ticks immediately back to back, after max_catchup periods behind resync to now
+    degrade -- run immediately and stretch the period (up to max_degrade times nominal), it recovers
+               gradually once the loop keeps its deadlines again
+    """
+
+    POLICIES = ("skip", "catchup", "degrade")
+
+    def __init__(self, period, policy="skip", max_catchup=5, max_degrade=4.0):
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown overrun policy {}, expected one of {}".format(policy, self.POLICIES))
+
+        self.nominal_period = period
+        self.period = period
+        self.policy = policy
+        self.max_catchup = max_catchup
+        self.max_degrade = max_degrade
+
+        self.deadline = None
+        self.previous = None
+        self.on_time = 0
+
+        self.resetStatistics()
+
+    def resetStatistics(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.period_mean = 0.0
+        self.period_m2 = 0.0
+        self.jitter_max = 0.0
+
+    def reset(self):
+        """Restart the grid at the next wait(), e.g. after the loop was paced by something else
+        """
+        self.deadline = None
+        self.previous = None
+
+    def wait(self):
+        now = time.monotonic()
+
+        if self.deadline == None:
+            self.deadline = now
+            self.previous = now
+            return self.period
+
+        self.deadline += self.period
+        late = now - self.deadline
+
+        if late > 0:
+            self.overruns += 1
+
+            if self.policy == "skip":
+                # only whole periods are missed, the deadline within the last period is run late
+                missed = int(late / self.period)
+                self.skipped += missed
+                self.deadline += missed * self.period
+
+            elif self.policy == "catchup":
+                if late > self.max_catchup * self.period:
+                    self.skipped += int(late / self.period)
+                    self.deadline = now
+
+            else:
+                self.period = min(self.period * 1.25, self.nominal_period * self.max_degrade)
+                self.deadline = now
+                self.on_time = 0
+
+        elif self.policy == "degrade" and self.period > self.nominal_period:
+            # recover the nominal rate after a while without overruns
+            self.on_time += 1
+            if self.on_time >= 10:
+                self.period = max(self.period / 1.25, self.nominal_period)
+                self.on_time = 0
+
+        delay = self.deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
 
-   def __init__(self, t, hFunction):
-      self.t = t
-      self.hFunction = hFunction
-      self.thread = Timer(self.t, self.handle_function)
+        now = time.monotonic()
+        dt = now - self.previous
+        self.previous = now
 
-   def handle_function(self):
-      self.hFunction()
-      self.thread = Timer(self.t, self.handle_function)
-      self.thread.start()
+        # running mean and variance of the achieved period (Welford)
+        self.ticks += 1
+        delta = dt - self.period_mean
+        self.period_mean += delta / self.ticks
+        self.period_m2 += delta * (dt - self.period_mean)
+        self.jitter_max = max(self.jitter_max, abs(dt - self.period))
 
-   def start(self):
-      self.thread.start()
+        return dt
 
-   def cancel(self):
-      self.thread.cancel()
\ No newline at end of file
+    def getStatus(self):
+        return {
+                    "loop_period_nominal_ms" : 1000.0 * self.nominal_period,
+                    "loop_period_current_ms" : 1000.0 * self.period,
+                    "loop_period_mean_ms" : 1000.0 * self.period_mean,
+                    "loop_jitter_std_ms" : 1000.0 * (self.period_m2 / self.ticks) ** 0.5 if self.ticks > 0 else 0.0,
+                    "loop_jitter_max_ms" : 1000.0 * self.jitter_max,
+                    "loop_overruns" : self.overruns,
+                    "loop_skipped" : self.skipped
+                }
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import collections
+import threading
+import time
+
+from PyTrinamic.TMCL import TMCL_Command, TMCL_Request, TMCL_Reply, TMCL_Status
+from PyTrinamic.helpers import TMC_helpers
+from PyTrinamic.modules.TMCM1240.TMCM_1240 import TMCM_1240
+
+
+class TmclException(Exception):
+    pass
+
+
+class TmclTransport():
+    """Pipelined TMCL transactions on a PyTrinamic tmcl_interface.
+
+    A burst of requests is written back to back with the interface's _send() and only then are the replies
+    collected with _recv(), so a tick's reads cost one round trip instead of one per request. At most
+    depth requests are in flight at once (depth 1 is the plain blocking behaviour of tmcl_interface.send()).
+    Every reply is checked for its status and command, and the transport is shared by all users of the
+    interface under one lock so bursts are never interleaved.
+    """
+
+    STATUS_OK = (TMCL_Status.SUCCESS, TMCL_Status.COMMAND_LOADED)
+
+    def __init__(self, interface, module_id=1, depth=4):
+        self.interface = interface
+        self.module_id = module_id
+        self.depth = max(1, int(depth))
+        self.mutex = threading.Lock()
+
+        self.transactions = 0
+        self.bursts = 0
+        self.errors = 0
+        self.skipped_writes = 0
+        self.busy_ns = 0
+
+        # (monotonic time, transactions) pairs for the transactions/second estimate
+        self.rate_samples = collections.deque(maxlen=10)
+
+    def transact(self, requests):
+        """Execute a list of (command, type, motor, value) requests, returns the raw reply values in order
+        """
+        host_id = self.interface._HOST_ID
+        values = []
+        failures = []
+
+        with self.mutex:
+            t_start = time.perf_counter_ns()
+            try:
+                for i in range(0, len(requests), self.depth):
+                    chunk = requests[i:i + self.depth]
+
+                    for command, command_type, motor, value in chunk:
+                        self.interface._send(host_id, self.module_id, TMCL_Request(self.module_id, command, command_type, motor, value).toBuffer())
+
+                    # always read all replies of the chunk so the stream stays aligned
+                    for command, command_type, motor, value in chunk:
+                        reply = TMCL_Reply.from_buffer(self.interface._recv(host_id, self.module_id))
+                        if reply.status not in self.STATUS_OK or reply.command != command:
+                            failures.append("command {} type {}: status {} {}".format(command, command_type, reply.status, TMCL_Status.messages.get(reply.status, "")))
+                        values.append(reply.value)
+
+                    self.bursts += 1
+
+            except Exception as e:
+                # a short or corrupt read leaves stale bytes behind, drop them before the next burst
+                self.__flush()
+                self.errors += 1
+                raise TmclException("Transport error: {}".format(e))
+
+            finally:
+                self.transactions += len(values)
+                self.busy_ns += time.perf_counter_ns() - t_start
+
+        if failures != []:
+            self.errors += len(failures)
+            raise TmclException("; ".join(failures))
+
+        return values
+
+    def __flush(self):
+        serial = getattr(self.interface, "_serial", None)
+        if serial != None:
+            try:
+                serial.reset_input_buffer()
+            except Exception:
+                pass
+
+    def getStatus(self):
+        now = time.monotonic()
+        transactions = self.transactions
+
+        if len(self.rate_samples) == 0 or now - self.rate_samples[-1][0] >= 1.0:
+            self.rate_samples.append((now, transactions))
+
+        t_oldest, transactions_oldest = self.rate_samples[0]
+        elapsed = now - t_oldest
+
+        return {
+                    "tmcl_transactions" : transactions,
+                    "tmcl_bursts" : self.bursts,
+                    "tmcl_errors" : self.errors,
+                    "tmcl_skipped_writes" : self.skipped_writes,
+                    "tmcl_transactions_per_second" : (transactions - transactions_oldest) / elapsed if elapsed > 0 else 0.0,
+                    "tmcl_mean_transaction_us" : self.busy_ns / transactions / 1000.0 if transactions > 0 else 0.0
+                }
+
+
+class PipelinedTMCM1240(TMCM_1240):
+    """TMCM_1240 on top of a TmclTransport.
+
+    Drop-in for the PyTrinamic module class. readAxisParameters() reads several axis parameters in a single
+    burst, and rotate() skips writing a target velocity the drive already has, unless the last write is older
+    than velocity_refresh seconds. Any other motion command invalidates the cached velocity.
+    """
+
+    MOTOR = 0
+
+    def __init__(self, connection, moduleID=1, depth=4, velocity_refresh=1.0):
+        super(PipelinedTMCM1240, self).__init__(connection, moduleID)
+        self.transport = TmclTransport(connection, moduleID, depth)
+        self.velocity_refresh = velocity_refresh
+
+        self.target_velocity = None
+        self.target_velocity_time = 0.0
+
+    def readAxisParameters(self, parameters):
+        """Read a list of (apType, signed) axis parameters in one burst
+        """
+        values = self.transport.transact([(TMCL_Command.GAP, ap, self.MOTOR, 0) for ap, signed in parameters])
+        return [TMC_helpers.toSigned32(value) if signed else value for (ap, signed), value in zip(parameters, values)]
+
+    def getAxisParameter(self, apType, signed=False):
+        return self.readAxisParameters([(apType, signed)])[0]
+
+    def setAxisParameter(self, apType, value):
+        # the cached velocity is only valid if this write succeeds
+        self.target_velocity = None
+        self.transport.transact([(TMCL_Command.SAP, apType, self.MOTOR, value)])
+
+        if apType == self.APs.TargetVelocity:
+            self.target_velocity = value
+            self.target_velocity_time = time.monotonic()
+
+    def getGlobalParameter(self, gpType, bank):
+        return self.transport.transact([(TMCL_Command.GGP, gpType, bank, 0)])[0]
+
+    def setGlobalParameter(self, gpType, bank, value):
+        self.transport.transact([(TMCL_Command.SGP, gpType, bank, value)])
+
+    def rotate(self, velocity):
+        if velocity == self.target_velocity and time.monotonic() - self.target_velocity_time < self.velocity_refresh:
+            self.transport.skipped_writes += 1
+            return
+        self.setAxisParameter(self.APs.TargetVelocity, velocity)
+
+    def stop(self):
+        # never skipped
+        self.setAxisParameter(self.APs.TargetVelocity, 0)
+
+    def moveTo(self, position, velocity=None):
+        if velocity:
+            self.setMaxVelocity(velocity)
+
+        self.target_velocity = None
+        return self.transport.transact([(TMCL_Command.MVP, 0, self.MOTOR, position)])[0]
+
+    def moveBy(self, difference, velocity=None):
+        if velocity:
+            self.setMaxVelocity(velocity)
+
+        self.target_velocity = None
+        return self.transport.transact([(TMCL_Command.MVP, 1, self.MOTOR, difference)])[0]
+
+    def analogInput(self, x):
+        return self.transport.transact([(TMCL_Command.GIO, x, 1, 0)])[0]
+
+    def digitalInput(self, x):
+        return self.transport.transact([(TMCL_Command.GIO, x, 0, 0)])[0]
+
+    def getStatus(self):
+        return self.transport.getStatus()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import logging
+import math
+import os
+import time
+import ephem
+import numpy as np
+
+from core.axis import AxisState
+from core.mount import Mount
+from core.object import Object
+from core.timer import DeadlineLoop
+
+
+class BenchmarkException(Exception):
+    pass
+
+
+class NullGuider():
+    """Guider without off-axis feedback, the benchmark measures the trajectory loop only
+    """
+
+    def __init__(self):
+        self.object_detection_enabled = False
+        self.keypoints = []
+
+    def getOffAxisSetpoint(self, type):
+        return 0.0
+
+    def getOffAxisValue(self, type):
+        return 0.0
+
+
+class NullTelegraf():
+    """Telemetry sink that drops the metrics, the benchmark reports its own results
+    """
+
+    def metric(self, name, values):
+        pass
+
+
+class BenchmarkHost():
+    """The parts of the Server the mount and object need, with the mount forced onto simulated drives
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.config["mount"]["simulated"] = True
+
+        self.telegraf = NullTelegraf()
+        self.guider = NullGuider()
+
+        self.object = Object(self, config=self.config["object"], logging_level=logging.INFO)
+        self.mount = Mount(self, config=self.config["mount"], logging_level=logging.INFO)
+
+    def shutdown(self):
+        self.mount.stop()
+        self.object.stop()
+
+
+# result keys compared against a baseline, True when larger is worse
+REGRESSION_KEYS = {
+                        "trajectory_error_rms_arcsec" : True,
+                        "trajectory_error_max_arcsec" : True,
+                        "time_to_on_target_s" : True,
+                        "cpu_percent" : True,
+                        "loop_rate_hz" : False
+                    }
+
+
+def compareResults(results, baseline, tolerance=0.2):
+    """Compare benchmark results against a baseline
+
+    A metric regresses when it is worse than the baseline by more than the relative tolerance, a
+    scenario that reached the target in the baseline but not anymore always regresses.
+
+    Returns a list of messages, empty when there are no regressions.
+    """
+    regressions = []
+
+    for name, result in results["scenarios"].items():
+        reference = baseline["scenarios"].get(name)
+        if reference == None:
+            continue
+
+        for key, larger_is_worse in REGRESSION_KEYS.items():
+            value = result.get(key)
+            previous = reference.get(key)
+
+            if previous == None:
+                continue
+            if value == None:
+                regressions.append("{} {}: no value, baseline {:.3f}".format(name, key, previous))
+                continue
+
+            if larger_is_worse:
+                worse = value > previous * (1.0 + tolerance)
+            else:
+                worse = value < previous * (1.0 - tolerance)
+
+            if worse:
+                regressions.append("{} {}: {:.3f}, baseline {:.3f}".format(name, key, value, previous))
+
+    return regressions
+
+
+class TrackingBenchmark():
+    """Tracking performance of the Mount/Axis/Object stack on simulated drives.
+
+    Every scenario is a reference trajectory computed with ephem at a fixed epoch: a satellite pass
+    found by its culmination elevation, or a fixed window of a star or a TLE. The trajectory is
+    shifted to the present and uploaded as an ephemeris table, so the results do not depend on the
+    time the benchmark runs. The mount slews to the start of the trajectory, starts tracking and
+    the tracking error of both axes is sampled for the duration of the scenario.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.benchmark_config = self.config["benchmark"]
+        self.host = None
+
+    def start(self):
+        self.host = BenchmarkHost(self.config)
+
+    def stop(self):
+        if self.host != None:
+            self.host.shutdown()
+            self.host = None
+
+    def __observer(self, date):
+        mount_config = self.config["mount"]
+
+        observer = ephem.Observer()
+        observer.lat = mount_config["lat"] * ephem.degree
+        observer.lon = mount_config["lon"] * ephem.degree
+        observer.elevation = mount_config["alt"]
+        observer.date = date
+
+        return observer
+
+    def referenceTrajectory(self, scenario):
+        """UNIX times and az/el in degrees (ephem, refraction included) of a scenario at its reference epoch
+        """
+        if "star" in scenario:
+            body = ephem.star(scenario["star"])
+        else:
+            body = ephem.readtle(*scenario["tle"])
+
+        duration = scenario["duration"]
+        start = ephem.Date(datetime.datetime.fromisoformat(scenario["start"]))
+
+        if "min_culmination" in scenario:
+            # the first pass culminating in the requested band, centered on the culmination
+            observer = self.__observer(start)
+            for _ in range(100):
+                rise, _, culmination_time, culmination, setting, _ = observer.next_pass(body)
+                if scenario["min_culmination"] <= math.degrees(culmination) <= scenario["max_culmination"]:
+                    break
+                observer.date = setting + ephem.minute
+            else:
+                raise BenchmarkException("No pass of {} culminates between {} and {} degrees".format(scenario["name"], scenario["min_culmination"], scenario["max_culmination"]))
+
+            start = ephem.Date(culmination_time - duration / 2.0 / 86400.0)
+
+        offsets = np.arange(0.0, duration + self.benchmark_config["table_step"], self.benchmark_config["table_step"])
+        observer = self.__observer(start)
+
+        az = np.empty(len(offsets))
+        el = np.empty(len(offsets))
+        for i, offset in enumerate(offsets):
+            observer.date = start + offset / 86400.0
+            body.compute(observer)
+            az[i] = math.degrees(body.az)
+            el[i] = math.degrees(body.alt)
+
+        if np.min(el) < self.config["mount"]["elevation"]["limit_min"]:
+            raise BenchmarkException("Scenario {} goes below the elevation limit".format(scenario["name"]))
+
+        return offsets, az, el
+
+    def __waitSnapshot(self, timeout=2.0):
+        t_stop = time.monotonic() + timeout
+        while self.host.object.getSnapshot() == None:
+            if time.monotonic() > t_stop:
+                raise BenchmarkException("No ephemeris snapshot of the uploaded table")
+            time.sleep(0.05)
+
+    def runScenario(self, scenario):
+        name = scenario["name"]
+        mount = self.host.mount
+        object = self.host.object
+        axes = (mount.azimuth, mount.elevation)
+
+        offsets, az, el = self.referenceTrajectory(scenario)
+
+        logging.info("Benchmark {}: slewing to AZ{:.2f} EL{:.2f}".format(name, az[0], el[0]))
+        mount.gotoPosition(az[0], el[0])
+
+        # the replayed trajectory starts lead_time after tracking is started
+        t_start = time.time() + self.benchmark_config["lead_time"]
+        rows = np.column_stack((t_start + offsets, az, el))
+
+        response = object.beginTable(name, "azel")
+        if response["success"]:
+            response = object.appendTable(rows)
+        if response["success"]:
+            response = object.commitTable(select=True)
+        if not response["success"]:
+            raise BenchmarkException("Could not load the trajectory of {}: {}".format(name, response["message"]))
+        self.__waitSnapshot()
+
+        for axis in axes:
+            axis.loop.resetStatistics()
+            axis.resetLatency()
+        tmcl_errors = sum(axis.drive.transport.errors for axis in axes)
+
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+
+        mount.startTracking()
+        if any(axis.nextState != AxisState.TRACK for axis in axes):
+            raise BenchmarkException("Mount did not start tracking {}".format(name))
+
+        samples = []
+        loop = DeadlineLoop(self.benchmark_config["sample_interval"])
+        t_stop = time.monotonic() + self.benchmark_config["lead_time"] + offsets[-1]
+
+        while time.monotonic() < t_stop:
+            loop.wait()
+
+            # the errors are only those of the trajectory once the axes have entered TRACK
+            if any(axis.state != AxisState.TRACK for axis in axes):
+                continue
+
+            samples.append((
+                                time.perf_counter() - wall_start,
+                                mount.azimuth.trajectory_error_degrees,
+                                mount.elevation.trajectory_error_degrees,
+                                mount.elevation.trajectory_setpoint_degrees,
+                                mount.azimuth.trajectory_on_target and mount.elevation.trajectory_on_target
+                            ))
+
+        if samples == []:
+            raise BenchmarkException("Mount never entered TRACK for {}".format(name))
+
+        cpu_time = time.process_time() - cpu_start
+        wall_time = time.perf_counter() - wall_start
+
+        loop_status = [axis.loop.getStatus() for axis in axes]
+        latency = [axis.getLatency()["cycle"] for axis in axes]
+        tmcl_errors = sum(axis.drive.transport.errors for axis in axes) - tmcl_errors
+
+        mount.abort()
+
+        return self.__evaluate(samples, cpu_time, wall_time, loop_status, latency, tmcl_errors, offsets, el)
+
+    def __evaluate(self, samples, cpu_time, wall_time, loop_status, latency, tmcl_errors, offsets, el):
+        t, error_az, error_el, setpoint_el, on_target = (np.array(column) for column in zip(*samples))
+        on_target = on_target.astype(bool)
+
+        # azimuth errors on the sky
+        error = 3600.0 * np.hypot(error_az * np.cos(np.radians(setpoint_el)), error_el)
+
+        reached = np.nonzero(on_target)[0]
+        lost = np.nonzero(~on_target)[0]
+
+        if len(reached) > 0:
+            time_to_on_target = float(t[reached[0]])
+            tracking = slice(reached[0], None)
+        else:
+            time_to_on_target = None
+            tracking = slice(0, None)
+
+        if len(lost) == 0:
+            time_to_settled = 0.0
+        elif lost[-1] < len(t) - 1:
+            time_to_settled = float(t[lost[-1] + 1])
+        else:
+            time_to_settled = None
+
+        period_mean_ms = max(status["loop_period_mean_ms"] for status in loop_status)
+
+        return {
+                    "duration_s" : float(offsets[-1]),
+                    "max_elevation" : float(np.max(el)),
+                    "samples" : len(t),
+                    "time_to_on_target_s" : time_to_on_target,
+                    "time_to_settled_s" : time_to_settled,
+                    "on_target_fraction" : float(np.mean(on_target)),
+                    "trajectory_error_rms_arcsec" : float(np.sqrt(np.mean(error[tracking]**2))),
+                    "trajectory_error_max_arcsec" : float(np.max(error[tracking])),
+                    "trajectory_error_max_az_arcsec" : float(3600.0 * np.max(np.abs(error_az[tracking]))),
+                    "trajectory_error_max_el_arcsec" : float(3600.0 * np.max(np.abs(error_el[tracking]))),
+                    "acquisition_error_max_arcsec" : float(np.max(error)),
+                    "loop_rate_hz" : 1000.0 / period_mean_ms if period_mean_ms > 0 else 0.0,
+                    "loop_jitter_std_ms" : max(status["loop_jitter_std_ms"] for status in loop_status),
+                    "loop_overruns" : sum(status["loop_overruns"] for status in loop_status),
+                    "cycle_p99_us" : max(summary["p99_us"] for summary in latency),
+                    "tmcl_errors" : tmcl_errors,
+                    "cpu_time_s" : cpu_time,
+                    "cpu_percent" : 100.0 * cpu_time / wall_time
+                }
+
+    def run(self, names=None):
+        """Run the configured scenarios (all of them by default), returns the results
+        """
+        scenarios = [s for s in self.benchmark_config["scenarios"] if names == None or s["name"] in names]
+
+        results = {
+                        "timestamp" : datetime.datetime.utcnow().isoformat(),
+                        "simulation" : self.config["mount"]["simulation"],
+                        "scenarios" : {}
+                    }
+
+        for scenario in scenarios:
+            t_start = time.perf_counter()
+            try:
+                result = self.runScenario(scenario)
+                logging.info("Benchmark {}: RMS {:.1f}\" max {:.1f}\" on target after {} s".format(scenario["name"], result["trajectory_error_rms_arcsec"], result["trajectory_error_max_arcsec"], result["time_to_on_target_s"]))
+            except Exception as e:
+                logging.error("Benchmark {} failed: {}".format(scenario["name"], e))
+                result = {"error" : str(e)}
+
+            result["runtime_s"] = time.perf_counter() - t_start
+            results["scenarios"][scenario["name"]] = result
+
+        return results
+
+    @staticmethod
+    def save(results, filename):
+        tmp = filename + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(results, f, indent=4)
+        os.replace(tmp, filename)
+
+    @staticmethod
+    def load(filename):
+        with open(filename, "r") as f:
+            return json.load(f)
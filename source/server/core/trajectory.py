@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+import time
+import numpy as np
+import ephem
+
+
+def hermiteCoefficientArray(y, x):
+    """Cubic Hermite coefficients of every interval of the samples y as an (intervals, 4) array
+
+    Arguments:
+    y -- samples
+    x -- sample spacing in seconds (scalar) or the sample times in seconds (array, increasing)
+
+    Row i holds (a, b, c, d), interval i is a + s * (b + s * (c + s * d)) with s the seconds since
+    its start. The slopes are estimated from the samples themselves.
+    """
+    y = np.asarray(y, dtype=float)
+    m = np.gradient(y, x, edge_order=2)
+    h = np.diff(x) if np.ndim(x) > 0 else x
+
+    p0, p1 = y[:-1], y[1:]
+    m0, m1 = m[:-1], m[1:]
+
+    a = p0
+    b = m0
+    c = (3.0 * (p1 - p0) / h - 2.0 * m0 - m1) / h
+    d = (2.0 * (p0 - p1) / h + m0 + m1) / (h * h)
+
+    return np.column_stack((a, b, c, d))
+
+
+def hermiteCoefficients(y, x):
+    """Cubic Hermite coefficients of every interval of the samples y as a list of (a, b, c, d) tuples
+    """
+    return [tuple(row) for row in hermiteCoefficientArray(y, x).tolist()]
+
+
+class TrajectorySegment():
+    """Immutable piecewise cubic representation of a target trajectory.
+
+    The trajectory is sampled with ephem on a regular grid and every interval between two samples is
+    stored as a cubic Hermite polynomial, with the slopes estimated from the samples themselves.
+    Azimuth and right ascension are unwrapped before fitting so the polynomials never cross the
+    0/360 boundary. Evaluating a sample therefore only costs an index computation and a few
+    multiplications.
+
+    Times are ephem dates (float days), polynomial arguments are seconds since the interval start.
+    """
+
+    def __init__(self, t0, step, az, el, ra, dec):
+        self.t0 = float(t0)
+        self.step = float(step)
+        self.samples = len(az)
+        self.t1 = self.t0 + (self.samples - 1) * self.step / 86400.0
+
+        # store the coefficients as plain python tuples, indexing numpy scalars is much slower
+        self.coefficients = list(zip(*(hermiteCoefficients(y, self.step) for y in (az, el, ra, dec))))
+
+    def contains(self, t):
+        return self.t0 <= t <= self.t1
+
+    def evaluate(self, t):
+        """Evaluate the trajectory at ephem date t.
+
+        Returns a tuple (az, el, ra, dec, az_rate, el_rate, az_acc, el_acc) in degrees, degrees/second
+        and degrees/second^2, azimuth and right ascension are unwrapped (not reduced to 0..360).
+        """
+
+        x = (t - self.t0) * 86400.0
+        index = int(x / self.step)
+
+        if index >= self.samples - 1:
+            index = self.samples - 2
+        elif index < 0:
+            index = 0
+
+        s = x - index * self.step
+        (a0, b0, c0, d0), (a1, b1, c1, d1), (a2, b2, c2, d2), (a3, b3, c3, d3) = self.coefficients[index]
+
+        az = a0 + s * (b0 + s * (c0 + s * d0))
+        el = a1 + s * (b1 + s * (c1 + s * d1))
+        ra = a2 + s * (b2 + s * (c2 + s * d2))
+        dec = a3 + s * (b3 + s * (c3 + s * d3))
+
+        az_rate = b0 + s * (2.0 * c0 + 3.0 * s * d0)
+        el_rate = b1 + s * (2.0 * c1 + 3.0 * s * d1)
+
+        az_acc = 2.0 * c0 + 6.0 * s * d0
+        el_acc = 2.0 * c1 + 6.0 * s * d1
+
+        return az, el, ra, dec, az_rate, el_rate, az_acc, el_acc
+
+
+class TrajectoryCache():
+    """Sliding window trajectory cache for the loaded object.
+
+    The cache keeps one TrajectorySegment covering [now - step, now + window]. As soon as the
+    requested time passes the middle of the current segment, a new segment is generated in a
+    background thread and swapped in atomically, the control loops never wait on ephem.
+    """
+
+    def __init__(self, observer_config, window, step):
+        self.observer_config = observer_config
+        self.window = window
+        self.step = step
+
+        self.body = None
+        self.segment = None
+        self.generation = 0 # incremented on every load, used to drop segments of a previous object
+
+        self.regenerating = False
+        self.regenerations = 0
+        self.last_generation_time = 0.0
+
+        self.mutex = threading.Lock()
+
+    def load(self, body):
+        """Load a new ephem body (or None to clear the cache), the first segment is generated synchronously
+        """
+
+        with self.mutex:
+            self.generation += 1
+            self.body = body.copy() if body != None else None
+            self.segment = None
+
+        if body != None:
+            self.__generate(ephem.now(), self.generation)
+
+    def evaluate(self, t):
+        """Evaluate the cached trajectory at ephem date t, returns None if t is not covered by the cache
+        """
+
+        segment = self.segment
+
+        if segment == None or not segment.contains(t):
+            if self.body != None:
+                self.__scheduleRegeneration(t)
+            return None
+
+        # regenerate ahead of time once we are past the middle of the window
+        if t > segment.t0 + (segment.t1 - segment.t0) / 2.0:
+            self.__scheduleRegeneration(t)
+
+        return segment.evaluate(t)
+
+    def sample(self, body, observer, times):
+        """Compute az, el, ra, dec with ephem for a sequence of ephem dates, azimuth and ra unwrapped in degrees
+        """
+
+        az = np.empty(len(times))
+        el = np.empty(len(times))
+        ra = np.empty(len(times))
+        dec = np.empty(len(times))
+
+        for i, t in enumerate(times):
+            observer.date = t
+            body.compute(observer)
+            az[i] = body.az
+            el[i] = body.alt
+            ra[i] = body.ra
+            dec[i] = body.dec
+
+        return np.degrees(np.unwrap(az)), np.degrees(el), np.degrees(np.unwrap(ra)), np.degrees(dec)
+
+    def getObserver(self):
+        observer = ephem.Observer()
+        observer.lat = self.observer_config["lat"] * ephem.degree
+        observer.lon = self.observer_config["lon"] * ephem.degree
+        observer.elevation = self.observer_config["alt"]
+        return observer
+
+    def __scheduleRegeneration(self, t):
+        with self.mutex:
+            if self.regenerating:
+                return
+            self.regenerating = True
+            generation = self.generation
+
+        threading.Thread(target=self.__generate, args=(t, generation), daemon=True).start()
+
+    def __generate(self, t, generation):
+        try:
+            body = self.body
+            if body == None:
+                return
+
+            # a private copy of the body, ephem bodies are mutated by compute()
+            body = body.copy()
+            t_start = time.perf_counter()
+
+            samples = int(self.window / self.step) + 2
+            t0 = float(t) - self.step / 86400.0
+            times = t0 + np.arange(samples) * self.step / 86400.0
+
+            az, el, ra, dec = self.sample(body, self.getObserver(), times)
+            segment = TrajectorySegment(t0, self.step, az, el, ra, dec)
+
+            with self.mutex:
+                # only publish when no other object was loaded in the meantime
+                if generation == self.generation:
+                    self.segment = segment
+
+            self.regenerations += 1
+            self.last_generation_time = time.perf_counter() - t_start
+            logging.debug("Generated trajectory segment of {} samples in {:.3f} s".format(samples, self.last_generation_time))
+
+        except Exception as e:
+            logging.error("Failed to generate trajectory segment: {}".format(e))
+
+        finally:
+            with self.mutex:
+                self.regenerating = False
+
+    def getStatus(self):
+        segment = self.segment
+        return {
+                    "trajectory_valid" : 1 if segment != None else 0,
+                    "trajectory_regenerations" : self.regenerations,
+                    "trajectory_generation_time" : self.last_generation_time
+                }
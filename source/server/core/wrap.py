@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+
+def unwrapTracks(azimuth):
+    """Unwrap a batch of azimuth tracks in degrees
+
+    Arguments:
+    azimuth -- array (passes, samples) of azimuths in degrees, rows may be padded with NaN at the end
+
+    Returns the continuous azimuth tracks starting in 0..360, padding stays NaN.
+    """
+    azimuth = np.atleast_2d(np.asarray(azimuth, dtype=float))
+    valid = np.isfinite(azimuth)
+
+    # repeat the last valid sample over the padding so the unwrap is not disturbed by NaN
+    index = np.where(valid, np.arange(azimuth.shape[1]), 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    filled = np.take_along_axis(np.nan_to_num(azimuth % 360.0), index, axis=1)
+
+    unwrapped = np.degrees(np.unwrap(np.radians(filled), axis=1))
+    return np.where(valid, unwrapped, np.nan)
+
+
+def planWrap(azimuth, limit_min, limit_max, reference=None, margin=1.0):
+    """Choose the cable wrap of a batch of passes so that no pass crosses an azimuth limit
+
+    Every pass is shifted as a whole by a multiple of 360 degrees. Of the shifts that keep the complete
+    pass within [limit_min + margin, limit_max - margin], the one starting closest to the reference
+    azimuth (the current mount position) is chosen, without a reference the one with the largest
+    distance to the limits.
+
+    Arguments:
+    azimuth -- array (passes, samples) of azimuths in degrees, NaN padded
+    limit_min, limit_max -- azimuth axis limits in degrees
+    reference -- scalar or array (passes,) of mount azimuths to stay close to, optional
+    margin -- clearance to keep from the limits in degrees
+
+    Returns (offsets, start) arrays of shape (passes,): the shift to add to the unwrapped tracks of
+    unwrapTracks() and the resulting start azimuth, both NaN for passes that cannot be tracked
+    without crossing a limit.
+    """
+
+    tracks = unwrapTracks(azimuth)
+    low = np.nanmin(tracks, axis=1)
+    high = np.nanmax(tracks, axis=1)
+    start = tracks[:, 0]
+
+    # all multiples of 360 that can possibly bring a pass within the limits
+    k = np.arange(np.floor((limit_min - 360.0) / 360.0), np.ceil(limit_max / 360.0) + 1)
+    offsets = 360.0 * k[np.newaxis, :]
+
+    feasible = (low[:, np.newaxis] + offsets >= limit_min + margin) & (high[:, np.newaxis] + offsets <= limit_max - margin)
+
+    if reference is not None:
+        reference = np.broadcast_to(np.asarray(reference, dtype=float), start.shape)
+        cost = np.abs(start[:, np.newaxis] + offsets - reference[:, np.newaxis])
+    else:
+        clearance = np.minimum(low[:, np.newaxis] + offsets - limit_min, limit_max - (high[:, np.newaxis] + offsets))
+        cost = -clearance
+
+    cost = np.where(feasible, cost, np.inf)
+    choice = np.argmin(cost, axis=1)
+    possible = np.isfinite(cost[np.arange(len(choice)), choice])
+
+    chosen = np.where(possible, offsets[0, choice], np.nan)
+    return chosen, start + chosen
@@ -38,11 +38,15 @@ tags_metadata = [
     {
         "name": "imager",
         "description": "Imager functions",
-    }				
+    },
+    {
+        "name": "schedule",
+        "description": "Observation scheduling",
+    }
 ]
 
-#Load server
-server = Server(config_file="/opt/config/config.toml")
+#Load server, only when run as the program: worker processes (pointing model fit) import this module again
+server = None
 
 #Load API
 api = FastAPI(openapi_tags=tags_metadata)
@@ -53,6 +57,11 @@ def ping():
     return {"success": True, "response": "pong"}
 
 
+@api.get("/server/timers", tags=["general"])
+def get_timers():
+    return server.getTimerStatus()
+
+
 @api.get("/server/jobs", tags=["general"])
 def get_jobs(jobid: Optional[str] = None):
     if jobid != None:
@@ -98,6 +107,10 @@ def park(t: Optional[str] = None):
 def calibrate(t: Optional[str] = None):
     return add_server_job(function=server.mount.calibrate, args=None, kwargs=None, t=t)
 
+@api.post("/server/mount/calibrate/fit", tags=["mount"])
+def fit_calibration(pattern: Optional[str] = None, activate: bool = True):
+    return server.mount.fitCalibration(pattern, activate)
+
 @api.post("/server/mount/model", tags=["mount"])
 def set_model_parameters(params : List[float]):
     return server.mount.setPointingModel(params)
@@ -135,6 +148,23 @@ def set_pid_offaxisloop(p: float, i: float, d:float, t: Optional[str] = None):
     keyword_arguments = {"p" : p, "i" : i, "d" : d}
     return add_server_job(function=server.mount.setPidOffAxisLoop, args=None, kwargs=keyword_arguments, t=t)
 
+@api.post("/server/mount/feedforward", tags=["mount"])
+def set_feedforward(kv: float, ka: float, t: Optional[str] = None):
+    keyword_arguments = {"kv" : kv, "ka" : ka}
+    return add_server_job(function=server.mount.setFeedforward, args=None, kwargs=keyword_arguments, t=t)
+
+@api.get("/server/mount/latency", tags=["mount"])
+def get_latency():
+    return server.mount.getLatency()
+
+@api.put("/server/mount/latency/reset", tags=["mount"])
+def reset_latency():
+    return server.mount.resetLatency()
+
+@api.put("/server/mount/telemetry/export", tags=["mount"])
+def export_telemetry(start: Optional[str] = None, stop: Optional[str] = None, format: str = "npy"):
+    return server.mount.exportTelemetry(start, stop, format)
+
 @api.get("/server/mount/status", tags=["mount"])
 def get_status():
     desc = "Get mount status"
@@ -252,6 +282,14 @@ def get_bodies():
 def get_stars():
     return server.object.getStars()
 
+@api.get("/server/object/stars/brightest", tags=["object"])
+def get_brightest_stars(az: float, el: float, radius: float = 180.0, min_elevation: float = 30.0, n: int = 5):
+    return server.object.getBrightestStars(az, el, radius, min_elevation, n)
+
+@api.get("/server/object/stars/nearest", tags=["object"])
+def get_nearest_star(az: Optional[float] = None, el: Optional[float] = None, min_elevation: float = 0.0):
+    return server.object.getNearestStar(az, el, min_elevation)
+
 @api.post("/server/object/body", tags=["object"])
 def set_body(name : str):
     return server.object.setBody(name)
@@ -260,6 +298,60 @@ def set_body(name : str):
 def set_star(name : str):
     return server.object.setStar(name)
 
+@api.post("/server/object/catalog/select", tags=["object"])
+def set_catalog_object(norad : int, t: Optional[str] = None):
+    keyword_arguments = {"norad" : norad}
+    return add_server_job(function=server.object.setCatalogObject, args=None, kwargs=keyword_arguments, t=t)
+
+@api.post("/server/object/catalog/ingest", tags=["object"])
+def ingest_catalog(filename: Optional[str] = None):
+    return server.object.ingestCatalog(filename)
+
+@api.get("/server/object/catalog", tags=["object"])
+def get_catalog_status():
+    return server.object.getCatalogStatus()
+
+@api.get("/server/object/catalog/benchmark", tags=["object"])
+def benchmark_catalog(filename: Optional[str] = None):
+    return server.object.benchmarkCatalog(filename)
+
+@api.post("/server/object/table/begin", tags=["object"])
+def begin_table(name: str, frame: str = "azel"):
+    return server.object.beginTable(name, frame)
+
+@api.post("/server/object/table/chunk", tags=["object"])
+def append_table(rows: List[List[float]]):
+    return server.object.appendTable(rows)
+
+@api.post("/server/object/table/commit", tags=["object"])
+def commit_table(select: bool = True, t: Optional[str] = None):
+    keyword_arguments = {"select" : select}
+    return add_server_job(function=server.object.commitTable, args=None, kwargs=keyword_arguments, t=t)
+
+@api.get("/server/object/table", tags=["object"])
+def get_table_status():
+    return server.object.getTableStatus()
+
+@api.get("/server/object/passes", tags=["object"])
+def get_passes(start: Optional[str] = None, hours: float = 12.0, min_elevation: float = 10.0):
+    return server.object.getPasses(start, hours, min_elevation)
+
+@api.get("/server/object/passes/wrap", tags=["object"])
+def get_pass_wraps(start: Optional[str] = None, hours: float = 12.0, min_elevation: float = 10.0):
+    return server.object.planPassWraps(start, hours, min_elevation)
+
+@api.get("/server/object/trajectory/validate", tags=["object"])
+def validate_trajectory(samples: int = 100):
+    return server.object.validateTrajectory(samples)
+
+@api.post("/server/schedule", tags=["schedule"])
+def schedule_observations(candidates: List[dict]):
+    return server.observation_scheduler.schedule(candidates)
+
+@api.post("/server/schedule/passes", tags=["schedule"])
+def schedule_passes(start: Optional[str] = None, hours: float = 12.0, min_elevation: float = 10.0, priority: float = 1.0):
+    return server.observation_scheduler.schedulePasses(start, hours, min_elevation, priority)
+
 def add_server_job(function, args, kwargs, t):			
 
     try:
@@ -306,6 +398,7 @@ def custom_openapi():
 
 if __name__ == '__main__':
 
+    server = Server(config_file="/opt/config/config.toml")
 
     ui = SchedulerUI(server.scheduler)
 
@@ -12,6 +12,8 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from core.camera import Camera, CameraType
 from core.mount import Mount
 from core.object import Object
+from core.schedule import ObservationScheduler
+from core import timer
 from telegraf.client import TelegrafClient
 
 
@@ -43,7 +45,14 @@ class Server(object):
 
         self.mount = Mount(self, config=self.config["mount"], logging_level=logging.DEBUG)
 
- 
+        self.observation_scheduler = ObservationScheduler(self, config=self.config["scheduler"])
+
+
+    def getTimerStatus(self):
+        """Timing statistics of all periodic tasks
+        """
+        return timer.scheduler.getStatus()
+
     def shutdown(self):
         self.guider.stop()
         #self.imager.stop()